@@ -1,9 +1,15 @@
 from art import tprint
 from transcribers.FirstShot import First_Shot
 from transcribers.SecondShot import Second_Shot
+from helpers.bedrock_client import configure_bedrock_client
 from helpers.cost_analysis import cost_tracker
+from helpers.response_cache import configure_response_cache
+from helpers.batch_inference import BedrockBatchJobRunner
+from helpers.downloader import Downloader, save_url_map
+from helpers.dedup import DEFAULT_PERCEPTUAL_DISTANCE, MAX_PERCEPTUAL_DISTANCE
+from helpers.image_prep import configure_image_format, configure_prepared_image_cache, IMAGE_FORMATS, default_preprocess_workers
 from helpers.txt_to_csv import convert_json_to_csv
-from helpers.segmentation import process_images_segmentation, get_segmentation_settings
+from helpers.segmentation import process_images_segmentation, stream_segmentation, get_segmentation_settings
 from Validation.validate_scientific_names import validate_csv_scientific_names
 from Validation.find_duplicate_records import validate_csv_duplicate_records
 from Validation.find_duplicate_entries import validate_csv_entries
@@ -11,8 +17,6 @@ import os
 import re
 import stat
 from pathlib import Path
-import requests
-from urllib.parse import urlparse
 import shutil
 from datetime import datetime
 import json
@@ -28,6 +32,31 @@ validation_settings = {
     # 'collection_data': True,
 }
 
+# Global performance settings
+DEFAULT_PERFORMANCE_SETTINGS = {
+    'first_shot_workers': 8,  # Bedrock calls in flight during the first shot
+    'second_shot_workers': 4,  # Verification prompts are longer, so keep this lower
+    'pipeline_dual_shot': True,  # Two shots: verify each image as soon as its first shot lands
+    'use_response_cache': True,  # Reuse saved responses for identical image/prompt/model requests
+    'response_cache_mb': 512,  # Least recently used responses are evicted past this size
+    'cache_verification': False,  # Second shot: also reuse cached verifications (sampled, so re-runs would repeat them)
+    'prompt_caching': False,  # Cache the static prompt with Bedrock cache points (supported models)
+    'images_per_request': 1,  # First shot: pack this many images into one request (1 = off)
+    'batch_inference': False,  # First shot: run as a Bedrock Batch Inference job (overnight runs)
+    'batch_s3_uri': '',  # S3 location for batch job input/output
+    'batch_role_arn': '',  # IAM role Bedrock assumes to read/write batch_s3_uri
+    'image_format': 'png',  # Format images are sent in: png (lossless), jpeg or webp (much smaller)
+    'image_quality': 90,  # JPEG/WebP quality (1-100)
+    'prepared_image_cache_mb': 256,  # Prepared images kept in memory for Second Shot to reuse (0 = off)
+    'preprocess_workers': default_preprocess_workers(),  # First shot: processes preparing images ahead of the calls (0 = inline)
+    'download_workers': 16,  # URL lists: downloads in flight at once
+    'downloads_per_host': 8,  # URL lists: downloads in flight against a single server
+    'stream_downloads': True,  # URL lists: transcribe each image as soon as it downloads
+    'dedup_images': True,  # Transcribe identical image files once and copy the result to the others
+    'dedup_perceptual_distance': None,  # Also match near-identical images within this many dHash bits (None = off)
+}
+performance_settings = dict(DEFAULT_PERFORMANCE_SETTINGS)
+
 
 def configure_validation_settings():
     global validation_settings
@@ -104,6 +133,268 @@ def configure_validation_settings():
     return validation_settings
 
 
+def _prompt_worker_count(label, current):
+    while True:
+        value = input(f"Enter {label} (1-64, currently {current}): ").strip()
+        try:
+            count = int(value)
+            if 1 <= count <= 64:
+                return count
+        except ValueError:
+            pass
+        print("Please enter a whole number between 1 and 64")
+
+
+def configure_performance_settings():
+    global performance_settings
+    
+    print("\n" + "="*60)
+    print("PERFORMANCE SETTINGS")
+    print("="*60)
+    print("Configure how many Bedrock requests run at the same time.")
+    print("Higher values finish large runs faster but use more of your account quota.")
+    print("Use numbers to change settings, 'r' to reset all to default, 'q' to finish.")
+    print("-"*60)
+    
+    while True:
+        print("\nCurrent Performance Settings:")
+        print("1. First Shot concurrent requests:", performance_settings['first_shot_workers'])
+        print("2. Second Shot concurrent requests:", performance_settings['second_shot_workers'])
+        print("3. Pipelined Two Shot mode:", "✓ ENABLED" if performance_settings['pipeline_dual_shot'] else "✗ DISABLED")
+        print("4. Response cache:", "✓ ENABLED" if performance_settings['use_response_cache'] else "✗ DISABLED (bypassed)")
+        print("5. Response cache size limit (MB):", performance_settings['response_cache_mb'])
+        print("6. Bedrock prompt caching:", "✓ ENABLED" if performance_settings['prompt_caching'] else "✗ DISABLED")
+        print("7. First Shot images per request:", performance_settings['images_per_request'])
+        print("8. First Shot batch inference jobs:", "✓ ENABLED" if performance_settings['batch_inference'] else "✗ DISABLED")
+        if performance_settings['batch_inference']:
+            print("   S3 location:", performance_settings['batch_s3_uri'])
+            print("   Service role:", performance_settings['batch_role_arn'])
+        image_format = performance_settings['image_format'].upper()
+        if performance_settings['image_format'] != 'png':
+            image_format += f" (quality {performance_settings['image_quality']})"
+        print("9. Image format sent to Bedrock:", image_format)
+        print("10. Prepared image cache size (MB):", performance_settings['prepared_image_cache_mb'])
+        print("11. Image preprocessing processes:", performance_settings['preprocess_workers'] or "0 (inline)")
+        print("12. URL downloads at once:", performance_settings['download_workers'],
+              f"(up to {performance_settings['downloads_per_host']} per server)")
+        print("13. Stream URL downloads into transcription:", "✓ ENABLED" if performance_settings['stream_downloads'] else "✗ DISABLED")
+        if not performance_settings['dedup_images']:
+            dedup_status = "✗ DISABLED"
+        elif performance_settings['dedup_perceptual_distance'] is None:
+            dedup_status = "✓ ENABLED (identical files)"
+        else:
+            dedup_status = f"✓ ENABLED (identical files and similar images, distance {performance_settings['dedup_perceptual_distance']})"
+        print("14. Duplicate image detection:", dedup_status)
+        print("15. Reuse cached Second Shot verifications:", "✓ ENABLED" if performance_settings['cache_verification'] else "✗ DISABLED (fresh sample each run)")
+        
+        print("\nOptions:")
+        print("1 - Change First Shot concurrent requests")
+        print("2 - Change Second Shot concurrent requests")
+        print("3 - Toggle Pipelined Two Shot mode")
+        print("4 - Toggle Response cache")
+        print("5 - Change Response cache size limit")
+        print("6 - Toggle Bedrock prompt caching")
+        print("7 - Change First Shot images per request (for small segmented labels)")
+        print("8 - Toggle First Shot batch inference jobs (cheaper, results arrive hours later)")
+        print("9 - Change image format sent to Bedrock (JPEG/WebP upload faster than PNG)")
+        print("10 - Change prepared image cache size (lets Second Shot reuse First Shot's images)")
+        print("11 - Change image preprocessing processes (decode/resize images ahead of the requests)")
+        print("12 - Change URL download concurrency")
+        print("13 - Toggle streaming URL downloads (start transcribing before the download finishes)")
+        print("14 - Change duplicate image detection (transcribe repeated images once)")
+        print("15 - Toggle reusing cached Second Shot verifications (cheaper re-runs, but the same sample every time)")
+        print("r - Reset all to default")
+        print("q - Finish and return to main menu")
+        print("back - Return to main menu")
+        
+        choice = input("\nEnter your choice: ").strip().lower()
+        
+        if choice == '1':
+            performance_settings['first_shot_workers'] = _prompt_worker_count(
+                "First Shot concurrent requests", performance_settings['first_shot_workers'])
+            print(f"First Shot will run {performance_settings['first_shot_workers']} requests at a time")
+            
+        elif choice == '2':
+            performance_settings['second_shot_workers'] = _prompt_worker_count(
+                "Second Shot concurrent requests", performance_settings['second_shot_workers'])
+            print(f"Second Shot will run {performance_settings['second_shot_workers']} requests at a time")
+            
+        elif choice == '3':
+            performance_settings['pipeline_dual_shot'] = not performance_settings['pipeline_dual_shot']
+            status = "enabled" if performance_settings['pipeline_dual_shot'] else "disabled"
+            print(f"Pipelined Two Shot mode {status}")
+            
+        elif choice == '4':
+            performance_settings['use_response_cache'] = not performance_settings['use_response_cache']
+            status = "enabled" if performance_settings['use_response_cache'] else "disabled (every image is sent to Bedrock)"
+            print(f"Response cache {status}")
+            
+        elif choice == '5':
+            while True:
+                value = input(f"Enter cache size limit in MB (currently {performance_settings['response_cache_mb']}): ").strip()
+                try:
+                    size_mb = int(value)
+                    if size_mb >= 1:
+                        performance_settings['response_cache_mb'] = size_mb
+                        break
+                except ValueError:
+                    pass
+                print("Please enter a whole number of at least 1")
+            print(f"Response cache limited to {performance_settings['response_cache_mb']} MB")
+            
+        elif choice == '6':
+            performance_settings['prompt_caching'] = not performance_settings['prompt_caching']
+            status = "enabled" if performance_settings['prompt_caching'] else "disabled"
+            print(f"Bedrock prompt caching {status}")
+            
+        elif choice == '7':
+            while True:
+                value = input(f"Enter images per request (1-{First_Shot.MAX_IMAGES_PER_REQUEST}, currently {performance_settings['images_per_request']}): ").strip()
+                try:
+                    count = int(value)
+                    if 1 <= count <= First_Shot.MAX_IMAGES_PER_REQUEST:
+                        performance_settings['images_per_request'] = count
+                        break
+                except ValueError:
+                    pass
+                print(f"Please enter a whole number between 1 and {First_Shot.MAX_IMAGES_PER_REQUEST}")
+            print(f"First Shot will send {performance_settings['images_per_request']} image(s) per request")
+            
+        elif choice == '8':
+            if performance_settings['batch_inference']:
+                performance_settings['batch_inference'] = False
+                print("First Shot batch inference jobs disabled")
+                continue
+            s3_uri = input(f"Enter S3 location for job files (e.g. s3://my-bucket/transcriber) [{performance_settings['batch_s3_uri']}]: ").strip()
+            s3_uri = s3_uri or performance_settings['batch_s3_uri']
+            role_arn = input(f"Enter IAM service role ARN for Bedrock batch jobs [{performance_settings['batch_role_arn']}]: ").strip()
+            role_arn = role_arn or performance_settings['batch_role_arn']
+            if not s3_uri.startswith("s3://") or not role_arn.startswith("arn:"):
+                print("Batch inference needs an s3:// location and a role ARN, leaving it disabled")
+                continue
+            performance_settings['batch_s3_uri'] = s3_uri
+            performance_settings['batch_role_arn'] = role_arn
+            performance_settings['batch_inference'] = True
+            print("First Shot batch inference jobs enabled")
+            
+        elif choice == '9':
+            while True:
+                value = input(f"Enter image format ({', '.join(IMAGE_FORMATS)}, currently {performance_settings['image_format']}): ").strip().lower()
+                value = {'jpg': 'jpeg'}.get(value, value)
+                if value in IMAGE_FORMATS:
+                    performance_settings['image_format'] = value
+                    break
+                print(f"Please enter one of: {', '.join(IMAGE_FORMATS)}")
+            if performance_settings['image_format'] != 'png':
+                while True:
+                    value = input(f"Enter quality (1-100, currently {performance_settings['image_quality']}): ").strip()
+                    if not value:
+                        break
+                    try:
+                        quality = int(value)
+                        if 1 <= quality <= 100:
+                            performance_settings['image_quality'] = quality
+                            break
+                    except ValueError:
+                        pass
+                    print("Please enter a whole number between 1 and 100")
+            print(f"Images will be sent as {performance_settings['image_format'].upper()}")
+            
+        elif choice == '10':
+            while True:
+                value = input(f"Enter prepared image cache size in MB (0 to turn off, currently {performance_settings['prepared_image_cache_mb']}): ").strip()
+                try:
+                    size_mb = int(value)
+                    if size_mb >= 0:
+                        performance_settings['prepared_image_cache_mb'] = size_mb
+                        break
+                except ValueError:
+                    pass
+                print("Please enter a whole number of at least 0")
+            print(f"Prepared image cache limited to {performance_settings['prepared_image_cache_mb']} MB")
+            
+        elif choice == '11':
+            while True:
+                value = input(f"Enter image preprocessing processes (0-64, 0 to prepare inline, currently {performance_settings['preprocess_workers']}): ").strip()
+                try:
+                    count = int(value)
+                    if 0 <= count <= 64:
+                        performance_settings['preprocess_workers'] = count
+                        break
+                except ValueError:
+                    pass
+                print("Please enter a whole number between 0 and 64")
+            if performance_settings['preprocess_workers']:
+                print(f"First Shot will prepare images in {performance_settings['preprocess_workers']} process(es)")
+            else:
+                print("First Shot will prepare each image as it is sent")
+            
+        elif choice == '12':
+            performance_settings['download_workers'] = _prompt_worker_count(
+                "URL downloads at once", performance_settings['download_workers'])
+            performance_settings['downloads_per_host'] = min(
+                _prompt_worker_count("URL downloads at once per server", performance_settings['downloads_per_host']),
+                performance_settings['download_workers'])
+            print(f"Up to {performance_settings['download_workers']} images will download at once, "
+                  f"{performance_settings['downloads_per_host']} per server")
+            
+        elif choice == '13':
+            performance_settings['stream_downloads'] = not performance_settings['stream_downloads']
+            status = "enabled" if performance_settings['stream_downloads'] else "disabled (the whole list downloads first)"
+            print(f"Streaming URL downloads {status}")
+            if performance_settings['stream_downloads'] and performance_settings['batch_inference']:
+                print("Note: batch inference jobs need every image upfront, so URL lists are downloaded first while batch inference is on")
+            
+        elif choice == '14':
+            while True:
+                value = input("Duplicate detection: 1 = off, 2 = identical files, 3 = identical and similar images: ").strip()
+                if value in ['1', '2', '3']:
+                    break
+                print("Please enter 1, 2 or 3")
+            performance_settings['dedup_images'] = value != '1'
+            performance_settings['dedup_perceptual_distance'] = None
+            if value == '3':
+                default = DEFAULT_PERCEPTUAL_DISTANCE
+                while True:
+                    distance = input(f"Enter the largest perceptual hash distance counted as a duplicate "
+                                     f"(0-{MAX_PERCEPTUAL_DISTANCE}, lower is stricter, default {default}): ").strip()
+                    if not distance:
+                        performance_settings['dedup_perceptual_distance'] = default
+                        break
+                    try:
+                        distance = int(distance)
+                        if 0 <= distance <= MAX_PERCEPTUAL_DISTANCE:
+                            performance_settings['dedup_perceptual_distance'] = distance
+                            break
+                    except ValueError:
+                        pass
+                    print(f"Please enter a whole number between 0 and {MAX_PERCEPTUAL_DISTANCE}")
+            if not performance_settings['dedup_images']:
+                print("Every image will be transcribed")
+            else:
+                print("Repeated images will be transcribed once and the result copied to each copy")
+            
+        elif choice == '15':
+            performance_settings['cache_verification'] = not performance_settings['cache_verification']
+            if performance_settings['cache_verification']:
+                print("Second Shot will reuse cached verifications (needs the response cache)")
+            else:
+                print("Second Shot will verify every image afresh")
+            
+        elif choice == 'r' or choice == 'reset':
+            performance_settings = dict(DEFAULT_PERFORMANCE_SETTINGS)
+            print("All performance settings reset to default")
+            
+        elif choice == 'q' or choice == 'quit' or choice == 'back':
+            break
+            
+        else:
+            print("Invalid choice. Please enter 1-15, 'r', 'q', or 'back'")
+    
+    print("\nPerformance settings saved!")
+    return performance_settings
+
+
 #Determine how many shots to do
 def select_shots():
     while True:
@@ -181,46 +472,23 @@ def download_images_from_urls(url_file_path, download_dir):
         print(f"Error: URL file not found at {url_file_path}")
         return False
     
-    # Clear existing images using safe removal
-    if os.path.exists(download_dir):
-        safe_rmtree(download_dir)
-    
+    # Images already downloaded by an earlier (possibly interrupted) run are kept,
+    # so a resumed run only fetches the missing ones
     os.makedirs(download_dir, exist_ok=True)
     
     with open(url_file_path, 'r', encoding='utf-8') as f:
         urls = [line.strip() for line in f if line.strip()]
     
     print(f"\nDownloading {len(urls)} images...")
-    url_map = {}
-    for i, url in enumerate(urls, 1):
-        try:
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            
-            # Get original filename and add index prefix
-            original_filename = os.path.basename(urlparse(url).path) or f"image_{i}.jpg"
-            filename = f"{i:04d}_{original_filename}"
-            filepath = os.path.join(download_dir, filename)
-            
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
-            # Track mapping of saved filename to original URL
-            url_map[filename] = url
-            
-            print(f"Downloaded {i}/{len(urls)}: {filename}")
-        except Exception as e:
-            print(f"Failed to download {url}: {e}")
+    downloader = Downloader(download_dir,
+                            max_workers=performance_settings['download_workers'],
+                            per_host=performance_settings['downloads_per_host'])
+    downloaded = downloader.download_all(urls)
+    if len(downloaded) < len(urls):
+        print(f"{len(urls) - len(downloaded)} of {len(urls)} images could not be downloaded")
     
-    # Save URL map for later enrichment of JSON/CSV
-    try:
-        map_path = os.path.join(download_dir, 'url_map.json')
-        with open(map_path, 'w', encoding='utf-8') as mf:
-            json.dump(url_map, mf, indent=2, ensure_ascii=False)
-        print(f"Saved URL map to {map_path}")
-    except Exception as e:
-        print(f"Warning: Could not save URL map: {e}")
+    # Save URL map for later enrichment of JSON/CSV, merged into the one from earlier runs
+    save_url_map(download_dir, downloaded)
     
     return True
 
@@ -325,19 +593,81 @@ def show_images_in_folder(folder_path):
         print(f"{i:3d}. {img}")
 
 #Local or URL Images entering 
+def run_first_shot(processing_folder, url_stream, prompt_path, output_dir, run_name, model_id, skip_images, batch_runner,
+                   on_result=None):
+    """Run the first shot over processing_folder, or over a URL list as it downloads if url_stream is set"""
+    if url_stream is not None:
+        items, total = url_stream()
+        First_Shot.process_image_stream(items, prompt_path, output_dir, run_name, model_id=model_id,
+                                        skip_images=skip_images,
+                                        max_workers=performance_settings['first_shot_workers'],
+                                        on_result=on_result,
+                                        prompt_caching=performance_settings['prompt_caching'],
+                                        total=total,
+                                        dedup=performance_settings['dedup_images'],
+                                        perceptual_distance=performance_settings['dedup_perceptual_distance'],
+                                        images_per_request=performance_settings['images_per_request'],
+                                        preprocess_workers=performance_settings['preprocess_workers'])
+        return
+    First_Shot.process_images(processing_folder, prompt_path, output_dir, run_name, model_id=model_id,
+                              skip_images=skip_images,
+                              max_workers=performance_settings['first_shot_workers'],
+                              on_result=on_result,
+                              prompt_caching=performance_settings['prompt_caching'],
+                              images_per_request=performance_settings['images_per_request'],
+                              batch_runner=batch_runner,
+                              preprocess_workers=performance_settings['preprocess_workers'],
+                              dedup=performance_settings['dedup_images'],
+                              perceptual_distance=performance_settings['dedup_perceptual_distance'])
+
+
+def streams_downloads():
+    """True if URL lists are downloaded while transcribing rather than upfront"""
+    # Batch inference jobs need every image before the job is submitted
+    return performance_settings['stream_downloads'] and not performance_settings['batch_inference']
+
+
+def stream_url_images(url_file, download_dir, segmentation=None):
+    """Start downloading a URL list; returns (items, image count)
+    
+    items yields (index, image path, url) as each image is ready for
+    transcription. With segmentation=(output folder, model path, classes), each
+    downloaded image is segmented first and the segmented image is yielded.
+    """
+    with open(url_file, 'r', encoding='utf-8') as f:
+        urls = [line.strip() for line in f if line.strip()]
+    
+    print(f"\nDownloading {len(urls)} images, transcribing each as soon as it arrives...")
+    downloader = Downloader(download_dir,
+                            max_workers=performance_settings['download_workers'],
+                            per_host=performance_settings['downloads_per_host'])
+    items = downloader.stream(urls)
+    if segmentation is not None:
+        output_folder, model_path, classes_to_render = segmentation
+        items = stream_segmentation(items, output_folder, model_path, classes_to_render)
+    return items, len(urls)
+
+
 def get_images_folder(use_urls):
     while True:
         #User chooses URLS
         if use_urls:
             url_file = input("\nEnter path to .txt file containing image URLs (or 'back' to go back): ")
             if url_file.lower() == 'back':
-                return 'back', None
+                return 'back', None, None
             # Use cross-platform path for downloads within temp area
             downloads_dir = get_output_base_path() / "temp_downloads"
             download_dir = str(downloads_dir)
             
+            if streams_downloads():
+                # Downloaded during the run, as transcription goes
+                if os.path.exists(url_file):
+                    return download_dir, "downloaded_images", url_file
+                print(f"Error: URL file not found at {url_file}")
+                continue
+            
             if download_images_from_urls(url_file, download_dir):
-                return download_dir, "downloaded_images"
+                return download_dir, "downloaded_images", None
             else:
                 print("Failed to download images. Please try again.")
                 continue
@@ -345,7 +675,7 @@ def get_images_folder(use_urls):
             #User chooses Local images on Machine
             folder_path = input("\nEnter path to local images folder (or 'back' to go back): ")
             if folder_path.lower() == 'back':
-                return 'back', None
+                return 'back', None, None
             if not os.path.exists(folder_path):
                 print(f"Error: Folder not found at {folder_path}")
                 continue
@@ -361,7 +691,7 @@ def get_images_folder(use_urls):
                 else:
                     print("Please enter 'y' or 'n'")
             
-            return folder_path, os.path.basename(folder_path)
+            return folder_path, os.path.basename(folder_path), None
 
 
 def rename_csv_files(source_dir, run_name, shot_type):
@@ -453,12 +783,13 @@ def configure_transcription():
             step = 'images_folder'
             
         elif step == 'images_folder':
-            base_folder, folder_name = get_images_folder(config['use_urls'])
+            base_folder, folder_name, url_file = get_images_folder(config['use_urls'])
             if base_folder == 'back':
                 step = 'image_source'
                 continue
             config['base_folder'] = base_folder
             config['folder_name'] = folder_name
+            config['url_file'] = url_file
             break
     
     return config
@@ -526,9 +857,10 @@ def main():
         print("1. Start New Transcription Process")
         print("2. Resume Incomplete Run")
         print("3. Configure Validation Settings")
-        print("4. Exit")
+        print("4. Configure Performance Settings")
+        print("5. Exit")
         
-        choice = input("\nEnter your choice (1-4): ").strip()
+        choice = input("\nEnter your choice (1-5): ").strip()
         
         if choice == '1':
             # Configure transcription 
@@ -549,11 +881,15 @@ def main():
             continue  # Return to main menu
             
         elif choice == '4':
+            configure_performance_settings()
+            continue  # Return to main menu
+            
+        elif choice == '5':
             print("Goodbye!")
             return
             
         else:
-            print("Invalid choice. Please enter 1, 2, 3, or 4.")
+            print("Invalid choice. Please enter 1, 2, 3, 4, or 5.")
     
     # Continue with transcription process
     is_resume = config.get('resume', False)
@@ -570,6 +906,7 @@ def main():
         prompt_path = saved_state['prompt_path']
         base_folder = saved_state['base_folder']
         folder_name = saved_state.get('folder_name', run_name)
+        url_file = saved_state.get('url_file')
         
         print(f"\nResuming run from: {run_output_dir}")
         print(f"Current step: {saved_state.get('current_step')}")
@@ -582,6 +919,7 @@ def main():
         prompt_path = config['prompt_path']
         base_folder = config['base_folder']
         folder_name = config['folder_name']
+        url_file = config.get('url_file')
         
         # Create run-specific output directory
         run_output_dir = get_output_base_path() / run_name
@@ -597,10 +935,19 @@ def main():
             'prompt_path': prompt_path,
             'base_folder': base_folder,
             'folder_name': folder_name,
+            'url_file': url_file,
             'current_step': 'starting'
         }
         save_run_state(run_output_dir, initial_state)
     
+    # A streamed URL list is downloaded as the first shot runs (see stream_url_images).
+    # If streaming has been turned off since the run started, download it all now;
+    # images that were already downloaded are kept.
+    if url_file and not streams_downloads():
+        download_images_from_urls(url_file, base_folder)
+        url_file = None
+    segmentation = None
+    
     # Handle segmentation if requested
     processing_folder = base_folder  # Default to original folder
     
@@ -608,8 +955,15 @@ def main():
         # Create segmentation output folder
         segmentation_output_dir = run_output_dir / "Segmented_Images"
         
+        if url_file:
+            # Each image is segmented as soon as it downloads
+            segmentation_output_dir.mkdir(parents=True, exist_ok=True)
+            model_path, classes_to_render = get_segmentation_settings()
+            segmentation = (str(segmentation_output_dir), model_path, classes_to_render)
+            processing_folder = str(segmentation_output_dir)
+        
         # Check if segmentation was already completed
-        if is_resume and segmentation_output_dir.exists() and any(segmentation_output_dir.glob('*')):
+        elif is_resume and segmentation_output_dir.exists() and any(segmentation_output_dir.glob('*')):
             print(f"\nSegmentation already completed, using existing segmented images from: {segmentation_output_dir}")
             processing_folder = str(segmentation_output_dir)
         else:
@@ -657,6 +1011,38 @@ def main():
     # Set the prompt path in the cost tracker
     cost_tracker.set_prompt_path(prompt_path)
     
+    # Size the shared Bedrock connection pool for the configured concurrency
+    # (in pipelined two shot mode both stages are in flight at once)
+    if num_shots == 2 and performance_settings['pipeline_dual_shot']:
+        max_in_flight = performance_settings['first_shot_workers'] + performance_settings['second_shot_workers']
+    else:
+        max_in_flight = max(performance_settings['first_shot_workers'], performance_settings['second_shot_workers'])
+    configure_bedrock_client(max_in_flight)
+    
+    # Responses are cached next to the runs so re-running a folder is cheap
+    configure_response_cache(
+        enabled=performance_settings['use_response_cache'],
+        max_bytes=performance_settings['response_cache_mb'] * 1024 * 1024,
+        cache_dir=get_output_base_path() / ".response_cache",
+        cache_sampled=performance_settings['cache_verification']
+    )
+    
+    # Format and quality of the images sent with each request
+    configure_image_format(performance_settings['image_format'], performance_settings['image_quality'])
+    
+    # Second Shot reuses the images First Shot prepared during this run
+    configure_prepared_image_cache(performance_settings['prepared_image_cache_mb'] * 1024 * 1024)
+    
+    # First shot can run as a Bedrock Batch Inference job instead of on-demand calls
+    batch_runner = None
+    if performance_settings['batch_inference']:
+        batch_runner = BedrockBatchJobRunner(performance_settings['batch_s3_uri'], performance_settings['batch_role_arn'])
+    
+    # Streamed URL lists start downloading when the first shot starts
+    url_stream = None
+    if url_file:
+        url_stream = lambda: stream_url_images(url_file, base_folder, segmentation)
+    
     try:
         if num_shots == 1:
             # Update state
@@ -697,7 +1083,8 @@ def main():
                 if processed_images:
                     print(f"\nResuming: Found {len(processed_images)} already processed images. Skipping those...")
             
-            First_Shot.process_images(processing_folder, prompt_path, output_dir, run_name, model_id=model, skip_images=processed_images)
+            run_first_shot(processing_folder, url_stream, prompt_path, output_dir, run_name, model,
+                           processed_images, batch_runner)
             
             # Convert JSON files to CSV
             print("\n=== Converting JSON files to CSV ===")
@@ -786,6 +1173,26 @@ def main():
                 state['model_second_shot'] = model2
                 save_run_state(run_output_dir, state)
             
+            # Get images already verified if resuming
+            second_processed_images = set()
+            if is_resume:
+                # Check for existing JSON files to skip
+                for json_file in temp_second_dir.glob('*.json'):
+                    if 'batch' not in json_file.name:
+                        try:
+                            with open(json_file, 'r', encoding='utf-8') as f:
+                                data = json.load(f)
+                                if 'image_name' in data:
+                                    second_processed_images.add(data['image_name'])
+                        except:
+                            pass
+                
+                if second_processed_images:
+                    print(f"\nResuming: Found {len(second_processed_images)} already processed images in second shot. Skipping those...")
+            
+            # Pipelined mode verifies each image as soon as its first shot lands
+            pipelined = performance_settings['pipeline_dual_shot'] and not first_shot_complete
+            
             # Run first shot if not already complete
             if not first_shot_complete:
                 # Update state
@@ -812,11 +1219,26 @@ def main():
                     if processed_images:
                         print(f"\nResuming: Found {len(processed_images)} already processed images in first shot. Skipping those...")
                 
-                First_Shot.process_images(processing_folder, 
-                              prompt_path, temp_first_dir, 
-                              run_name, 
-                              model_id=model1,
-                              skip_images=processed_images)
+                verification_pipeline = None
+                if pipelined:
+                    print("Pipelined mode: each image is verified as soon as its first pass finishes")
+                    verification_pipeline = Second_Shot.VerificationPipeline(
+                        processing_folder,
+                        temp_second_dir,
+                        run_name,
+                        model_id=model2,
+                        skip_images=second_processed_images,
+                        max_workers=performance_settings['second_shot_workers']
+                    )
+                
+                try:
+                    run_first_shot(processing_folder, url_stream, prompt_path, temp_first_dir, run_name, model1,
+                                   processed_images, batch_runner,
+                                   on_result=verification_pipeline.submit if verification_pipeline else None)
+                finally:
+                    # Wait for in-flight verifications and write the second shot batch file
+                    if verification_pipeline:
+                        verification_pipeline.finish()
             if not first_shot_complete:
                 print("\n=== Converting First Pass JSON files to CSV ===")
                 convert_json_to_csv(str(temp_first_dir))
@@ -836,35 +1258,21 @@ def main():
             save_run_state(run_output_dir, state)
             
             # Run second shot with the JSON file from first shot
-            print("\n=== Running Second Pass using First Pass Results ===")
-            
-            # Get already processed images if resuming
-            processed_images = set()
-            if is_resume:
-                # Check for existing JSON files to skip
-                for json_file in temp_second_dir.glob('*.json'):
-                    if 'batch' not in json_file.name:
-                        try:
-                            with open(json_file, 'r', encoding='utf-8') as f:
-                                data = json.load(f)
-                                if 'image_name' in data:
-                                    processed_images.add(data['image_name'])
-                        except:
-                            pass
+            # (already done alongside the first shot in pipelined mode)
+            if not pipelined:
+                print("\n=== Running Second Pass using First Pass Results ===")
                 
-                if processed_images:
-                    print(f"\nResuming: Found {len(processed_images)} already processed images in second shot. Skipping those...")
-            
-            # Process second shot using first shot results
-            Second_Shot.process_with_first_shot(
-            processing_folder, 
-            prompt_path, 
-            batch_json_path, 
-            temp_second_dir, 
-            run_name, 
-            model_id=model2,
-            skip_images=processed_images
-            )
+                # Process second shot using first shot results
+                Second_Shot.process_with_first_shot(
+                processing_folder, 
+                prompt_path, 
+                batch_json_path, 
+                temp_second_dir, 
+                run_name, 
+                model_id=model2,
+                skip_images=second_processed_images,
+                max_workers=performance_settings['second_shot_workers']
+                )
             
             # Convert second shot JSON files to CSV
             print("\n=== Converting Second Pass JSON files to CSV ===")
@@ -0,0 +1,117 @@
+"""Benchmark image preparation: two-pass PNG path vs helpers.image_prep.prepare_image
+
+The old path (First Shot's convert_to_png then standardize_image, copied
+below) decodes the scan, encodes a full-resolution PNG, decodes that PNG again
+and encodes the resized PNG. prepare_image() decodes once and encodes once.
+Both must produce the same bytes.
+
+Usage:
+    python benchmarks/bench_image_prep.py                     # sample image + synthetic 40 MP scan
+    python benchmarks/bench_image_prep.py --folder path/to/images --repeat 3
+"""
+import argparse
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from helpers.image_prep import prepare_image as _prepare_image
+
+SAMPLE_IMAGE = Path(__file__).resolve().parents[2] / "Legacy" / "0097_C0036672F_segmentation.jpg"
+
+
+def prepare_image(image_path):
+    # Bypass the prepared image cache so every run does the work, and decode at
+    # full resolution like the old path so the output bytes can be compared
+    return _prepare_image(image_path, use_cache=False, reduced_decode=False)
+
+
+def convert_to_png(image_path):
+    """First Shot's convert_to_png() before prepare_image() replaced it"""
+    img = Image.open(image_path)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    png_bytes = io.BytesIO()
+    img.save(png_bytes, format="PNG")
+    return png_bytes.getvalue()
+
+
+def standardize_image(image_bytes):
+    """First Shot's standardize_image() before prepare_image() replaced it"""
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    target_size = (1120, 1120)
+    if img.size != target_size:
+        img = img.resize(target_size, Image.Resampling.LANCZOS)
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format="PNG")
+    return img_byte_arr.getvalue()
+
+
+def two_pass(image_path):
+    return standardize_image(convert_to_png(image_path))
+
+
+def cpu_time(func, image_path, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = func(image_path)
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def synthetic_scan(folder, megapixels):
+    # Noise plus flat areas, roughly how a photographed sheet compresses
+    width = int((megapixels * 1_000_000 * 3 / 4) ** 0.5)
+    height = int(width * 4 / 3)
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    path = Path(folder) / f"synthetic_{megapixels}mp.jpg"
+    noise.save(path, quality=90)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", help="folder of .jpg/.jpeg/.png images to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per image (best time is reported)")
+    parser.add_argument("--synthetic-mp", type=int, default=40,
+                        help="also benchmark a synthetic scan of this many megapixels (0 to skip)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.folder:
+            images = sorted(p for p in Path(args.folder).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+        else:
+            images = [SAMPLE_IMAGE] if SAMPLE_IMAGE.exists() else []
+        if args.synthetic_mp:
+            images.append(synthetic_scan(tmp, args.synthetic_mp))
+        if not images:
+            print("No images to benchmark")
+            return 1
+
+        print(f"{'image':40} {'size':>11} {'two-pass s':>11} {'single s':>9} {'saved s':>8} {'same':>5}")
+        total_old = total_new = 0.0
+        for image_path in images:
+            with Image.open(image_path) as img:
+                size = f"{img.width}x{img.height}"
+            old_time, old_bytes = cpu_time(two_pass, image_path, args.repeat)
+            new_time, new_bytes = cpu_time(prepare_image, image_path, args.repeat)
+            total_old += old_time
+            total_new += new_time
+            print(f"{image_path.name[:40]:40} {size:>11} {old_time:11.3f} {new_time:9.3f} "
+                  f"{old_time - new_time:8.3f} {'yes' if old_bytes == new_bytes else 'NO':>5}")
+
+    print(f"\nCPU time per image: {total_old / len(images):.3f}s -> {total_new / len(images):.3f}s "
+          f"({(1 - total_new / total_old):.0%} less)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
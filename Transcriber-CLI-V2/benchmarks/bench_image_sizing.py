@@ -0,0 +1,62 @@
+"""Estimated image tokens per model: old 1120x1120 standard vs model-aware sizing
+
+For every model in First_Shot.AVAILABLE_MODELS, prints the size images are sent
+at and the estimated image tokens per image under the old fixed 1120x1120
+resize and under helpers.image_prep's sizing policy table.
+
+Usage:
+    python benchmarks/bench_image_sizing.py                       # sample image + typical sheet sizes
+    python benchmarks/bench_image_sizing.py --folder path/to/images
+"""
+import argparse
+import sys
+from pathlib import Path
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from helpers.image_prep import STANDARD_IMAGE_SIZE, fit_image_size, estimate_image_tokens
+from transcribers.FirstShot.First_Shot import AVAILABLE_MODELS
+
+SAMPLE_IMAGE = Path(__file__).resolve().parents[2] / "Legacy" / "0097_C0036672F_segmentation.jpg"
+
+# Full herbarium sheet scans (portrait, roughly 2:3) and a landscape label crop
+TYPICAL_SIZES = {"sheet 40 MP": (5184, 7776), "sheet 100 MP": (8176, 12264), "label crop": (1800, 1100)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", help="folder of .jpg/.jpeg/.png images to measure")
+    args = parser.parse_args()
+
+    sizes = {}
+    if args.folder:
+        paths = sorted(p for p in Path(args.folder).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    else:
+        paths = [SAMPLE_IMAGE] if SAMPLE_IMAGE.exists() else []
+        sizes.update(TYPICAL_SIZES)
+    for path in paths:
+        with Image.open(path) as img:
+            sizes[path.name] = img.size
+    if not sizes:
+        print("No images to measure")
+        return 1
+
+    for model_id in AVAILABLE_MODELS:
+        print(f"\n{model_id}")
+        print(f"  {'image':36} {'original':>12} {'sent at':>10} {'old tokens':>10} {'new tokens':>10}")
+        old_total = new_total = 0
+        for name, (width, height) in sizes.items():
+            sent = fit_image_size(model_id, width, height)
+            old_tokens = estimate_image_tokens(model_id, *STANDARD_IMAGE_SIZE)
+            new_tokens = estimate_image_tokens(model_id, *sent)
+            old_total += old_tokens
+            new_total += new_tokens
+            print(f"  {name[:36]:36} {f'{width}x{height}':>12} {f'{sent[0]}x{sent[1]}':>10} {old_tokens:10,} {new_tokens:10,}")
+        print(f"  average image tokens per image: {old_total / len(sizes):,.0f} -> {new_total / len(sizes):,.0f} "
+              f"({1 - new_total / old_total:.0%} fewer)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Benchmark detector post-processing in helpers.segmentation.Segmentation
+
+Times postprocess_predictions() (vectorized NumPy) against the per-row Python
+loop it replaced on synthetic YOLO outputs (8400 anchors, 9 classes), and
+checks that both return exactly the same boxes for every sample.
+
+Usage:
+    python benchmarks/bench_postprocess.py
+    python benchmarks/bench_postprocess.py --samples 200 --detections 300
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from helpers.segmentation import DETECTION_INPUT_SIZE, Segmentation
+
+ANCHORS = 8400
+CLASSES = Segmentation.all_possible_classes
+
+
+def loop_postprocess(predictions, original_shape):
+    """The per-row post-processing get_bounding_boxes() used before"""
+    original_height, original_width = original_shape[:2]
+    boxes, confidences, class_ids = [], [], []
+    x_scale, y_scale = original_width / DETECTION_INPUT_SIZE, original_height / DETECTION_INPUT_SIZE
+
+    for pred in predictions:
+        box_coords, class_probs = pred[:4], pred[4:]
+        class_id = np.argmax(class_probs)
+        confidence = class_probs[class_id]
+        if confidence > 0.25:
+            cx, cy, w, h = box_coords
+            x1 = int((cx - w / 2) * x_scale)
+            y1 = int((cy - h / 2) * y_scale)
+            x2 = int((cx + w / 2) * x_scale)
+            y2 = int((cy + h / 2) * y_scale)
+            boxes.append([x1, y1, x2 - x1, y2 - y1])
+            confidences.append(float(confidence))
+            class_ids.append(class_id)
+
+    indices = cv2.dnn.NMSBoxes(boxes, confidences, 0.25, 0.45)
+    final_boxes = {name: [] for name in CLASSES}
+    if len(indices) > 0:
+        for i in indices.flatten():
+            x, y, w, h = boxes[i]
+            final_boxes[CLASSES[class_ids[i]]].append([x, y, x + w, y + h])
+    return final_boxes
+
+
+def synthetic_predictions(rng, detections):
+    """(anchors, 4 + classes) output: low background scores plus a few confident boxes
+
+    Like the real one, it is a transposed view of the model's (4 + classes, anchors) output.
+    """
+    outputs = np.empty((4 + len(CLASSES), ANCHORS), dtype=np.float32)
+    outputs[0:2] = rng.uniform(0, DETECTION_INPUT_SIZE, size=(2, ANCHORS))
+    outputs[2:4] = rng.uniform(4, 300, size=(2, ANCHORS))
+    outputs[4:] = rng.uniform(0, 0.2, size=(len(CLASSES), ANCHORS))
+    hits = rng.choice(ANCHORS, size=detections, replace=False)
+    outputs[4 + rng.integers(0, len(CLASSES), size=detections), hits] = rng.uniform(0.2, 1.0, size=detections)
+    # Exact 0.25 scores sit on the threshold, and ties go to the first class
+    outputs[4, hits[:3]] = 0.25
+    outputs[4:6, hits[3:5]] = 0.5
+    return outputs.T
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=50, help="synthetic outputs to post-process")
+    parser.add_argument("--detections", type=int, default=120, help="anchors per output with a class score above 0.2")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    samples = []
+    for _ in range(args.samples):
+        shape = (int(rng.integers(1000, 11000)), int(rng.integers(1000, 8000)), 3)
+        samples.append((synthetic_predictions(rng, args.detections), shape))
+
+    # postprocess_predictions() only needs the class list, not a loaded model
+    engine = Segmentation.__new__(Segmentation)
+
+    mismatches = sum(
+        engine.postprocess_predictions(predictions, shape) != loop_postprocess(predictions, shape)
+        for predictions, shape in samples
+    )
+
+    timings = {}
+    for name, func in (("loop", loop_postprocess), ("vectorized", engine.postprocess_predictions)):
+        start = time.perf_counter()
+        for predictions, shape in samples:
+            func(predictions, shape)
+        timings[name] = (time.perf_counter() - start) / len(samples) * 1000
+
+    print(f"{'':10} {'ms/image':>9}")
+    for name, ms in timings.items():
+        print(f"{name:10} {ms:9.3f}")
+    print(f"speedup    {timings['loop'] / timings['vectorized']:8.1f}x")
+    print(f"identical output: {args.samples - mismatches}/{args.samples} samples")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""Benchmark reduced-scale JPEG decoding in helpers.image_prep.prepare_image
+
+For each image, prepare_image() runs once with a full-resolution decode and once
+with reduced-scale decoding (Pillow draft mode / libjpeg DCT scaling). Each run
+happens in a fresh process so its peak RSS can be measured on its own. The mean
+pixel difference between the two outputs is shown as a quality check (0-255
+scale).
+
+Usage:
+    python benchmarks/bench_reduced_decode.py                  # sample image + synthetic 8000x11000 scan
+    python benchmarks/bench_reduced_decode.py --folder path/to/images --model us.amazon.nova-pro-v1:0
+"""
+import argparse
+import io
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+from PIL import Image, ImageChops, ImageStat
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from helpers.image_prep import prepare_image
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SAMPLE_IMAGE = Path(__file__).resolve().parents[2] / "Legacy" / "0097_C0036672F_segmentation.jpg"
+DEFAULT_MODEL = "us.anthropic.claude-sonnet-4-20250514-v1:0"
+
+
+def _peak_rss_mb():
+    # ru_maxrss survives exec on Linux (the child would start at the parent's
+    # peak), so prefer the per-process high-water mark from /proc
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run(image_path, model_id, reduced_decode, results):
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    image_bytes = prepare_image(image_path, model_id, use_cache=False, reduced_decode=reduced_decode)
+    elapsed = time.perf_counter() - start
+    peak = _peak_rss_mb()
+    results.put((elapsed, None if peak is None else peak - baseline, image_bytes))
+
+
+def measure(image_path, model_id, reduced_decode):
+    """Prepare one image in a fresh process; returns (seconds, peak RSS growth in MB, bytes)"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run, args=(str(image_path), model_id, reduced_decode, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def mean_difference(a_bytes, b_bytes):
+    with Image.open(io.BytesIO(a_bytes)) as a, Image.open(io.BytesIO(b_bytes)) as b:
+        if a.size != b.size:
+            return float("nan")
+        return sum(ImageStat.Stat(ImageChops.difference(a.convert("RGB"), b.convert("RGB"))).mean) / 3
+
+
+def synthetic_scan(folder, width, height):
+    # Light paper with mild sensor noise; pure noise would make entropy
+    # decoding (which DCT scaling cannot skip) dominate unrealistically
+    paper = Image.new("RGB", (width, height), (232, 226, 210))
+    noise = Image.effect_noise((width, height), 8).convert("RGB")
+    path = Path(folder) / f"synthetic_{width}x{height}.jpg"
+    Image.blend(paper, noise, 0.15).save(path, quality=90)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", help="folder of .jpg/.jpeg/.png images to benchmark")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="model ID the images are sized for")
+    parser.add_argument("--synthetic-size", default="8000x11000",
+                        help="also benchmark a synthetic scan of this size (WIDTHxHEIGHT, 0 to skip)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.folder:
+            images = sorted(p for p in Path(args.folder).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+        else:
+            images = [SAMPLE_IMAGE] if SAMPLE_IMAGE.exists() else []
+        if args.synthetic_size != "0":
+            width, height = (int(v) for v in args.synthetic_size.lower().split("x"))
+            images.append(synthetic_scan(tmp, width, height))
+        if not images:
+            print("No images to benchmark")
+            return 1
+
+        print(f"{'image':36} {'size':>11} {'full s':>7} {'reduced s':>9} {'full MB':>8} {'reduced MB':>10} {'diff':>5}")
+        for image_path in images:
+            with Image.open(image_path) as img:
+                size = f"{img.width}x{img.height}"
+            full_time, full_rss, full_bytes = measure(image_path, args.model, False)
+            reduced_time, reduced_rss, reduced_bytes = measure(image_path, args.model, True)
+            full_mb = "n/a" if full_rss is None else f"{full_rss:.0f}"
+            reduced_mb = "n/a" if reduced_rss is None else f"{reduced_rss:.0f}"
+            print(f"{image_path.name[:36]:36} {size:>11} {full_time:7.3f} {reduced_time:9.3f} "
+                  f"{full_mb:>8} {reduced_mb:>10} {mean_difference(full_bytes, reduced_bytes):5.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
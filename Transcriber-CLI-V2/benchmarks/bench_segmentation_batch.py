@@ -0,0 +1,88 @@
+"""Benchmark batched detection in helpers.segmentation.Segmentation
+
+Runs the detector over the same decoded images at each batch size and reports
+images/s for preprocessing, inference and box post-processing (decoding and
+cropping are left out, they do not change with the batch size). Batch size 1
+is the per-image path process_images_segmentation() used before batching.
+The gain depends on the core count, so run it on the machine that segments.
+
+Usage:
+    python benchmarks/bench_segmentation_batch.py                    # synthetic images
+    python benchmarks/bench_segmentation_batch.py --folder path/to/images --batch-sizes 1,4,8,16
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from helpers.segmentation import Segmentation
+
+DEFAULT_MODEL = Path(__file__).resolve().parent.parent / "helpers" / "SegmentationModels" / "RoboFlowModels" / "best.xml"
+
+
+def load_images(folder, count):
+    exts = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp")
+    paths = sorted(p for p in Path(folder).iterdir() if p.suffix.lower() in exts)
+    images = [img for img in (cv2.imread(str(p)) for p in paths) if img is not None]
+    if not images:
+        return []
+    # Repeat the folder's images to reach count
+    return [images[i % len(images)] for i in range(count)]
+
+
+def synthetic_images(count, width=2000, height=3000):
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        image = np.full((height, width, 3), (210, 226, 232), dtype=np.uint8)
+        # A few dark rectangles standing in for labels
+        for _ in range(4):
+            x, y = int(rng.integers(0, width - 400)), int(rng.integers(0, height - 300))
+            image[y:y + 300, x:x + 400] = rng.integers(0, 120, size=3)
+        images.append(image)
+    return images
+
+
+def measure(model_path, images, batch_size, rounds):
+    engine = Segmentation(str(model_path), ["label"], batch_size=batch_size)
+    engine.detect_batch(images[:batch_size])  # warm-up
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        engine.detect_batch(images)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(images) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=str(DEFAULT_MODEL), help="OpenVINO detector .xml")
+    parser.add_argument("--folder", help="folder of images to detect on (default: synthetic scans)")
+    parser.add_argument("--images", type=int, default=64, help="images per round")
+    parser.add_argument("--batch-sizes", default="1,4,8,16", help="comma-separated batch sizes")
+    parser.add_argument("--rounds", type=int, default=3, help="rounds per batch size (best is reported)")
+    args = parser.parse_args()
+
+    images = load_images(args.folder, args.images) if args.folder else synthetic_images(args.images)
+    if not images:
+        print("No images to benchmark")
+        return 1
+
+    print(f"{len(images)} images, {os.cpu_count()} CPUs")
+    print(f"{'batch':>5} {'images/s':>9} {'speedup':>8}")
+    baseline = None
+    for batch_size in (int(v) for v in args.batch_sizes.split(",")):
+        rate = measure(args.model, images, batch_size, args.rounds)
+        baseline = baseline or rate
+        print(f"{batch_size:5} {rate:9.1f} {rate / baseline:7.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""Benchmark the image wire format: encode time, payload size and request latency
+
+Each image is decoded and sized once for --model, then encoded as PNG, JPEG and
+WebP. Encode time (best of --repeat) and payload size are reported per format.
+With --live, each payload is also sent to Bedrock with the transcription prompt
+and the end-to-end request latency is measured (needs AWS credentials and is
+billed like any other request; the response cache is not used).
+
+By default the images are the sample in Legacy/ plus any images found under
+FirstShot_results/; use --folder to point at your own scans.
+
+Usage:
+    python benchmarks/bench_wire_format.py
+    python benchmarks/bench_wire_format.py --folder path/to/images --quality 85
+    python benchmarks/bench_wire_format.py --live --model us.anthropic.claude-sonnet-4-20250514-v1:0
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from helpers.bedrock_client import get_bedrock_client
+from helpers.image_prep import IMAGE_FORMATS, fit_image_size, encode_image
+
+SAMPLE_IMAGE = ROOT.parent / "Legacy" / "0097_C0036672F_segmentation.jpg"
+DEFAULT_PROMPT = ROOT / "Prompts" / "Prompt_1.5.9.txt"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def find_images(folder):
+    if folder:
+        return sorted(p for p in Path(folder).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    images = [SAMPLE_IMAGE] if SAMPLE_IMAGE.exists() else []
+    images += sorted(p for p in (ROOT / "FirstShot_results").rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    return images
+
+
+def decode_and_size(image_path, model_id):
+    with Image.open(image_path) as img:
+        img = img.convert("RGB")
+        target_size = fit_image_size(model_id, *img.size)
+        if img.size != target_size:
+            img = img.resize(target_size, Image.Resampling.LANCZOS)
+    return img
+
+
+def time_request(model_id, image_bytes, image_format, prompt_text):
+    start = time.perf_counter()
+    get_bedrock_client().converse(
+        modelId=model_id,
+        messages=[{"role": "user", "content": [
+            {"image": {"format": image_format, "source": {"bytes": image_bytes}}},
+            {"text": prompt_text},
+        ]}],
+        inferenceConfig={"temperature": 0.0},
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", help="folder of .jpg/.jpeg/.png images to benchmark")
+    parser.add_argument("--model", default="us.anthropic.claude-3-7-sonnet-20250219-v1:0",
+                        help="model whose sizing policy (and endpoint, with --live) is used")
+    parser.add_argument("--quality", type=int, default=90, help="JPEG/WebP quality")
+    parser.add_argument("--repeat", type=int, default=5, help="encodes per image and format (best time is reported)")
+    parser.add_argument("--live", action="store_true", help="also time real Bedrock requests")
+    parser.add_argument("--prompt", default=str(DEFAULT_PROMPT), help="prompt file for --live requests")
+    args = parser.parse_args()
+
+    images = find_images(args.folder)
+    if not images:
+        print("No images to benchmark")
+        return 1
+    prompt_text = Path(args.prompt).read_text(encoding="utf-8").strip() if args.live else None
+
+    totals = {name: {"encode": 0.0, "bytes": 0, "latency": 0.0} for name in IMAGE_FORMATS}
+    header = f"{'image':36} {'format':6} {'sent at':>10} {'encode ms':>9} {'KB':>8}"
+    print(header + (f" {'request s':>9}" if args.live else ""))
+    for image_path in images:
+        img = decode_and_size(image_path, args.model)
+        for name in IMAGE_FORMATS:
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                payload = encode_image(img, name, args.quality)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            totals[name]["encode"] += best
+            totals[name]["bytes"] += len(payload)
+            line = (f"{image_path.name[:36]:36} {name:6} {f'{img.width}x{img.height}':>10} "
+                    f"{best * 1000:9.1f} {len(payload) / 1024:8.1f}")
+            if args.live:
+                latency = time_request(args.model, payload, name, prompt_text)
+                totals[name]["latency"] += latency
+                line += f" {latency:9.2f}"
+            print(line)
+
+    print(f"\nAverages over {len(images)} image(s), quality {args.quality}:")
+    png_bytes = totals["png"]["bytes"]
+    for name, total in totals.items():
+        line = (f"  {name:6} encode {total['encode'] / len(images) * 1000:7.1f} ms, "
+                f"{total['bytes'] / len(images) / 1024:8.1f} KB ({total['bytes'] / png_bytes:.0%} of PNG)")
+        if args.live:
+            line += f", request {total['latency'] / len(images):.2f} s"
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Check that a First Shot run through a batch inference job matches an on-demand run
+
+Runs process_images() twice over the same generated images with a fake Bedrock
+backend: once with on-demand converse calls and once through LocalBatchJobRunner.
+The per-image JSON files and the batch file must match apart from message IDs,
+timestamps and per-request stats.
+
+Usage:
+    python benchmarks/check_batch_inference.py [--images 12]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import sys
+import tempfile
+from pathlib import Path
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import helpers.bedrock_client as bedrock_client
+from helpers.batch_inference import LocalBatchJobRunner
+from helpers.response_cache import configure_response_cache
+from transcribers.FirstShot import First_Shot
+
+MODEL_ID = "us.anthropic.claude-3-7-sonnet-20250219-v1:0"
+VOLATILE_FIELDS = ("id", "timestamp", "request")
+VOLATILE_BATCH_FIELDS = ("batch_id", "created_at")
+
+
+def fake_transcription(image_bytes, prompt_text):
+    digest = hashlib.sha256(image_bytes + prompt_text.encode("utf-8")).hexdigest()[:12]
+    return f"Here is the transcription of the herbarium label:\nverbatimCollectors: {digest}\nlocality: N/A"
+
+
+class FakeConverseClient:
+    def converse(self, modelId, messages, inferenceConfig, **kwargs):
+        content = messages[0]["content"]
+        image = next(block["image"]["source"]["bytes"] for block in content if "image" in block)
+        prompt = next(block["text"] for block in content if "text" in block)
+        return {"output": {"message": {"content": [{"text": fake_transcription(image, prompt)}]}},
+                "usage": {"inputTokens": 0, "outputTokens": 0}}
+
+
+def fake_responder(model_id, model_input):
+    content = model_input["messages"][0]["content"]
+    image = base64.b64decode(next(block["source"]["data"] for block in content if block["type"] == "image"))
+    prompt = next(block["text"] for block in content if block["type"] == "text")
+    return {"content": [{"type": "text", "text": fake_transcription(image, prompt)}],
+            "usage": {"input_tokens": 0, "output_tokens": 0}}
+
+
+def load_outputs(folder):
+    outputs = {}
+    for path in sorted(Path(folder).glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        entries = data["transcriptions"] if "transcriptions" in data else [data]
+        for entry in entries:
+            for field in VOLATILE_FIELDS:
+                entry.pop(field, None)
+        for field in VOLATILE_BATCH_FIELDS:
+            data.pop(field, None)
+        outputs[path.name] = data
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=12, help="number of test images to generate")
+    args = parser.parse_args()
+
+    configure_response_cache(enabled=False)
+    bedrock_client._client = FakeConverseClient()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        images = tmp / "images"
+        images.mkdir()
+        for i in range(1, args.images + 1):
+            Image.new("RGB", (300 + i, 400), (i * 20 % 256, 80, 160)).save(images / f"{i:04d}_sheet.jpg")
+        prompt = tmp / "prompt.txt"
+        prompt.write_text("Transcribe the label.", encoding="utf-8")
+
+        on_demand, batch = tmp / "on_demand", tmp / "batch"
+        on_demand.mkdir()
+        batch.mkdir()
+        First_Shot.process_images(images, prompt, on_demand, "check", model_id=MODEL_ID, max_workers=4)
+        runner = LocalBatchJobRunner(tmp / "jobs", responder=fake_responder)
+        First_Shot.process_images(images, prompt, batch, "check", model_id=MODEL_ID, batch_runner=runner)
+
+        expected, actual = load_outputs(on_demand), load_outputs(batch)
+
+    if expected != actual:
+        print("\nMISMATCH between on-demand and batch inference outputs")
+        for name in sorted(set(expected) | set(actual)):
+            if expected.get(name) != actual.get(name):
+                print(f"  {name}")
+        return 1
+    print(f"\nOK: {len(expected)} JSON files identical between on-demand and batch inference runs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
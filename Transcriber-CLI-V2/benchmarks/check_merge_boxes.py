@@ -0,0 +1,105 @@
+"""Check Segmentation.merge_overlapping_boxes against the pairwise merge it replaced
+
+Generates random box sets (sparse and dense, with touching edges, duplicates
+and zero-width boxes) and checks that the sweep-line merge returns exactly
+the same boxes in the same order as the old restart-after-every-merge loop.
+Then times both on larger sets.
+
+Usage:
+    python benchmarks/check_merge_boxes.py [--cases 2000] [--seed 0]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from helpers.segmentation import Segmentation
+
+
+def pairwise_merge(boxes):
+    """The merge_overlapping_boxes() loop used before"""
+    if not boxes:
+        return []
+    box_list = [list(b) for b in boxes]
+    while True:
+        merged_in_pass = False
+        i = 0
+        while i < len(box_list):
+            j = i + 1
+            while j < len(box_list):
+                box1, box2 = box_list[i], box_list[j]
+                if (
+                    box1[0] < box2[2] and box1[2] > box2[0]
+                    and box1[1] < box2[3] and box1[3] > box2[1]
+                ):
+                    box_list[i] = [
+                        min(box1[0], box2[0]),
+                        min(box1[1], box2[1]),
+                        max(box1[2], box2[2]),
+                        max(box1[3], box2[3]),
+                    ]
+                    box_list.pop(j)
+                    merged_in_pass = True
+                    break
+                else:
+                    j += 1
+            if merged_in_pass:
+                break
+            else:
+                i += 1
+        if not merged_in_pass:
+            break
+    return box_list
+
+
+def random_boxes(rng, count, extent, max_size):
+    boxes = []
+    for _ in range(count):
+        # A coarse grid makes shared edges and identical boxes common
+        x1, y1 = rng.randrange(0, extent, 5), rng.randrange(0, extent, 5)
+        w = rng.choice([0, rng.randrange(0, max_size, 5)])
+        h = rng.randrange(0, max_size, 5)
+        boxes.append([x1, y1, x1 + w, y1 + h])
+    if boxes and rng.random() < 0.3:
+        boxes.append(list(rng.choice(boxes)))
+    return boxes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=2000, help="random box sets to compare")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    engine = Segmentation.__new__(Segmentation)  # no model needed to merge boxes
+
+    failures = 0
+    for case in range(args.cases):
+        boxes = random_boxes(rng, rng.randrange(0, 40), rng.choice([200, 1000, 4000]), rng.choice([50, 300, 1000]))
+        expected, actual = pairwise_merge(boxes), engine.merge_overlapping_boxes(boxes)
+        if expected != actual:
+            failures += 1
+            if failures <= 5:
+                print(f"MISMATCH in case {case}:\n  boxes:    {boxes}\n  expected: {expected}\n  actual:   {actual}")
+    print(f"{args.cases - failures}/{args.cases} random box sets merged identically")
+
+    print(f"\n{'boxes':>6} {'pairwise ms':>12} {'sweep ms':>9}")
+    for count in (50, 200, 800):
+        boxes = random_boxes(rng, count, 6000, 200)
+        start = time.perf_counter()
+        expected = pairwise_merge(boxes)
+        pairwise_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        actual = engine.merge_overlapping_boxes(boxes)
+        sweep_ms = (time.perf_counter() - start) * 1000
+        failures += expected != actual
+        print(f"{count:6} {pairwise_ms:12.2f} {sweep_ms:9.2f}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
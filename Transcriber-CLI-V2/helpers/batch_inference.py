@@ -0,0 +1,338 @@
+import base64
+import json
+import shutil
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+import boto3
+from helpers.bedrock_client import get_bedrock_client
+from helpers.image_prep import REGION_PREFIXES
+
+"Bedrock Batch Inference (model invocation jobs) for large, non-interactive runs"
+
+# Bedrock model invocation job limits (default service quotas)
+MIN_RECORDS_PER_JOB = 100
+MAX_RECORDS_PER_JOB = 50000
+MAX_JOB_NAME_LENGTH = 63
+
+# Invoke-model bodies need an explicit output limit, Converse does not
+BATCH_MAX_TOKENS = 4096
+
+# Job states that will not change any more
+TERMINAL_STATUSES = {"Completed", "PartiallyCompleted", "Failed", "Stopped", "Expired"}
+SUCCESS_STATUSES = {"Completed", "PartiallyCompleted"}
+
+
+def _model_family(model_id):
+    base_id = model_id
+    if base_id.startswith(REGION_PREFIXES):
+        base_id = base_id.split(".", 1)[1]
+    if base_id.startswith("anthropic."):
+        return "anthropic"
+    if base_id.startswith("amazon.nova"):
+        return "nova"
+    return None
+
+
+def supports_batch_inference(model_id):
+    """Return True if model invocation job records can be built for this model"""
+    return _model_family(model_id) is not None
+
+
+def build_model_input(model_id, image_bytes, prompt_text, temperature, image_format="png"):
+    """Build the invoke-model request body for one image and its prompt
+
+    Batch jobs take each model's native request format rather than Converse, so
+    the image and prompt are laid out the same way process_image() sends them.
+    """
+    family = _model_family(model_id)
+    image_b64 = base64.b64encode(image_bytes).decode("ascii")
+    if family == "anthropic":
+        return {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": BATCH_MAX_TOKENS,
+            "temperature": temperature,
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {"type": "image", "source": {"type": "base64", "media_type": f"image/{image_format}", "data": image_b64}},
+                    {"type": "text", "text": prompt_text},
+                ],
+            }],
+        }
+    if family == "nova":
+        return {
+            "schemaVersion": "messages-v1",
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {"image": {"format": image_format, "source": {"bytes": image_b64}}},
+                    {"text": prompt_text},
+                ],
+            }],
+            "inferenceConfig": {"temperature": temperature, "maxTokens": BATCH_MAX_TOKENS},
+        }
+    raise ValueError(f"Batch inference is not supported for {model_id} (Anthropic Claude and Amazon Nova models only)")
+
+
+def parse_model_output(model_id, model_output):
+    """Return the response text from an invoke-model response body"""
+    family = _model_family(model_id)
+    if family == "anthropic":
+        for block in model_output.get("content", []):
+            if block.get("type") == "text":
+                return block["text"]
+    elif family == "nova":
+        for block in model_output.get("output", {}).get("message", {}).get("content", []):
+            if "text" in block:
+                return block["text"]
+    raise ValueError("Model output does not contain any text")
+
+
+def _parse_s3_uri(uri):
+    if not uri.startswith("s3://"):
+        raise ValueError(f"Not an S3 URI: {uri}")
+    bucket, _, prefix = uri[len("s3://"):].partition("/")
+    return bucket, prefix.strip("/")
+
+
+class BedrockBatchJobRunner:
+    """Runs model invocation jobs on Bedrock, staging files in S3
+
+    Args:
+        s3_uri: S3 location for job input and output, e.g. s3://my-bucket/transcriber
+        role_arn: IAM service role Bedrock assumes to read and write that location
+        poll_interval: Seconds between job status checks
+    """
+
+    min_records = MIN_RECORDS_PER_JOB
+
+    def __init__(self, s3_uri, role_arn, poll_interval=60):
+        self.bucket, self.prefix = _parse_s3_uri(s3_uri)
+        self.role_arn = role_arn
+        self.poll_interval = poll_interval
+        session = boto3.session.Session()
+        self._s3 = session.client("s3")
+        self._bedrock = session.client("bedrock")
+        self._output_prefixes = {}
+
+    def _key(self, *parts):
+        return "/".join(part for part in (self.prefix,) + parts if part)
+
+    def submit(self, job_name, model_id, input_path):
+        """Upload the input JSONL and start the job; returns the job ARN"""
+        input_key = self._key(job_name, "input", Path(input_path).name)
+        output_prefix = self._key(job_name, "output") + "/"
+        self._s3.upload_file(str(input_path), self.bucket, input_key)
+        response = self._bedrock.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=self.role_arn,
+            modelId=model_id,
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{self.bucket}/{input_key}", "s3InputFormat": "JSONL"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"s3://{self.bucket}/{output_prefix}"}},
+        )
+        job_arn = response["jobArn"]
+        self._output_prefixes[job_arn] = output_prefix
+        return job_arn
+
+    def get_status(self, job_id):
+        response = self._bedrock.get_model_invocation_job(jobIdentifier=job_id)
+        if response["status"] == "Failed" and response.get("message"):
+            print(f"Batch job failed: {response['message']}")
+        return response["status"]
+
+    def fetch_output(self, job_id, dest_dir):
+        """Download the job's .jsonl.out files into dest_dir and return their paths"""
+        # Bedrock writes output under <output prefix>/<job id>/
+        prefix = self._output_prefixes[job_id] + job_id.rsplit("/", 1)[-1] + "/"
+        paths = []
+        paginator = self._s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                if item["Key"].endswith(".jsonl.out"):
+                    dest = Path(dest_dir) / Path(item["Key"]).name
+                    self._s3.download_file(self.bucket, item["Key"], str(dest))
+                    paths.append(dest)
+        return paths
+
+
+def _invoke_on_demand(model_id, model_input):
+    response = get_bedrock_client().invoke_model(modelId=model_id, body=json.dumps(model_input))
+    return json.loads(response["body"].read())
+
+
+class LocalBatchJobRunner:
+    """Directory-based stand-in for the model invocation job API
+
+    Each job is a folder under jobs_dir holding input/, output/ and status.json.
+    The job runs the first time its status is checked: every record is passed to
+    responder(model_id, model_input), which returns the model output (by default
+    an on-demand invoke_model call). Output lines use the same format as Bedrock.
+    """
+
+    min_records = 1
+
+    def __init__(self, jobs_dir, responder=None, poll_interval=0):
+        self.jobs_dir = Path(jobs_dir)
+        self.responder = responder or _invoke_on_demand
+        self.poll_interval = poll_interval
+
+    def _write_status(self, job_dir, status, **extra):
+        with open(job_dir / "status.json", "w", encoding="utf-8") as f:
+            json.dump(dict(extra, status=status), f, indent=2)
+
+    def submit(self, job_name, model_id, input_path):
+        job_id = f"{job_name}-{uuid.uuid4().hex[:8]}"
+        job_dir = self.jobs_dir / job_id
+        (job_dir / "input").mkdir(parents=True)
+        shutil.copy(input_path, job_dir / "input" / Path(input_path).name)
+        self._write_status(job_dir, "Submitted", model_id=model_id)
+        return job_id
+
+    def get_status(self, job_id):
+        job_dir = self.jobs_dir / job_id
+        with open(job_dir / "status.json", "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state["status"] == "Submitted":
+            self._write_status(job_dir, "InProgress", model_id=state["model_id"])
+            state["status"] = self._run(job_dir, state["model_id"])
+            self._write_status(job_dir, state["status"], model_id=state["model_id"])
+        return state["status"]
+
+    def _run(self, job_dir, model_id):
+        output_dir = job_dir / "output"
+        output_dir.mkdir(exist_ok=True)
+        failed = 0
+        for input_path in sorted((job_dir / "input").glob("*.jsonl")):
+            with open(input_path, "r", encoding="utf-8") as f_in, \
+                    open(output_dir / f"{input_path.name}.out", "w", encoding="utf-8") as f_out:
+                for line in f_in:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    output = {"recordId": record["recordId"], "modelInput": record["modelInput"]}
+                    try:
+                        output["modelOutput"] = self.responder(model_id, record["modelInput"])
+                    except Exception as e:
+                        failed += 1
+                        output["error"] = {"errorCode": 400, "errorMessage": str(e)}
+                    f_out.write(json.dumps(output, ensure_ascii=False) + "\n")
+        return "PartiallyCompleted" if failed else "Completed"
+
+    def fetch_output(self, job_id, dest_dir):
+        paths = []
+        for out_path in sorted((self.jobs_dir / job_id / "output").glob("*.jsonl.out")):
+            dest = Path(dest_dir) / out_path.name
+            shutil.copy(out_path, dest)
+            paths.append(dest)
+        return paths
+
+
+def _rebalance_last_part(parts, min_records):
+    """Move records from the second-to-last input file so the last has at least min_records
+
+    parts holds [path, count, offsets of the last lines]. The previous file is
+    full (MAX_RECORDS_PER_JOB lines), so it keeps far more than min_records.
+    """
+    (prev_path, _, prev_offsets), (last_path, last_count, _) = parts[-2], parts[-1]
+    moved = min_records - last_count
+    cut = prev_offsets[-moved]
+    with open(prev_path, "r+b") as f:
+        f.seek(cut)
+        tail = f.read()
+        f.truncate(cut)
+    with open(last_path, "rb") as f:
+        rest = f.read()
+    with open(last_path, "wb") as f:
+        f.write(tail + rest)
+    parts[-2][1] -= moved
+    parts[-1][1] += moved
+
+
+def run_batch_jobs(runner, job_name, model_id, records, work_dir):
+    """Submit records as one or more jobs, wait for them and collect the outputs
+
+    Args:
+        runner: BedrockBatchJobRunner or LocalBatchJobRunner
+        records: Iterable of {"recordId": ..., "modelInput": ...} dicts. Records are
+            written to disk as they are produced, so a generator keeps only one
+            encoded image in memory at a time.
+        work_dir: Folder for the input and downloaded output JSONL files
+
+    Returns:
+        Dict of recordId -> output line ({"modelOutput": ...} or {"error": ...}),
+        without the echoed modelInput. Empty if there were no records, or fewer
+        than a job accepts (runner.min_records), in which case nothing is submitted.
+        Records of jobs that could not be submitted, or that failed, were stopped
+        or expired, have no entry.
+    """
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    # Split the records into input files of at most MAX_RECORDS_PER_JOB lines,
+    # remembering where the last min_records lines of each start
+    parts = []
+    f = None
+    try:
+        for record in records:
+            if f is None or parts[-1][1] >= MAX_RECORDS_PER_JOB:
+                if f is not None:
+                    f.close()
+                input_path = work_dir / f"{job_name}-{len(parts) + 1}.jsonl"
+                f = open(input_path, "wb")
+                parts.append([input_path, 0, deque(maxlen=runner.min_records)])
+            parts[-1][2].append(f.tell())
+            f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            parts[-1][1] += 1
+    finally:
+        if f is not None:
+            f.close()
+
+    total = sum(count for _, count, _ in parts)
+    if total < runner.min_records:
+        if total:
+            print(f"Batch inference jobs need at least {runner.min_records} images, "
+                  f"not submitting a job for {total}")
+        return {}
+    # Bedrock also rejects a final part that is too small
+    if len(parts) > 1 and parts[-1][1] < runner.min_records:
+        _rebalance_last_part(parts, runner.min_records)
+
+    # A part whose job cannot be submitted or does not succeed is left out of
+    # the outputs, so its records can be sent on demand instead
+    jobs = []
+    for part, (input_path, count, _) in enumerate(parts, 1):
+        part_name = job_name if len(parts) == 1 else f"{job_name}-{part}"
+        try:
+            job_id = runner.submit(part_name, model_id, input_path)
+        except Exception as e:
+            print(f"Could not submit batch job {part_name} ({count} images): {e}")
+            continue
+        print(f"Submitted batch job {job_id} ({count} images)")
+        jobs.append(job_id)
+
+    outputs = {}
+    for job_id in jobs:
+        try:
+            status = runner.get_status(job_id)
+            while status not in TERMINAL_STATUSES:
+                print(f"Batch job {job_id}: {status}, checking again in {runner.poll_interval}s")
+                time.sleep(runner.poll_interval)
+                status = runner.get_status(job_id)
+            print(f"Batch job {job_id}: {status}")
+            if status not in SUCCESS_STATUSES:
+                continue
+            out_paths = runner.fetch_output(job_id, work_dir)
+        except Exception as e:
+            print(f"Could not get the results of batch job {job_id}: {e}")
+            continue
+
+        for out_path in out_paths:
+            with open(out_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        output = json.loads(line)
+                        output.pop("modelInput", None)
+                        outputs[output["recordId"]] = output
+    return outputs
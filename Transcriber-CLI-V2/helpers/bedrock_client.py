@@ -0,0 +1,62 @@
+import threading
+import boto3
+from botocore.config import Config
+
+"Shared bedrock-runtime client, built once per process and reused by every transcriber"
+
+# Timeouts in seconds. Large prompts on the bigger models can take a few minutes
+# to come back, so the read timeout is generous.
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 300
+
+# botocore makes a single attempt; helpers.retry decides what is retried so
+# attempts are not multiplied between the two layers
+RETRY_SETTINGS = {"mode": "standard", "total_max_attempts": 1}
+
+# Never size the connection pool below botocore's default
+MIN_POOL_CONNECTIONS = 10
+
+_lock = threading.Lock()
+_client = None
+_pool_connections = MIN_POOL_CONNECTIONS
+
+
+def configure_bedrock_client(max_concurrency):
+    """Size the shared client's connection pool for the given number of in-flight calls
+
+    If the pool size changes, the next call to get_bedrock_client() builds a new
+    client with the new settings.
+    """
+    global _client, _pool_connections
+    # A little headroom so a worker never waits on the pool for a free connection
+    pool_connections = max(MIN_POOL_CONNECTIONS, int(max_concurrency) + 2)
+    with _lock:
+        if pool_connections != _pool_connections:
+            _pool_connections = pool_connections
+            _client = None
+
+
+def _build_config():
+    return Config(
+        max_pool_connections=_pool_connections,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        retries=dict(RETRY_SETTINGS),
+    )
+
+
+def get_bedrock_client():
+    """Return the process-wide bedrock-runtime client, creating it on first use
+
+    boto3 clients are thread-safe once built, but building them from the default
+    session is not, so creation happens under a lock on a private session.
+    """
+    global _client
+    client = _client
+    if client is not None:
+        return client
+    with _lock:
+        if _client is None:
+            session = boto3.session.Session()
+            _client = session.client("bedrock-runtime", config=_build_config())
+        return _client
@@ -1,5 +1,6 @@
 import time
 import os
+import threading
 from datetime import datetime
 from pathlib import Path
 
@@ -17,6 +18,12 @@ def get_output_base_path():
     return home_dir / "Finished Transcriptions"
 
 class CostTracker:
+    # Prompt cache pricing relative to the normal input token price
+    CACHE_READ_PRICE_MULTIPLIER = 0.1
+    CACHE_WRITE_PRICE_MULTIPLIER = 1.25
+    # Batch inference jobs are billed at half the on-demand price
+    BATCH_PRICE_MULTIPLIER = 0.5
+    
     # AWS Bedrock pricing per 1K tokens (updated from AWS pricing page)
     MODEL_PRICING = {
         "us.anthropic.claude-3-sonnet-20240229-v1:0": {
@@ -123,17 +130,38 @@ class CostTracker:
             "models_used": {},
             "total_images": 0,
             "total_cost": 0.0,
-            "prompt_path": None
+            "prompt_path": None,
+            "response_cache": {"hits": 0, "misses": 0, "cost_saved": 0.0},
+            "duplicate_images": 0
         }
+        # Requests may be tracked from several worker threads at once
+        self._lock = threading.Lock()
+    
+    def track_request(self, model_id, input_tokens, output_tokens, image_count=1, cache_read_tokens=0, cache_write_tokens=0,
+                      batch=False, image_tokens=0):
+        """Track a single API request
+        
+        cache_read_tokens and cache_write_tokens are the prompt cache figures
+        Bedrock reported; they are part of input_tokens but billed differently.
+        batch marks a record of a batch inference job, billed at the batch price.
+        image_tokens is the estimated input token cost of the images in the request.
+        """
+        with self._lock:
+            self._track_request(model_id, input_tokens, output_tokens, image_count, cache_read_tokens, cache_write_tokens,
+                                batch, image_tokens)
     
-    def track_request(self, model_id, input_tokens, output_tokens, image_count=1):
-        """Track a single API request"""
+    def _track_request(self, model_id, input_tokens, output_tokens, image_count, cache_read_tokens, cache_write_tokens,
+                       batch=False, image_tokens=0):
         if model_id not in self.session_data["models_used"]:
             self.session_data["models_used"][model_id] = {
                 "requests": 0,
                 "input_tokens": 0,
                 "output_tokens": 0,
                 "images_processed": 0,
+                "cache_read_tokens": 0,
+                "cache_write_tokens": 0,
+                "batch_requests": 0,
+                "image_tokens": 0,
                 "cost": 0.0
             }
         
@@ -142,15 +170,44 @@ class CostTracker:
         model_data["input_tokens"] += input_tokens
         model_data["output_tokens"] += output_tokens
         model_data["images_processed"] += image_count
+        model_data["cache_read_tokens"] += cache_read_tokens
+        model_data["cache_write_tokens"] += cache_write_tokens
+        model_data["image_tokens"] += image_tokens
         
         # Calculate cost
         pricing = self.MODEL_PRICING.get(model_id, {"input": 0.003, "output": 0.015})
-        request_cost = (input_tokens * pricing["input"] / 1000) + (output_tokens * pricing["output"] / 1000)
+        request_cost = ((input_tokens + image_tokens) * pricing["input"] / 1000) + (output_tokens * pricing["output"] / 1000)
+        # Cached prompt tokens are discounted on read and carry a premium on write
+        request_cost -= cache_read_tokens * pricing["input"] * (1 - self.CACHE_READ_PRICE_MULTIPLIER) / 1000
+        request_cost += cache_write_tokens * pricing["input"] * (self.CACHE_WRITE_PRICE_MULTIPLIER - 1) / 1000
+        request_cost = max(request_cost, 0.0)
+        if batch:
+            request_cost *= self.BATCH_PRICE_MULTIPLIER
+            model_data["batch_requests"] += 1
         model_data["cost"] += request_cost
         
         self.session_data["total_images"] += image_count
         self.session_data["total_cost"] += request_cost
     
+    def track_cache_hit(self, model_id, input_tokens, output_tokens):
+        """Track a request answered from the response cache instead of Bedrock"""
+        pricing = self.MODEL_PRICING.get(model_id, {"input": 0.003, "output": 0.015})
+        saved = (input_tokens * pricing["input"] / 1000) + (output_tokens * pricing["output"] / 1000)
+        with self._lock:
+            cache_data = self.session_data["response_cache"]
+            cache_data["hits"] += 1
+            cache_data["cost_saved"] += saved
+    
+    def track_cache_miss(self):
+        """Track a request that had to go to Bedrock because it was not cached"""
+        with self._lock:
+            self.session_data["response_cache"]["misses"] += 1
+    
+    def track_duplicates(self, count):
+        """Track images that were not sent because they duplicate another image in the run"""
+        with self._lock:
+            self.session_data["duplicate_images"] += count
+    
     def estimate_tokens(self, text, is_output=False):
         """Rough token estimation (4 chars ≈ 1 token)"""
         return len(text) // 4 if text else 0
@@ -191,9 +248,33 @@ class CostTracker:
             report.append(f"  Images: {data['images_processed']}")
             report.append(f"  Input Tokens: {data['input_tokens']:,}")
             report.append(f"  Output Tokens: {data['output_tokens']:,}")
+            if data['image_tokens']:
+                report.append(f"  Estimated Image Tokens: {data['image_tokens']:,}")
+            if data['cache_read_tokens'] or data['cache_write_tokens']:
+                report.append(f"  Prompt Cache Read Tokens: {data['cache_read_tokens']:,}")
+                report.append(f"  Prompt Cache Write Tokens: {data['cache_write_tokens']:,}")
+            if data['batch_requests']:
+                report.append(f"  Batch Inference Requests: {data['batch_requests']:,} (billed at batch price)")
             report.append(f"  Cost: ${data['cost']:.6f}")
             report.append("")
         
+        cache_data = self.session_data["response_cache"]
+        if cache_data["hits"] or cache_data["misses"]:
+            lookups = cache_data["hits"] + cache_data["misses"]
+            report.append("RESPONSE CACHE:")
+            report.append("-" * 50)
+            report.append(f"  Hits: {cache_data['hits']}")
+            report.append(f"  Misses: {cache_data['misses']}")
+            report.append(f"  Hit Rate: {cache_data['hits'] / lookups:.1%}")
+            report.append(f"  Estimated Cost Saved: ${cache_data['cost_saved']:.6f}")
+            report.append("")
+        
+        if self.session_data["duplicate_images"]:
+            report.append("DUPLICATE IMAGES:")
+            report.append("-" * 50)
+            report.append(f"  Bedrock Calls Saved: {self.session_data['duplicate_images']}")
+            report.append("")
+        
         report.append("PRICING REFERENCE:")
         report.append("-" * 50)
         for model_id, pricing in self.MODEL_PRICING.items():
@@ -0,0 +1,143 @@
+import hashlib
+import threading
+from PIL import Image
+
+"Duplicate image detection, so each distinct image is only transcribed once"
+
+# dHash grid: (HASH_SIZE + 1) x HASH_SIZE pixels give HASH_SIZE * HASH_SIZE bits
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+# Thumbnails with less contrast than this (0-255) are too uniform for their
+# dHash to mean anything (blank pages would all match), so they are only
+# matched by exact content
+MIN_HASH_CONTRAST = 8
+
+# Largest perceptual distance (differing dHash bits) accepted as a duplicate
+DEFAULT_PERCEPTUAL_DISTANCE = 4
+MAX_PERCEPTUAL_DISTANCE = 16
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 of the file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dhash(path):
+    """Perceptual difference hash of an image as a HASH_BITS-bit int
+
+    Re-encoded, resized or slightly recompressed copies of an image hash to the
+    same or nearly the same value. Returns None for near-uniform images.
+    """
+    with Image.open(path) as img:
+        # Only a tiny greyscale thumbnail is needed, so JPEGs decode at 1/8 scale
+        img.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+        small = img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    if max(pixels) - min(pixels) < MIN_HASH_CONTRAST:
+        return None
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class DuplicateFinder:
+    """Groups images with identical content, and optionally near-identical content
+
+    Images are added one at a time (so it also works on a stream of downloads);
+    add() returns the key of the earlier image an image duplicates, or None if
+    it is the first of its kind and should be transcribed.
+
+    Args:
+        perceptual_distance: Also treat images whose dHashes differ in at most
+            this many bits as duplicates. None matches identical files only.
+    """
+
+    def __init__(self, perceptual_distance=None):
+        self.perceptual_distance = perceptual_distance
+        self.duplicate_count = 0
+        self._by_sha = {}
+        self._hashes = {}
+        # With the hash split into distance + 1 bands, two hashes within the
+        # distance share at least one identical band, so only images in a shared
+        # bucket need comparing
+        self._bands = []
+        if perceptual_distance is not None:
+            band_count = perceptual_distance + 1
+            edges = [HASH_BITS * i // band_count for i in range(band_count + 1)]
+            self._bands = list(zip(edges[:-1], edges[1:]))
+        self._buckets = [{} for _ in self._bands]
+        self._lock = threading.Lock()
+
+    def _band_values(self, value):
+        for start, end in self._bands:
+            yield (value >> start) & ((1 << (end - start)) - 1)
+
+    def add(self, key, path):
+        """Register an image; returns the key of the image it duplicates, or None"""
+        sha = file_sha256(path)
+        value = None
+        if self.perceptual_distance is not None:
+            try:
+                value = dhash(path)
+            except Exception as e:
+                print(f"Could not compute a perceptual hash for {path}: {e}")
+        with self._lock:
+            original = self._by_sha.get(sha)
+            if original is None and value is not None:
+                original = self._find_similar(value)
+            if original is not None:
+                self.duplicate_count += 1
+                return original
+            self._by_sha[sha] = key
+            if value is not None:
+                self._hashes[key] = value
+                for bucket, band in zip(self._buckets, self._band_values(value)):
+                    bucket.setdefault(band, []).append(key)
+            return None
+
+    def _find_similar(self, value):
+        best = None
+        best_distance = None
+        seen = set()
+        for bucket, band in zip(self._buckets, self._band_values(value)):
+            for candidate in bucket.get(band, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = hamming_distance(value, self._hashes[candidate])
+                if distance <= self.perceptual_distance and (best is None or distance < best_distance):
+                    best, best_distance = candidate, distance
+        return best
+
+
+def group_duplicates(paths, perceptual_distance=None):
+    """Find duplicates among image paths
+
+    Returns:
+        (representatives, duplicates): indexes into paths of the images to
+        transcribe, and {index of a duplicate: index of its representative}.
+        The first image of each group (in paths order) is its representative.
+    """
+    finder = DuplicateFinder(perceptual_distance)
+    representatives = []
+    duplicates = {}
+    for index, path in enumerate(paths):
+        original = finder.add(index, path)
+        if original is None:
+            representatives.append(index)
+        else:
+            duplicates[index] = original
+    return representatives, duplicates
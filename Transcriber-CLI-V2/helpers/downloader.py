@@ -0,0 +1,368 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+"Concurrent, resumable image downloads over a pooled HTTP session, with per-host limits, timeouts and retries"
+
+DEFAULT_DOWNLOAD_WORKERS = 16
+# Most URL lists come from a single image server, so this is usually the real limit
+DEFAULT_DOWNLOADS_PER_HOST = 8
+
+# Timeouts in seconds: (connect, read between bytes)
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+
+# Attempts per URL. urllib3 retries failed connections and 429/5xx responses
+# (honouring Retry-After) up to this many times; a connection dropped
+# mid-body, which urllib3 cannot retry, gets the same number of attempts here.
+MAX_DOWNLOAD_ATTEMPTS = 4
+RETRY_BACKOFF_FACTOR = 1.0
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+CHUNK_SIZE = 64 * 1024
+
+# Appended to a file's name while it downloads, so half-written files are
+# never picked up as images
+PARTIAL_SUFFIX = ".part"
+
+# One JSON line per finished download (filename, url, size, etag,
+# last_modified). Written as downloads finish so an interrupted run can resume.
+STATE_FILENAME = ".download_state.jsonl"
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Streaming mode: downloaded images waiting for the next stage. Downloads
+# pause while the queue is full, so they never run far ahead of transcription.
+DEFAULT_STREAM_QUEUE_SIZE = 32
+
+# Marks the end of a download stream
+_END = object()
+
+# Errors while streaming the body that are worth another attempt
+_STREAM_ERRORS = (
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+
+class BodyInterrupted(requests.exceptions.ChunkedEncodingError):
+    """The response started but its body was cut off or did not arrive in full
+
+    Only these are retried by Downloader.download(); errors before the response
+    (refused connections, timeouts, 429/5xx) were already retried by urllib3.
+    """
+
+
+def download_filename(index, url):
+    """Name a downloaded file NNNN_<original name>, keeping the URL list order"""
+    original_filename = os.path.basename(urlparse(url).path) or f"image_{index}.jpg"
+    return f"{index:04d}_{original_filename}"
+
+
+def make_session(pool_size):
+    """requests.Session whose connection pool fits pool_size concurrent downloads"""
+    retries = Retry(
+        total=MAX_DOWNLOAD_ATTEMPTS - 1,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def load_download_state(download_dir):
+    """Return {filename: record} for the downloads finished in download_dir"""
+    state = {}
+    path = os.path.join(download_dir, STATE_FILENAME)
+    if not os.path.exists(path):
+        return state
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Last line cut short by an interrupted run
+                continue
+            state[record["filename"]] = record
+    return state
+
+
+class Downloader:
+    """Downloads URLs concurrently into a folder, resuming earlier runs
+
+    At most max_workers downloads run at once, and at most per_host against any
+    single host. The session's connection pool is shared by all workers.
+
+    A file already downloaded from the same URL with the recorded size is kept.
+    If the server sent an ETag or Last-Modified for it, a conditional request
+    checks it is still current (a 304 costs no image data); otherwise no request
+    is made at all. Files are written under a .part name and renamed once
+    complete.
+
+    Args:
+        download_dir: Folder the images are saved in
+        max_workers: Maximum downloads in flight at once
+        per_host: Maximum downloads in flight against one host
+        timeout: (connect, read) timeout in seconds for each request
+    """
+
+    def __init__(self, download_dir, max_workers=DEFAULT_DOWNLOAD_WORKERS, per_host=DEFAULT_DOWNLOADS_PER_HOST,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        self.download_dir = download_dir
+        self.max_workers = max(1, int(max_workers))
+        self.per_host = max(1, int(per_host))
+        self.timeout = timeout
+        self.session = make_session(self.max_workers)
+        self.state = load_download_state(download_dir) if os.path.isdir(download_dir) else {}
+        self.downloaded = 0
+        self.unchanged = 0
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.Semaphore(self.per_host)
+            return self._host_slots[host]
+
+    def _existing(self, url, filename):
+        # Previous download record for this file, if the file is still intact
+        record = self.state.get(filename)
+        if record is None or record.get("url") != url:
+            return None
+        filepath = os.path.join(self.download_dir, filename)
+        if not os.path.exists(filepath) or os.path.getsize(filepath) != record.get("size"):
+            return None
+        return record
+
+    def _record(self, record):
+        with self._lock:
+            self.state[record["filename"]] = record
+            with open(os.path.join(self.download_dir, STATE_FILENAME), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _fetch(self, url, filename, existing):
+        """Download url to filename; returns False if the existing file is still current"""
+        headers = {}
+        if existing is not None:
+            if existing.get("etag"):
+                headers["If-None-Match"] = existing["etag"]
+            if existing.get("last_modified"):
+                headers["If-Modified-Since"] = existing["last_modified"]
+        filepath = os.path.join(self.download_dir, filename)
+        partial_path = filepath + PARTIAL_SUFFIX
+        with self.session.get(url, stream=True, timeout=self.timeout, headers=headers) as response:
+            if response.status_code == 304 and existing is not None:
+                return False
+            response.raise_for_status()
+            size = 0
+            with open(partial_path, 'wb') as f:
+                try:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        size += len(chunk)
+                except _STREAM_ERRORS as e:
+                    raise BodyInterrupted(f"Connection lost after {size} bytes: {e}") from e
+            expected = response.headers.get("Content-Length")
+            if expected is not None and not response.headers.get("Content-Encoding") and int(expected) != size:
+                raise BodyInterrupted(f"Received {size} of {expected} bytes")
+            os.replace(partial_path, filepath)
+            self._record({
+                "filename": filename,
+                "url": url,
+                "size": size,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            })
+        return True
+
+    def download(self, url, filename):
+        """Download one URL to download_dir/filename unless it is already there
+
+        Returns:
+            (file path, True if it was downloaded now or False if the earlier copy was kept)
+
+        Raises the last error if every attempt fails (no partial file is left behind).
+        """
+        filepath = os.path.join(self.download_dir, filename)
+        partial_path = filepath + PARTIAL_SUFFIX
+        existing = self._existing(url, filename)
+        if existing is not None and not existing.get("etag") and not existing.get("last_modified"):
+            # Nothing to revalidate with; the recorded size is all we can check
+            with self._lock:
+                self.unchanged += 1
+            return filepath, False
+        with self._host_slot(url):
+            for attempt in range(1, MAX_DOWNLOAD_ATTEMPTS + 1):
+                try:
+                    fetched = self._fetch(url, filename, existing)
+                except BodyInterrupted:
+                    if os.path.exists(partial_path):
+                        os.remove(partial_path)
+                    if attempt == MAX_DOWNLOAD_ATTEMPTS:
+                        raise
+                    time.sleep(RETRY_BACKOFF_FACTOR * (2 ** (attempt - 1)))
+                    continue
+                except Exception:
+                    if os.path.exists(partial_path):
+                        os.remove(partial_path)
+                    raise
+                with self._lock:
+                    if fetched:
+                        self.downloaded += 1
+                    else:
+                        self.unchanged += 1
+                return filepath, fetched
+
+    def _compact_state(self, filenames):
+        # Rewrite the state file with one line per file still in the list
+        path = os.path.join(self.download_dir, STATE_FILENAME)
+        with self._lock:
+            records = [self.state[name] for name in filenames if name in self.state]
+            with open(path + PARTIAL_SUFFIX, 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(path + PARTIAL_SUFFIX, path)
+
+    def remove_stale(self, filenames):
+        """Delete images and partial files in download_dir that are not in filenames"""
+        keep = set(filenames)
+        removed = 0
+        for name in os.listdir(self.download_dir):
+            path = os.path.join(self.download_dir, name)
+            if not os.path.isfile(path) or name in keep:
+                continue
+            if name.endswith(PARTIAL_SUFFIX) or name.lower().endswith(IMAGE_EXTENSIONS):
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def download_all(self, urls, on_download=None, stop_event=None):
+        """Download every URL, keeping the NNNN_ prefix from its position in urls
+
+        Args:
+            urls: URLs in list order
+            on_download: Optional callback on_download(index, file path, url), called
+                from a download thread as each image is ready (index starts at 1)
+            stop_event: Optional threading.Event; once set, no new downloads start
+
+        Returns:
+            Dict of saved filename -> URL, in URL list order, for the images that downloaded
+        """
+        os.makedirs(self.download_dir, exist_ok=True)
+        filenames = [download_filename(i, url) for i, url in enumerate(urls, 1)]
+        removed = self.remove_stale(filenames)
+        if removed:
+            print(f"Removed {removed} file(s) left over from a different URL list")
+        done = [False] * len(urls)
+        finished = [0]
+        print_lock = threading.Lock()
+
+        def worker(slot):
+            if stop_event is not None and stop_event.is_set():
+                return
+            url = urls[slot]
+            error = None
+            try:
+                _, fetched = self.download(url, filenames[slot])
+                done[slot] = True
+            except Exception as e:
+                error = e
+            with print_lock:
+                finished[0] += 1
+                if error is None:
+                    action = "Downloaded" if fetched else "Already downloaded"
+                    print(f"{action} {finished[0]}/{len(urls)}: {filenames[slot]}")
+                else:
+                    print(f"Failed to download {url}: {error}")
+            if error is None and on_download is not None:
+                on_download(slot + 1, os.path.join(self.download_dir, filenames[slot]), url)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(worker, range(len(urls))))
+
+        self._compact_state(filenames)
+        if self.unchanged:
+            print(f"Kept {self.unchanged} image(s) from an earlier run, downloaded {self.downloaded}")
+        return {filename: url for filename, url, ok in zip(filenames, urls, done) if ok}
+
+    def stream(self, urls, maxsize=DEFAULT_STREAM_QUEUE_SIZE):
+        """Download urls in the background, yielding (index, file path, url) as each image is ready
+
+        Images come out in the order they finish, not list order. At most maxsize
+        downloaded images wait to be taken; downloads pause until there is room.
+        Stopping the iteration early stops any downloads that have not started.
+        Once every URL has been tried, url_map.json in download_dir is updated.
+        """
+        ready = queue.Queue(maxsize=max(1, int(maxsize)))
+        stop_event = threading.Event()
+        downloaded = {}
+
+        def on_download(index, filepath, url):
+            while not stop_event.is_set():
+                try:
+                    ready.put((index, filepath, url), timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+        def run():
+            try:
+                downloaded.update(self.download_all(urls, on_download=on_download, stop_event=stop_event))
+            except Exception as e:
+                print(f"Downloads stopped: {e}")
+            finally:
+                while not stop_event.is_set():
+                    try:
+                        ready.put(_END, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+
+        thread = threading.Thread(target=run, name="downloads", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = ready.get()
+                if item is _END:
+                    break
+                yield item
+        finally:
+            stop_event.set()
+            thread.join()
+            save_url_map(self.download_dir, downloaded)
+
+
+def save_url_map(download_dir, downloaded):
+    """Merge {filename: url} into download_dir/url_map.json, used to add image URLs to the JSON/CSV output"""
+    try:
+        map_path = os.path.join(download_dir, 'url_map.json')
+        url_map = {}
+        if os.path.exists(map_path):
+            try:
+                with open(map_path, 'r', encoding='utf-8') as mf:
+                    url_map = json.load(mf)
+            except ValueError:
+                print("Warning: Existing URL map is unreadable, starting a new one")
+        url_map.update(downloaded)
+        with open(map_path + '.tmp', 'w', encoding='utf-8') as mf:
+            json.dump(dict(sorted(url_map.items())), mf, indent=2, ensure_ascii=False)
+        os.replace(map_path + '.tmp', map_path)
+        print(f"Saved URL map to {map_path}")
+    except Exception as e:
+        print(f"Warning: Could not save URL map: {e}")
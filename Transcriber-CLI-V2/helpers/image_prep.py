@@ -0,0 +1,358 @@
+import io
+import math
+import os
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+"Image preparation for Bedrock requests: decode once, convert, resize and encode once"
+
+# Size every transcription image was resized to before sizing became model-aware.
+# Still used when no model is given.
+STANDARD_IMAGE_SIZE = (1120, 1120)
+
+# Cross-region inference profile prefixes in front of the model provider
+REGION_PREFIXES = ("us.", "eu.", "apac.", "global.")
+
+# How each model family is sent images, keyed by model ID prefix (without the
+# region prefix). Images keep their aspect ratio and are only ever scaled down:
+#   long_edge:  longest side sent. 1120 keeps label text as sharp along the long
+#               side as the old 1120x1120 standard, without stretching the sheet
+#   max_pixels: area cap, past which the model would downscale it anyway
+#   tokens:     how the model bills image tokens
+#       ("pixels", n)         - width * height / n
+#       ("patches", p)        - one token per p x p patch, plus one per patch row
+#       ("tiles", size, each, max_tiles) - size x size tiles, `each` tokens per tile
+#       ("fixed", n)          - always n tokens (the model resizes internally)
+IMAGE_SIZING_POLICIES = {
+    "anthropic.claude": {"long_edge": 1120, "max_pixels": 1_150_000, "tokens": ("pixels", 750)},
+    "amazon.nova": {"long_edge": 1120, "max_pixels": 1_150_000, "tokens": ("pixels", 784)},
+    "meta.llama3-2": {"long_edge": 1120, "max_pixels": 1120 * 1120, "tokens": ("tiles", 560, 1601, 4)},
+    "meta.llama4": {"long_edge": 1120, "max_pixels": 1120 * 1120, "tokens": ("tiles", 336, 144, 16)},
+    "mistral.": {"long_edge": 1024, "max_pixels": 1024 * 1024, "tokens": ("patches", 16)},
+    "qwen.": {"long_edge": 1120, "max_pixels": 1_003_520, "tokens": ("pixels", 784)},
+    "google.gemma": {"long_edge": 896, "max_pixels": 896 * 896, "tokens": ("fixed", 256)},
+}
+DEFAULT_SIZING_POLICY = {"long_edge": 1120, "max_pixels": 1_150_000, "tokens": ("pixels", 750)}
+
+# Image formats Bedrock accepts that are worth sending, and their Pillow names.
+# PNG is lossless but several times larger than JPEG or WebP for photographed sheets.
+IMAGE_FORMATS = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP"}
+DEFAULT_IMAGE_FORMAT = "png"
+DEFAULT_IMAGE_QUALITY = 90  # JPEG/WebP quality (1-100), ignored for PNG
+
+# Wire format used when prepare_image() is not given one (set from Performance Settings)
+_wire_format = {"format": DEFAULT_IMAGE_FORMAT, "quality": DEFAULT_IMAGE_QUALITY}
+
+DEFAULT_PREPARED_CACHE_BYTES = 256 * 1024 * 1024  # 256 MB
+
+
+def configure_image_format(image_format=None, quality=None):
+    """Change the format and quality images are sent to Bedrock in"""
+    if image_format is not None:
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format {image_format!r}, choose from {', '.join(IMAGE_FORMATS)}")
+        _wire_format["format"] = image_format
+    if quality is not None:
+        _wire_format["quality"] = max(1, min(100, int(quality)))
+
+
+def get_image_format():
+    """Return the configured wire format name ("png", "jpeg" or "webp")"""
+    return _wire_format["format"]
+
+
+def get_sizing_policy(model_id):
+    """Return the sizing policy for a model ID (the default policy if it is not listed)"""
+    if not model_id:
+        return DEFAULT_SIZING_POLICY
+    base_id = model_id
+    if base_id.startswith(REGION_PREFIXES):
+        base_id = base_id.split(".", 1)[1]
+    matches = [prefix for prefix in IMAGE_SIZING_POLICIES if base_id.startswith(prefix)]
+    if not matches:
+        return DEFAULT_SIZING_POLICY
+    return IMAGE_SIZING_POLICIES[max(matches, key=len)]
+
+
+def fit_image_size(model_id, width, height):
+    """Return the (width, height) an image of this size is sent at for model_id"""
+    policy = get_sizing_policy(model_id)
+    scale = min(1.0,
+                policy["long_edge"] / max(width, height),
+                math.sqrt(policy["max_pixels"] / (width * height)))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def estimate_image_tokens(model_id, width, height):
+    """Estimate the input tokens model_id bills for an image sent at width x height"""
+    kind, *params = get_sizing_policy(model_id)["tokens"]
+    if kind == "pixels":
+        return math.ceil(width * height / params[0])
+    if kind == "patches":
+        patch = params[0]
+        rows, cols = math.ceil(height / patch), math.ceil(width / patch)
+        return rows * cols + rows
+    if kind == "tiles":
+        size, each, max_tiles = params
+        tiles = min(max_tiles, math.ceil(width / size) * math.ceil(height / size))
+        return tiles * each
+    return params[0]
+
+
+class PreparedImageCache:
+    """In-memory cache of prepared images with least-recently-used eviction
+
+    Keyed by the source file (path, modification time and size) plus everything
+    that changes the output: target size rule, format and quality. In two shot
+    runs the verifier gets the exact bytes the first pass sent, without decoding
+    and resizing the scan again.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_PREPARED_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (image_bytes, (width, height))
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(image_path, model_id, image_format, quality):
+        stat = os.stat(image_path)
+        if model_id:
+            policy = get_sizing_policy(model_id)
+            sizing = (policy["long_edge"], policy["max_pixels"])
+        else:
+            sizing = STANDARD_IMAGE_SIZE
+        quality = None if image_format == "png" else quality
+        return (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size, sizing, image_format, quality)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        size = len(entry[0])
+        with self._lock:
+            if size > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= len(old[0])
+            self._entries[key] = entry
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def summary(self):
+        """One-line description of how often prepared images were reused"""
+        return (f"Prepared image cache: {self.hits} reused, {self.misses} prepared "
+                f"({self._total_bytes / (1024 * 1024):.1f} MB held)")
+
+
+# Global prepared image cache, shared by First Shot and Second Shot
+prepared_image_cache = PreparedImageCache()
+
+
+def configure_prepared_image_cache(max_bytes=None):
+    """Start a new run's prepared image cache, optionally with a new size bound"""
+    prepared_image_cache.clear()
+    if max_bytes is not None:
+        prepared_image_cache.max_bytes = max_bytes
+    return prepared_image_cache
+
+
+def encode_image(img, image_format=None, quality=None):
+    """Encode a decoded RGB image in the wire format (the configured one by default)"""
+    image_format = image_format or _wire_format["format"]
+    quality = quality or _wire_format["quality"]
+    img_byte_arr = io.BytesIO()
+    if image_format == "png":
+        img.save(img_byte_arr, format="PNG")
+    else:
+        img.save(img_byte_arr, format=IMAGE_FORMATS[image_format], quality=quality)
+    return img_byte_arr.getvalue()
+
+
+def _prepare_uncached(image_path, model_id, image_format, quality, reduced_decode=True):
+    # The actual decode/resize/encode; top level so process pool workers can run it
+    with Image.open(image_path) as img:
+        # The header gives the full size before any pixels are decoded
+        target_size = fit_image_size(model_id, *img.size) if model_id else STANDARD_IMAGE_SIZE
+        if reduced_decode:
+            # JPEGs are decoded at 1/2, 1/4 or 1/8 scale (libjpeg DCT scaling)
+            # when that is still at least target_size; no-op for other formats
+            img.draft('RGB', target_size)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        if img.size != target_size:
+            img = img.resize(target_size, Image.Resampling.LANCZOS)
+        else:
+            img.load()
+    return encode_image(img, image_format, quality), img.size
+
+
+def prepare_image(image_path, model_id=None, return_size=False, image_format=None, quality=None, use_cache=True,
+                  reduced_decode=True):
+    """Return the encoded bytes sent to Bedrock for an image file
+
+    The file is decoded once and encoded once. With a model_id the image is
+    scaled down to that model's sizing policy keeping its aspect ratio; without
+    one it is resized to STANDARD_IMAGE_SIZE as before. The image is encoded in
+    image_format at quality, or the configured wire format if not given. With
+    return_size, returns (image_bytes, (width, height)).
+
+    Large JPEGs are decoded at a reduced scale that is still at least the target
+    size, so full resolution is only decoded when the target needs it. Pass
+    reduced_decode=False to always decode at full resolution.
+
+    Results are kept in the prepared image cache unless use_cache is False, and
+    images an active ImagePrefetcher has already prepared are taken from it.
+    """
+    image_format = image_format or _wire_format["format"]
+    quality = quality or _wire_format["quality"]
+    # Cached and prefetched images were all decoded at reduced scale
+    use_cache = use_cache and reduced_decode and prepared_image_cache.max_bytes > 0
+    prefetchers = list(_active_prefetchers) if reduced_decode else []
+    key = None
+    if use_cache or prefetchers:
+        key = PreparedImageCache.make_key(image_path, model_id, image_format, quality)
+
+    prepared = prepared_image_cache.get(key) if use_cache else None
+    if prepared is None:
+        for prefetcher in prefetchers:
+            prepared = prefetcher.take(key)
+            if prepared is not None:
+                break
+        if prepared is None:
+            prepared = _prepare_uncached(image_path, model_id, image_format, quality, reduced_decode)
+        if use_cache:
+            prepared_image_cache.put(key, prepared)
+    return prepared if return_size else prepared[0]
+
+
+def default_preprocess_workers():
+    """One preprocessing process per core, leaving one core for the API threads"""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+# Starting worker processes costs more than preparing a handful of images inline
+MIN_PREFETCH_IMAGES = 4
+
+
+def preprocess_workers_for(image_count, workers):
+    """Worker processes worth starting for image_count images (None if not known): 0 for small runs"""
+    if not workers:
+        return 0
+    if image_count is None:
+        return workers
+    if image_count < MIN_PREFETCH_IMAGES:
+        return 0
+    return min(workers, image_count)
+
+
+class ImagePrefetcher:
+    """Prepares upcoming images in a process pool ahead of the API workers
+
+    Images are submitted in the order they will be sent, at most depth ahead
+    of the ones already taken, so memory stays bounded while the decode and
+    resize work runs on other cores. prepare_image() takes finished images from
+    any active prefetcher (use it as a context manager). Images asked for before
+    the prefetcher got to them are prepared inline and not prefetched again.
+
+    Args:
+        image_paths: Images in the order they will be requested (more can be
+            queued later with add())
+        model_id: Model the images are sized for
+        workers: Number of worker processes
+        depth: Maximum number of images prepared (or being prepared) but not yet taken
+    """
+
+    def __init__(self, image_paths, model_id=None, image_format=None, quality=None, workers=None, depth=8):
+        self.model_id = model_id
+        self.image_format = image_format or _wire_format["format"]
+        self.quality = quality or _wire_format["quality"]
+        self.workers = workers or default_preprocess_workers()
+        self.depth = max(1, int(depth))
+        self.prefetched = 0
+        self._paths = list(image_paths)
+        self._keys = [PreparedImageCache.make_key(path, model_id, self.image_format, self.quality)
+                      for path in self._paths]
+        # How many times each key appears in _keys[_next:], i.e. is still to be submitted
+        self._unsubmitted = Counter(self._keys)
+        self._next = 0
+        self._futures = {}
+        self._skipped = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def __enter__(self):
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        with self._lock:
+            self._fill()
+        _active_prefetchers.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _active_prefetchers.remove(self)
+        with self._lock:
+            self._futures.clear()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        return False
+
+    def _fill(self):
+        # Called with the lock held
+        while len(self._futures) < self.depth and self._next < len(self._paths):
+            key = self._keys[self._next]
+            path = self._paths[self._next]
+            self._next += 1
+            self._unsubmitted[key] -= 1
+            if key in self._skipped or key in self._futures:
+                continue
+            self._futures[key] = self._executor.submit(
+                _prepare_uncached, path, self.model_id, self.image_format, self.quality
+            )
+
+    def add(self, image_path):
+        """Queue another image, for images that arrive while the prefetcher runs"""
+        with self._lock:
+            self._paths.append(image_path)
+            key = PreparedImageCache.make_key(image_path, self.model_id, self.image_format, self.quality)
+            self._keys.append(key)
+            self._unsubmitted[key] += 1
+            self._fill()
+
+    def take(self, key):
+        """Return (image_bytes, size) for key if this prefetcher has it, waiting if needed"""
+        with self._lock:
+            future = self._futures.pop(key, None)
+            if future is None:
+                # Not submitted yet (or not ours): make sure it is not prepared twice
+                if self._unsubmitted[key] > 0:
+                    self._skipped.add(key)
+                return None
+            self._fill()
+        prepared = future.result()
+        with self._lock:
+            self.prefetched += 1
+        return prepared
+
+
+# Prefetchers currently feeding prepare_image()
+_active_prefetchers = []
@@ -4,8 +4,10 @@ import uuid
 from datetime import datetime
 from pathlib import Path
 
-def create_json_response(image_name, transcription_text, model_id, input_tokens=0, output_tokens=0, image_url=None):
-    """Create a JSON response in the specified format, optionally including image_url"""
+def create_json_response(image_name, transcription_text, model_id, input_tokens=0, output_tokens=0, image_url=None,
+                         cache_creation_input_tokens=0, cache_read_input_tokens=0, request_stats=None,
+                         estimated_image_tokens=None):
+    """Create a JSON response in the specified format, optionally including image_url and request_stats"""
     
     # Generate a unique message ID
     msg_id = f"msg_bdrk_{uuid.uuid4().hex[:24]}"
@@ -26,8 +28,8 @@ def create_json_response(image_name, transcription_text, model_id, input_tokens=
         "stop_sequence": None,
         "usage": {
             "input_tokens": input_tokens,
-            "cache_creation_input_tokens": 0,
-            "cache_read_input_tokens": 0,
+            "cache_creation_input_tokens": cache_creation_input_tokens,
+            "cache_read_input_tokens": cache_read_input_tokens,
             "output_tokens": output_tokens
         },
         "image_name": image_name,
@@ -38,13 +40,27 @@ def create_json_response(image_name, transcription_text, model_id, input_tokens=
     if image_url:
         json_response["image_url"] = image_url
     
+    # Image tokens estimated from the size the image was sent at, if provided
+    if estimated_image_tokens is not None:
+        json_response["usage"]["estimated_image_tokens"] = estimated_image_tokens
+    
+    # Attempt count and latency of the Bedrock call, if provided
+    if request_stats:
+        json_response["request"] = dict(request_stats)
+    
     return json_response
 
-def save_json_transcription(output_dir, date_folder, shot_type, image_name, transcription_text, model_id, input_tokens=0, output_tokens=0, image_url=None):
+def save_json_transcription(output_dir, date_folder, shot_type, image_name, transcription_text, model_id, input_tokens=0, output_tokens=0, image_url=None,
+                            cache_creation_input_tokens=0, cache_read_input_tokens=0, request_stats=None,
+                            estimated_image_tokens=None):
     """Save individual JSON transcription file"""
     
     # Create JSON response
-    json_response = create_json_response(image_name, transcription_text, model_id, input_tokens, output_tokens, image_url=image_url)
+    json_response = create_json_response(image_name, transcription_text, model_id, input_tokens, output_tokens, image_url=image_url,
+                                         cache_creation_input_tokens=cache_creation_input_tokens,
+                                         cache_read_input_tokens=cache_read_input_tokens,
+                                         request_stats=request_stats,
+                                         estimated_image_tokens=estimated_image_tokens)
     
     # Create individual JSON file for this transcription
     json_filename = f"{Path(image_name).stem}_transcription.json"
@@ -55,6 +71,36 @@ def save_json_transcription(output_dir, date_folder, shot_type, image_name, tran
     
     return json_filepath
 
+def create_duplicate_response(json_response, image_name, image_url=None):
+    """Copy a transcription (or error record) to a duplicate of its image
+    
+    The copy gets its own id, image_name and image_url, records which image was
+    actually sent under duplicate_of, and has zero usage since no request was made.
+    """
+    duplicate = json.loads(json.dumps(json_response))
+    duplicate["duplicate_of"] = json_response.get("image_name")
+    duplicate["image_name"] = image_name
+    duplicate.pop("image_url", None)
+    duplicate.pop("request", None)
+    if image_url:
+        duplicate["image_url"] = image_url
+    if "id" in duplicate:
+        duplicate["id"] = f"msg_bdrk_{uuid.uuid4().hex[:24]}"
+        duplicate["timestamp"] = datetime.utcnow().isoformat() + "Z"
+    if "usage" in duplicate:
+        duplicate["usage"] = {key: 0 for key in duplicate["usage"]}
+    return duplicate
+
+def save_json_response(output_dir, image_name, json_response):
+    """Save an already built JSON response under the usual per-image filename"""
+    json_filename = f"{Path(image_name).stem}_transcription.json"
+    json_filepath = output_dir / json_filename
+    
+    with open(json_filepath, 'w', encoding='utf-8') as f:
+        json.dump(json_response, f, indent=2, ensure_ascii=False)
+    
+    return json_filepath
+
 def create_batch_json_file(output_dir, date_folder, shot_type, all_transcriptions):
     """Create a single JSON file containing all transcriptions"""
     
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from helpers.cost_analysis import get_output_base_path
+
+"On-disk cache of Bedrock transcription responses, so re-running a folder does not re-pay for identical calls"
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+
+
+def _sha256(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResponseCache:
+    """Content-addressed response cache with least-recently-used eviction
+
+    Entries are small JSON files named by the hash of (image bytes, prompt text,
+    model ID, temperature, request layout). Reading an entry marks it as recently
+    used; once the cache grows past max_bytes the least recently used entries are
+    deleted. Responses sampled at a temperature above zero are only cached with
+    cache_sampled, since replaying one would repeat a single sample on every re-run.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, enabled=True, cache_sampled=False):
+        self.cache_dir = Path(cache_dir) if cache_dir else get_output_base_path() / ".response_cache"
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.cache_sampled = cache_sampled
+        self._lock = threading.Lock()
+        self._index = None  # key -> size in bytes, least recently used first
+        self._total_bytes = 0
+
+    def used_for(self, temperature):
+        """Whether requests sent at this temperature read and write the cache"""
+        return self.enabled and (float(temperature) == 0.0 or self.cache_sampled)
+
+    @staticmethod
+    def make_key(image_bytes, prompt_text, model_id, temperature, layout="image-first", images_per_request=1):
+        """Build the cache key for one request
+
+        layout is how the message is arranged ("image-first", or "prompt-first"
+        when a prompt cache point leads it) and images_per_request how many
+        images the request carries, so differently shaped requests never share
+        a response.
+        """
+        parts = [_sha256(image_bytes), _sha256(prompt_text), model_id, repr(float(temperature)),
+                 layout, str(images_per_request)]
+        return _sha256("|".join(parts))
+
+    def _entry_path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def _load_index(self):
+        # Called with the lock held. File access times are unreliable across
+        # platforms, so modification time (refreshed on every hit) orders the LRU.
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        if not self.cache_dir.exists():
+            return
+        entries = []
+        for entry in self.cache_dir.glob("*.json"):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, entry.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+
+    def get(self, key):
+        """Return the cached entry for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            if key not in self._index:
+                return None
+            path = self._entry_path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                os.utime(path, None)
+            except (OSError, ValueError):
+                # Unreadable or half-written entry, drop it
+                self._total_bytes -= self._index.pop(key, 0)
+                return None
+            self._index.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        """Store an entry and evict old ones if the cache is over its size bound"""
+        if not self.enabled:
+            return
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self._entry_path(key)
+            # Write to a temp file and rename so readers never see a partial entry
+            temp_path = path.with_name(f"{key}.{uuid.uuid4().hex}.tmp")
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self._total_bytes -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        # Called with the lock held
+        while self._total_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                self._entry_path(key).unlink()
+            except OSError:
+                pass
+
+
+# Global response cache instance
+response_cache = ResponseCache()
+
+
+def configure_response_cache(enabled=None, max_bytes=None, cache_dir=None, cache_sampled=None):
+    """Change the global cache settings (used by the CLI's Performance Settings)"""
+    with response_cache._lock:
+        if enabled is not None:
+            response_cache.enabled = enabled
+        if cache_sampled is not None:
+            response_cache.cache_sampled = cache_sampled
+        if max_bytes is not None:
+            response_cache.max_bytes = max_bytes
+        if cache_dir is not None and Path(cache_dir) != response_cache.cache_dir:
+            response_cache.cache_dir = Path(cache_dir)
+            response_cache._index = None
+        if response_cache._index is not None:
+            response_cache._evict()
+    return response_cache
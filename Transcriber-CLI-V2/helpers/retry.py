@@ -0,0 +1,192 @@
+import random
+import threading
+import time
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, HTTPClientError
+from helpers.throttling import is_throttling_error, get_retry_after, set_current_limiter
+
+"Retries for Bedrock calls: classifies errors, backs off with jitter and keeps per-image and per-run budgets"
+
+# Error classes returned by classify_error()
+THROTTLE = "throttle"
+RETRYABLE = "retryable"
+FATAL = "fatal"
+
+# The run retry budget allows one retry per RETRIES_PER_IMAGE_DIVISOR images,
+# but never fewer than MIN_RUN_RETRIES
+MIN_RUN_RETRIES = 20
+RETRIES_PER_IMAGE_DIVISOR = 2
+
+# Bedrock error codes that are worth another attempt
+RETRYABLE_ERROR_CODES = {
+    "InternalServerException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+    "ModelErrorException",
+    "RequestTimeout",
+    "RequestTimeoutException",
+}
+
+
+def classify_error(error):
+    """Sort an exception from a Bedrock call into THROTTLE, RETRYABLE or FATAL
+
+    Validation, permission and missing-model errors are FATAL because trying
+    again would fail the same way. So is anything that is not a botocore error
+    (bad image files, unreadable prompts, etc).
+    """
+    if is_throttling_error(error):
+        return THROTTLE
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        if code in RETRYABLE_ERROR_CODES or status >= 500:
+            return RETRYABLE
+        return FATAL
+    # Timeouts, dropped connections and DNS/endpoint failures
+    if isinstance(error, (BotocoreConnectionError, HTTPClientError)):
+        return RETRYABLE
+    return FATAL
+
+
+class RetryFailure(Exception):
+    """Raised when a call fails for good; wraps the last error with attempt stats"""
+
+    def __init__(self, error, attempts, total_seconds, reason):
+        self.error = error
+        self.attempts = attempts
+        self.total_seconds = total_seconds
+        self.reason = reason
+        message = str(error)
+        if attempts > 1:
+            message = f"{message} (gave up after {attempts} attempts: {reason})"
+        super().__init__(message)
+
+
+class RetryBudget:
+    """Caps the total number of retries across a whole run"""
+
+    def __init__(self, max_retries):
+        self.max_retries = max_retries
+        self.used = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_images(cls, image_count=0):
+        budget = cls(MIN_RUN_RETRIES)
+        budget.resize_for(image_count)
+        return budget
+
+    def resize_for(self, image_count):
+        """Grow the budget to fit a run of image_count images (used when the count is not known upfront)"""
+        with self._lock:
+            self.max_retries = max(self.max_retries, MIN_RUN_RETRIES, int(image_count) // RETRIES_PER_IMAGE_DIVISOR)
+
+    def try_spend(self):
+        with self._lock:
+            if self.used >= self.max_retries:
+                return False
+            self.used += 1
+            return True
+
+
+class RetryPolicy:
+    """How a single image's Bedrock call is retried
+
+    Transient errors are retried up to max_attempts in total per image and only
+    while the run-wide budget lasts. Throttles do not use the run budget: the
+    concurrency limiter already slows the whole run down, so throttled images
+    keep retrying (up to max_throttle_retries) instead of failing.
+    """
+
+    def __init__(self, max_attempts=4, max_throttle_retries=10, base_delay=1.0, max_delay=60.0, budget=None):
+        self.max_attempts = max_attempts
+        self.max_throttle_retries = max_throttle_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.retry_count = 0
+        self.failure_count = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_run(cls, image_count=None):
+        """Policy with a run budget sized for image_count images"""
+        return cls(budget=RetryBudget.for_images(image_count or 0))
+
+    def backoff(self, attempt):
+        # Exponential backoff with full jitter so workers do not retry in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, func, *args, limiter=None, **kwargs):
+        """Call func, retrying transient failures
+
+        If a limiter is given, the Bedrock calls func makes through
+        helpers.throttling.limited_call() each take one of its concurrency
+        slots, and the limiter is told about their successes and throttles.
+
+        Returns:
+            (result, stats) where stats has the attempt count, the latency of
+            the final attempt and the total time including backoff
+
+        Raises:
+            RetryFailure: when the error is fatal or the retry budget runs out
+        """
+        start = time.monotonic()
+        attempts = 0
+        throttle_retries = 0
+        while True:
+            attempts += 1
+            previous_limiter = set_current_limiter(limiter)
+            attempt_start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                error = e
+                kind = classify_error(e)
+                retry_after = get_retry_after(e) if kind == THROTTLE else None
+            else:
+                return result, {
+                    "attempts": attempts,
+                    "latency_seconds": round(time.monotonic() - attempt_start, 3),
+                    "total_seconds": round(time.monotonic() - start, 3),
+                }
+            finally:
+                set_current_limiter(previous_limiter)
+
+            reason = self._give_up_reason(kind, attempts, throttle_retries)
+            if reason:
+                with self._lock:
+                    self.failure_count += 1
+                raise RetryFailure(error, attempts, round(time.monotonic() - start, 3), reason) from error
+
+            if kind == THROTTLE:
+                throttle_retries += 1
+                delay = retry_after if retry_after else self.backoff(throttle_retries - 1)
+            else:
+                delay = self.backoff(attempts - 1)
+            with self._lock:
+                self.retry_count += 1
+            print(f"{'Throttled by Bedrock' if kind == THROTTLE else f'Transient error ({error})'}, "
+                  f"retrying in {delay:.1f}s (attempt {attempts + 1})")
+            time.sleep(delay)
+
+    def _give_up_reason(self, kind, attempts, throttle_retries):
+        if kind == FATAL:
+            return "error is not retryable"
+        if kind == THROTTLE:
+            if throttle_retries >= self.max_throttle_retries:
+                return "still throttled"
+            return None
+        if attempts >= self.max_attempts:
+            return "per-image retry limit reached"
+        if self.budget is not None and not self.budget.try_spend():
+            return "run retry budget used up"
+        return None
+
+    def summary(self):
+        """One-line description of retries in this run"""
+        text = f"Retried {self.retry_count} time(s), {self.failure_count} call(s) failed for good"
+        if self.budget is not None:
+            text += f"; run retry budget used {self.budget.used}/{self.budget.max_retries}"
+        return text
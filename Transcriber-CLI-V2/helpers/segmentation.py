@@ -1,15 +1,36 @@
 # segmentation_with_orientation.py
 import os
 import glob
+import heapq
 import json
 import cv2
 import numpy as np
 import base64
+import queue
 import threading
-from openvino import Core
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from openvino import AsyncInferQueue, Core
+import openvino.properties.hint as hints
 import pytesseract
 from math import degrees
 
+# Detector input size (the model was exported for 640x640)
+DETECTION_INPUT_SIZE = 640
+
+# Images per detector call in process_images_segmentation. Larger batches use
+# the CPU's cores and vector units better, but every image in a batch is held
+# decoded at full resolution until the batch is done
+DEFAULT_DETECTION_BATCH_SIZE = 4
+
+# Images segment_many() keeps decoded at once, from decoding until they are
+# yielded (queued for inference, in inference and being cropped)
+DEFAULT_PIPELINE_IMAGES = 16
+
+# Crops are shrunk to at most this long side for Tesseract's orientation and
+# script detection (OSD), which only needs the shape of the text lines
+OSD_MAX_SIDE = 1200
+
 
 class Segmentation:
 
@@ -30,6 +51,9 @@ class Segmentation:
         auto_orient: bool = True,
         deskew: bool = True,
         blank_score_cutoff: float = 40.0,
+        osd_min_confidence: float = 2.0,
+        batch_size: int = 1,
+        throughput: bool = False,
     ):
         self.engine = engine
         self.hide_long_objects = hide_long_objects
@@ -41,93 +65,270 @@ class Segmentation:
         self.auto_orient = auto_orient
         self.deskew = deskew
         self.blank_score_cutoff = blank_score_cutoff
+        # OSD answers below this orientation confidence fall back to scoring all
+        # four rotations with OCR; None always uses the four-way OCR
+        self.osd_min_confidence = osd_min_confidence
+        # Set once OSD fails for a reason that would fail every crop (e.g. no osd.traineddata)
+        self._osd_unavailable = threading.Event()
+        self.orientation_stats = {"osd": 0, "osd_kept_original": 0, "four_way": 0}
+        self._orientation_lock = threading.Lock()
 
         self.core = Core()
         self.model = self.core.read_model(model=model_xml_path)
-        self.compiled_model = self.core.compile_model(self.model, device_name="CPU")
+        # A dynamic batch dimension lets one infer call take up to batch_size
+        # images (a short last batch included)
+        self.batch_size = max(1, batch_size)
+        if self.batch_size > 1:
+            self.model.reshape([-1, 3, DETECTION_INPUT_SIZE, DETECTION_INPUT_SIZE])
+        # The THROUGHPUT hint splits the CPU into several inference streams, each
+        # serving one of the async queue's requests, instead of giving every core
+        # to a single request
+        config = {hints.performance_mode: hints.PerformanceMode.THROUGHPUT} if throughput else {}
+        self.compiled_model = self.core.compile_model(self.model, device_name="CPU", config=config)
         self.input_layer = self.compiled_model.input(0)
         self.output_layer = self.compiled_model.output(0)
 
+        # Synchronous calls (get_bounding_boxes, detect_batch) share the compiled
+        # model's one implicit request; segment_many() uses the async queue instead
         self.inference_lock = threading.Lock()
+        self.infer_queue = AsyncInferQueue(self.compiled_model)  # the device's optimal request count
 
     # ───────────── Pre- and post-processing helpers ─────────────
     def preprocess_image(self, image):
-        resized = cv2.resize(image, (640, 640))
+        resized = cv2.resize(image, (DETECTION_INPUT_SIZE, DETECTION_INPUT_SIZE))
         img = resized.transpose(2, 0, 1)
         img = np.expand_dims(img, axis=0).astype(np.float32) / 255.0
         return img
 
-    def get_bounding_boxes(self, image_path):
-        original_image = cv2.imread(image_path)
-        if original_image is None:
-            raise ValueError(f"Image not found at {image_path}")
-        original_height, original_width, _ = original_image.shape
-        input_tensor = self.preprocess_image(original_image)
-
-        with self.inference_lock:
-            outputs = self.compiled_model([input_tensor])[self.output_layer]
-        predictions = np.squeeze(outputs).T
-
-        boxes, confidences, class_ids = [], [], []
-        x_scale, y_scale = original_width / 640, original_height / 640
-
-        for pred in predictions:
-            box_coords, class_probs = pred[:4], pred[4:]
-            class_id = np.argmax(class_probs)
-            confidence = class_probs[class_id]
-            if confidence > 0.25:
-                cx, cy, w, h = box_coords
-                x1 = int((cx - w / 2) * x_scale)
-                y1 = int((cy - h / 2) * y_scale)
-                x2 = int((cx + w / 2) * x_scale)
-                y2 = int((cy + h / 2) * y_scale)
-                boxes.append([x1, y1, x2 - x1, y2 - y1])
-                confidences.append(float(confidence))
-                class_ids.append(class_id)
-
-        indices = cv2.dnn.NMSBoxes(boxes, confidences, 0.25, 0.45)
+    def postprocess_predictions(self, predictions, original_shape):
+        """Turn one image's raw detector output into {class name: [[x1, y1, x2, y2], ...]}
+
+        predictions is (anchors, 4 + classes): cx, cy, w, h, then one score per class.
+        """
+        original_height, original_width = original_shape[:2]
+        x_scale = original_width / DETECTION_INPUT_SIZE
+        y_scale = original_height / DETECTION_INPUT_SIZE
+
+        # Reduce over classes in the model's own (classes, anchors) layout, where
+        # each class is one contiguous row; predictions is normally its transpose
+        class_probs = np.ascontiguousarray(predictions[:, 4:].T)
+        keep = np.flatnonzero(class_probs.max(axis=0) > 0.25)
+        class_ids = np.argmax(class_probs[:, keep], axis=0)
+        confidences = class_probs[class_ids, keep]
+        cx, cy, w, h = predictions[keep, :4].T
+
+        # Scale in the precision a scalar float32 * float gives, so boxes
+        # truncate to exactly the same pixels as the per-row version did
+        dtype = np.result_type(predictions.dtype.type(1) * x_scale)
+        x1 = ((cx - w / 2).astype(dtype) * x_scale).astype(int)
+        y1 = ((cy - h / 2).astype(dtype) * y_scale).astype(int)
+        x2 = ((cx + w / 2).astype(dtype) * x_scale).astype(int)
+        y2 = ((cy + h / 2).astype(dtype) * y_scale).astype(int)
+        boxes = np.stack([x1, y1, x2 - x1, y2 - y1], axis=1)
+
+        indices = cv2.dnn.NMSBoxes(boxes.tolist(), confidences.tolist(), 0.25, 0.45)
         final_boxes = {name: [] for name in self.all_possible_classes}
         if len(indices) > 0:
-            for i in indices.flatten():
-                x, y, w, h = boxes[i]
-                box = [x, y, x + w, y + h]
+            for i in np.asarray(indices).flatten():
+                x, y, bw, bh = boxes[i].tolist()
                 class_name = self.all_possible_classes[class_ids[i]]
-                final_boxes[class_name].append(box)
-        return original_image, final_boxes
+                final_boxes[class_name].append([x, y, x + bw, y + bh])
+        return final_boxes
+
+    def detect_batch(self, images):
+        """Run the detector on decoded BGR images, batch_size images per infer call
+
+        Returns one {class name: boxes} dict per image, in order.
+        """
+        results = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            input_tensor = np.concatenate([self.preprocess_image(image) for image in chunk])
+            with self.inference_lock:
+                outputs = self.compiled_model([input_tensor])[self.output_layer]
+            # outputs is (images, 4 + classes, anchors); one (anchors, 4 + classes) slice each
+            for image, image_outputs in zip(chunk, outputs):
+                results.append(self.postprocess_predictions(image_outputs.T, image.shape))
+        return results
+
+    def get_bounding_boxes_batch(self, image_paths):
+        """get_bounding_boxes() for several images, batch_size images per infer call
+
+        Returns a list of (original_image, final_boxes), in order.
+        """
+        images = []
+        for image_path in image_paths:
+            original_image = cv2.imread(image_path)
+            if original_image is None:
+                raise ValueError(f"Image not found at {image_path}")
+            images.append(original_image)
+        return list(zip(images, self.detect_batch(images)))
+
+    def get_bounding_boxes(self, image_path):
+        return self.get_bounding_boxes_batch([image_path])[0]
+
+    def segment_many(self, items, post_workers=None, max_pending=DEFAULT_PIPELINE_IMAGES, skip_existing=False):
+        """Segment (key, image path, output path) items through the async infer queue
+
+        Images are decoded in a feeder thread and detected batch_size at a time on
+        the queue's infer requests, while earlier images are cropped, oriented and
+        written by post_workers threads. Yields (key, result) as each image
+        finishes, in completion order; result is run()'s output dict, or the
+        exception the image failed with. With skip_existing, items whose output
+        file already exists are yielded with result None. At most max_pending
+        images are held at once, so batches are capped at max_pending images.
+        Not for use from several threads at once.
+        """
+        if max_pending < 1:
+            raise ValueError(f"max_pending must be at least 1, got {max_pending}")
+        # A batch waits for batch_size held images, which could never happen
+        # with fewer slots than that
+        batch_size = min(self.batch_size, max_pending)
+        done = queue.Queue()
+        slots = threading.BoundedSemaphore(max_pending)
+        stop = threading.Event()
+        fed = [None]  # number of items, set once the feeder has seen them all
+        workers = post_workers or max(2, len(self.infer_queue))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            def report(key, future):
+                error = future.exception()
+                done.put((key, error if error is not None else future.result()))
+
+            def on_inferred(request, batch):
+                if stop.is_set():
+                    return
+                try:
+                    # Copy before the request is handed the next batch
+                    outputs = request.get_output_tensor(0).data.copy()
+                except Exception as exc:
+                    for key, _, _, _ in batch:
+                        done.put((key, exc))
+                    return
+                for (key, image_path, output_path, image), image_outputs in zip(batch, outputs):
+                    try:
+                        future = pool.submit(self._segment_detected, image_path, output_path, image, image_outputs)
+                    except RuntimeError as exc:  # pool shut down by an abandoned generator
+                        done.put((key, exc))
+                        continue
+                    future.add_done_callback(partial(report, key))
+
+            def start(batch):
+                input_tensor = np.concatenate([self.preprocess_image(image) for _, _, _, image in batch])
+                self.infer_queue.start_async([input_tensor], batch)
+
+            def feed():
+                count = 0
+                batch = []
+                try:
+                    for key, image_path, output_path in items:
+                        while not slots.acquire(timeout=0.5):
+                            if stop.is_set():
+                                return
+                        if stop.is_set():
+                            return
+                        count += 1
+                        if skip_existing and output_path and os.path.exists(output_path):
+                            done.put((key, None))
+                            continue
+                        image = cv2.imread(image_path)
+                        if image is None:
+                            done.put((key, ValueError(f"Image not found at {image_path}")))
+                            continue
+                        batch.append((key, image_path, output_path, image))
+                        if len(batch) == batch_size:
+                            start(batch)
+                            batch = []
+                    if batch:
+                        start(batch)
+                    fed[0] = count
+                    done.put((stop, None))
+                except BaseException as exc:
+                    done.put((stop, exc))
+
+            self.infer_queue.set_callback(on_inferred)
+            feeder = threading.Thread(target=feed, daemon=True)
+            feeder.start()
+            yielded = 0
+            try:
+                while fed[0] is None or yielded < fed[0]:
+                    key, result = done.get()
+                    if key is stop:
+                        # Raised by the feeder (the items iterable or the infer queue)
+                        if result is not None:
+                            raise result
+                        continue
+                    slots.release()
+                    yielded += 1
+                    yield key, result
+            finally:
+                stop.set()
+                self.infer_queue.wait_all()
+
+    def _segment_detected(self, image_path, output_path, image, outputs):
+        boxes = self.postprocess_predictions(outputs.T, image.shape)
+        return self.run(image_path, output_path_override=output_path, detections=(image, boxes))
 
     def merge_overlapping_boxes(self, boxes):
+        """Merge overlapping [x1, y1, x2, y2] boxes until none overlap
+
+        Same result as repeatedly merging the first overlapping pair: the final
+        groups do not depend on the merge order, and each merged box sits where
+        its earliest member was. Overlaps are found with a sweep over x (boxes
+        sorted by x1, only boxes whose x2 reaches past the current x1 kept
+        active) and grouped with union-find. Boxes merged this way can overlap
+        new boxes, so sweeps repeat until one merges nothing.
+        """
         if not boxes:
             return []
-        box_list = [list(b) for b in boxes]
+        # Bounding boxes of the groups so far, in order of their earliest box
+        groups = [list(b) for b in boxes]
         while True:
-            merged_in_pass = False
-            i = 0
-            while i < len(box_list):
-                j = i + 1
-                while j < len(box_list):
-                    box1, box2 = box_list[i], box_list[j]
+            parent = list(range(len(groups)))
+
+            def find(i):
+                while parent[i] != i:
+                    parent[i] = parent[parent[i]]
+                    i = parent[i]
+                return i
+
+            merged = False
+            active = []  # (x2, group) heap of groups that may reach the current x1
+            for g in sorted(range(len(groups)), key=lambda g: groups[g][0]):
+                box = groups[g]
+                while active and active[0][0] <= box[0]:
+                    heapq.heappop(active)
+                for _, other in active:
+                    other_box = groups[other]
                     if (
-                        box1[0] < box2[2] and box1[2] > box2[0]
-                        and box1[1] < box2[3] and box1[3] > box2[1]
+                        box[0] < other_box[2] and box[2] > other_box[0]
+                        and box[1] < other_box[3] and box[3] > other_box[1]
                     ):
-                        box_list[i] = [
-                            min(box1[0], box2[0]),
-                            min(box1[1], box2[1]),
-                            max(box1[2], box2[2]),
-                            max(box1[3], box2[3]),
-                        ]
-                        box_list.pop(j)
-                        merged_in_pass = True
-                        break
-                    else:
-                        j += 1
-                if merged_in_pass:
-                    break
-                else:
-                    i += 1
-            if not merged_in_pass:
+                        root, other_root = find(g), find(other)
+                        if root != other_root:
+                            parent[max(root, other_root)] = min(root, other_root)
+                            merged = True
+                heapq.heappush(active, (box[2], g))
+            if not merged:
                 break
-        return box_list
+
+            # Roots are the smallest member, so each merged box takes the place
+            # of its earliest member
+            members = {}
+            for g in range(len(groups)):
+                members.setdefault(find(g), []).append(groups[g])
+            groups = []
+            for root in sorted(members):
+                box = members[root][0]
+                for other_box in members[root][1:]:
+                    box = [
+                        min(box[0], other_box[0]),
+                        min(box[1], other_box[1]),
+                        max(box[2], other_box[2]),
+                        max(box[3], other_box[3]),
+                    ]
+                groups.append(box)
+        return groups
 
     def partition_by_aspect_ratio(self, boxes_by_class, threshold=2.0):
         normal_boxes = {n: [] for n in self.all_possible_classes}
@@ -288,50 +489,107 @@ class Segmentation:
         M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
         return cv2.warpAffine(img_bgr, M, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
 
+    def _osd_rotation(self, img_bgr):
+        """Quarter turns for np.rot90 that make the crop upright, by Tesseract OSD
+
+        Returns None when OSD cannot tell (too little text, low confidence).
+        """
+        if self.osd_min_confidence is None or self._osd_unavailable.is_set():
+            return None
+        gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY) if img_bgr.ndim == 3 else img_bgr
+        h, w = gray.shape[:2]
+        if max(h, w) > OSD_MAX_SIDE:
+            scale = OSD_MAX_SIDE / max(h, w)
+            gray = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        try:
+            osd = pytesseract.image_to_osd(gray, output_type=pytesseract.Output.DICT)
+        except pytesseract.TesseractError as e:
+            if "Too few characters" not in str(e):
+                # e.g. osd.traineddata is not installed; it will not work for later crops either
+                with self._orientation_lock:
+                    if not self._osd_unavailable.is_set():
+                        print(f"Tesseract orientation detection unavailable, scoring all four rotations: {e}")
+                        self._osd_unavailable.set()
+            return None
+        if float(osd.get("orientation_conf", 0)) < self.osd_min_confidence:
+            return None
+        # "rotate" is the clockwise turn that makes the text upright; np.rot90 turns anticlockwise
+        return (-int(osd["rotate"]) // 90) % 4
+
+    def _count_orientation(self, stage):
+        with self._orientation_lock:
+            self.orientation_stats[stage] += 1
+
+    def orientation_summary(self):
+        stats = self.orientation_stats
+        return (f"Crop orientation: {stats['osd']} decided by OSD, "
+                f"{stats['osd_kept_original']} kept upright after checking OSD's rotation, "
+                f"{stats['four_way']} by four-way OCR")
+
+    def _safe_ocr_score(self, img_bgr):
+        try:
+            return self._tesseract_ocr_score(img_bgr)
+        except Exception:
+            return 0.0
+
     def _fix_orientation(self, crop_bgr):
-        # If auto_orient is True, we check all 4 directions
+        # If auto_orient is True, we find the upright rotation
         if self.auto_orient:
-            candidates = [self._rotate90(crop_bgr, k) for k in range(4)]
-            scores = []
-            for c in candidates:
-                try:
-                    scores.append(self._tesseract_ocr_score(c))
-                except Exception:
-                    scores.append(0.0)
-            
-            best_k = int(np.argmax(scores))
-
-            # Bias towards original orientation (k=0) to prevent random flips on handwriting
-            # 1. If the best score is very low (likely noise/handwriting), stick to original.
-            if scores[best_k] < self.blank_score_cutoff:
-                best_k = 0
-            # 2. If original orientation has a decent score, require significant improvement to rotate.
-            #    We use a strict multiplier (2.0) to assume original is correct unless proven otherwise.
-            elif best_k != 0 and scores[0] > (self.blank_score_cutoff / 2):
-                if scores[best_k] < scores[0] * 2.0:
+            osd_k = self._osd_rotation(crop_bgr)
+            if osd_k == 0:
+                # Already upright, one OCR pass at most (deskew needs to know if it is text)
+                best = crop_bgr
+                best_score = self._safe_ocr_score(best) if self.deskew else 0.0
+                self._count_orientation("osd")
+            elif osd_k is not None:
+                # OSD wants a rotation: score just the original and that rotation,
+                # with the same bias towards the original as the four-way check
+                rotated = self._rotate90(crop_bgr, osd_k)
+                scores = {0: self._safe_ocr_score(crop_bgr), osd_k: self._safe_ocr_score(rotated)}
+                best_k = osd_k
+                if scores[osd_k] < self.blank_score_cutoff:
+                    best_k = 0
+                elif scores[0] > (self.blank_score_cutoff / 2) and scores[osd_k] < scores[0] * 2.0:
                     best_k = 0
+                best = rotated if best_k else crop_bgr
+                best_score = scores[best_k]
+                self._count_orientation("osd" if best_k else "osd_kept_original")
+            else:
+                # Check all 4 directions
+                candidates = [self._rotate90(crop_bgr, k) for k in range(4)]
+                scores = [self._safe_ocr_score(c) for c in candidates]
+
+                best_k = int(np.argmax(scores))
 
-            best = candidates[best_k]
-            best_score = scores[best_k]
+                # Bias towards original orientation (k=0) to prevent random flips on handwriting
+                # 1. If the best score is very low (likely noise/handwriting), stick to original.
+                if scores[best_k] < self.blank_score_cutoff:
+                    best_k = 0
+                # 2. If original orientation has a decent score, require significant improvement to rotate.
+                #    We use a strict multiplier (2.0) to assume original is correct unless proven otherwise.
+                elif best_k != 0 and scores[0] > (self.blank_score_cutoff / 2):
+                    if scores[best_k] < scores[0] * 2.0:
+                        best_k = 0
+
+                best = candidates[best_k]
+                best_score = scores[best_k]
+                self._count_orientation("four_way")
         else:
             # Assume original orientation
             best = crop_bgr
             # If deskew is enabled, we still need a score to decide if we should deskew (is it text?)
-            if self.deskew:
-                try:
-                    best_score = self._tesseract_ocr_score(best)
-                except Exception:
-                    best_score = 0.0
-            else:
-                best_score = 0.0
+            best_score = self._safe_ocr_score(best) if self.deskew else 0.0
 
         # skip deskew on crops with little text (photos, rulers, color cards)
         if self.deskew and best_score >= self.blank_score_cutoff:
             best = self._deskew_small_angle(best, max_angle=10)
         return best
 
-    def run(self, image_path: str, output_path_override: str | None = None):
-        original_image, raw_boxes = self.get_bounding_boxes(image_path)
+    def run(self, image_path: str, output_path_override: str | None = None, detections=None):
+        """Segment one image; detections is its (original_image, boxes) if already detected"""
+        if detections is None:
+            detections = self.get_bounding_boxes(image_path)
+        original_image, raw_boxes = detections
         merged_boxes = {
             c: self.merge_overlapping_boxes(b) for c, b in raw_boxes.items() if b
         }
@@ -415,7 +673,8 @@ class Segmentation:
 
 
 
-def process_images_segmentation(input_folder, output_folder, model_xml_path=None, classes_to_render=None):
+def process_images_segmentation(input_folder, output_folder, model_xml_path=None, classes_to_render=None,
+                                batch_size=DEFAULT_DETECTION_BATCH_SIZE):
     # Default settings
     if model_xml_path is None:
         model_xml_path = r"helpers/SegmentationModels/RoboFlowModels/best.xml"
@@ -441,7 +700,9 @@ def process_images_segmentation(input_folder, output_folder, model_xml_path=None
             model_xml_path=model_xml_path,
             segmentation_classes=classes_to_render,
             engine="gemini",
-            output_path=None  # we will override per-image below
+            output_path=None,  # we will override per-image below
+            batch_size=batch_size,
+            throughput=True,
         )
     except Exception as e:
         print(f"Error initializing segmentation {e}")
@@ -460,26 +721,84 @@ def process_images_segmentation(input_folder, output_folder, model_xml_path=None
 
     print(f"\nFound {len(img_paths)} images to process")
 
-    success_count = 0
-    for i, img_path in enumerate(sorted(img_paths), 1):
+    items = []
+    for img_path in sorted(img_paths):
         basename = os.path.splitext(os.path.basename(img_path))[0]
         segmentation_path = os.path.join(output_folder, f"{basename}_segmentation.jpg")
+        items.append((img_path, img_path, segmentation_path))
 
-        try:
-            print(f"Processing {i}/{len(img_paths)}: {os.path.basename(img_path)}")
-            result_json = engine.run(img_path, output_path_override=segmentation_path)
-
-            print(f"✓ Processed {os.path.basename(img_path)} → {os.path.basename(segmentation_path)}")
-            success_count += 1
-        except Exception as exc:
-            print(f"✗ Failed on {img_path}: {exc}")
+    # Decoding, detection and cropping of different images overlap
+    success_count = 0
+    for i, (img_path, result) in enumerate(engine.segment_many(items), 1):
+        if isinstance(result, Exception):
+            print(f"✗ Failed on {img_path}: {result}")
+            continue
+        print(f"✓ Processed {i}/{len(img_paths)}: {os.path.basename(img_path)}")
+        success_count += 1
 
     print(f"\n=== Segmentation Complete ===")
     print(f"Successfully processed: {success_count}/{len(img_paths)} images")
+    if engine.auto_orient:
+        print(engine.orientation_summary())
 
     return success_count, len(img_paths)
 
 
+def stream_segmentation(items, output_folder, model_xml_path=None, classes_to_render=None):
+    """Segment images as they arrive, yielding (index, segmentation path, url) for each one
+
+    items is an iterable of (index, image path, url), e.g. a download stream.
+    Images already segmented into output_folder (a resumed run) are not segmented
+    again. Images that fail are reported and left out, as in process_images_segmentation().
+    """
+    if model_xml_path is None:
+        model_xml_path = r"helpers/SegmentationModels/RoboFlowModels/best.xml"
+
+    if classes_to_render is None:
+        classes_to_render = ["label", "barcode", "map"]
+
+    if not os.path.exists(model_xml_path):
+        raise FileNotFoundError(f"Model XML file not found at: {model_xml_path}")
+
+    os.makedirs(output_folder, exist_ok=True)
+
+    print(f"\n=== Segmenting images as they download ===")
+    print(f"Output folder: {output_folder}")
+    print(f"Classes to render: {classes_to_render}")
+
+    engine = Segmentation(
+        model_xml_path=model_xml_path,
+        segmentation_classes=classes_to_render,
+        engine="gemini",
+        output_path=None,  # we will override per-image below
+        throughput=True,
+    )
+
+    def to_segment():
+        for index, img_path, url in items:
+            basename = os.path.splitext(os.path.basename(img_path))[0]
+            segmentation_path = os.path.join(output_folder, f"{basename}_segmentation.jpg")
+            yield (index, img_path, url, segmentation_path), img_path, segmentation_path
+
+    # One image per request, so nothing waits for a batch to fill
+    success_count = 0
+    total_count = 0
+    for (index, img_path, url, segmentation_path), result in engine.segment_many(to_segment(), skip_existing=True):
+        total_count += 1
+        if isinstance(result, Exception):
+            print(f"✗ Failed on {img_path}: {result}")
+            continue
+        if result is not None:
+            print(f"✓ Processed {os.path.basename(img_path)} → {os.path.basename(segmentation_path)}")
+        success_count += 1
+        yield index, segmentation_path, url
+
+    print(f"\n=== Segmentation Complete ===")
+    print(f"Successfully processed: {success_count}/{total_count} images")
+    if engine.auto_orient:
+        print(engine.orientation_summary())
+
+
 def get_segmentation_settings():
     print("\n=== Segmentation Configuration ===")
 
@@ -0,0 +1,135 @@
+import threading
+import time
+from botocore.exceptions import ClientError
+
+"Adaptive (AIMD) concurrency control for Bedrock calls that are being throttled"
+
+# Error codes Bedrock uses when a request is rejected for rate or token limits
+THROTTLE_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException", "Throttling"}
+
+
+def is_throttling_error(error):
+    """Return True if the exception is Bedrock telling us to slow down"""
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in THROTTLE_ERROR_CODES
+    return False
+
+
+def get_retry_after(error):
+    """Read the service backoff hint (in seconds) from a throttling error, if any"""
+    if not isinstance(error, ClientError):
+        return None
+    headers = error.response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    for header in ("retry-after", "x-amzn-retry-after"):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value))
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class AdaptiveConcurrencyLimiter:
+    """Limit in-flight calls, shrinking the limit on throttles and growing it on success
+
+    The limit follows additive-increase/multiplicative-decrease: every successful
+    call adds 1/limit (so roughly +1 per full window of successes), and a throttle
+    multiplies it by decrease_factor. Throttles that arrive within cooldown seconds
+    of the last decrease are treated as part of the same event. Retrying the
+    throttled call is left to helpers.retry.RetryPolicy.
+    """
+
+    def __init__(self, max_limit, min_limit=1, decrease_factor=0.5, cooldown=2.0):
+        self.max_limit = max(1, int(max_limit))
+        self.min_limit = max(1, min(int(min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.throttle_count = 0
+        self.lowest_limit = self.max_limit
+
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                # Wake up when a slot frees or the service backoff window ends
+                self._condition.wait(timeout=wait if wait > 0 else None)
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            if self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self._condition.notify_all()
+
+    def on_throttle(self, retry_after=None):
+        with self._condition:
+            now = time.monotonic()
+            self.throttle_count += 1
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self.lowest_limit = min(self.lowest_limit, int(self.limit))
+                self._last_decrease = now
+            if retry_after:
+                # Honor the service hint for everyone, not just this caller
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def summary(self):
+        """One-line description of how throttling affected this run"""
+        return (f"Throttled {self.throttle_count} time(s); "
+                f"concurrency limit ended at {int(self.limit)}/{self.max_limit} "
+                f"(lowest {self.lowest_limit})")
+
+
+# Limiter of the RetryPolicy.call() running on each thread, used by limited_call()
+_current = threading.local()
+
+
+def current_limiter():
+    return getattr(_current, "limiter", None)
+
+
+def set_current_limiter(limiter):
+    """Make limiter the one limited_call() uses on this thread; returns the previous one"""
+    previous = current_limiter()
+    _current.limiter = limiter
+    return previous
+
+
+def limited_call(func, *args, **kwargs):
+    """Make a Bedrock API call inside a slot of this thread's limiter, if there is one
+
+    Only the call itself holds the slot, so image preparation and response cache
+    hits around it do not use up the concurrency window. The limiter is told
+    whether the call succeeded or was throttled.
+    """
+    limiter = current_limiter()
+    if limiter is None:
+        return func(*args, **kwargs)
+    limiter.acquire()
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        if is_throttling_error(e):
+            limiter.on_throttle(get_retry_after(e))
+        raise
+    else:
+        limiter.on_success()
+        return result
+    finally:
+        limiter.release()
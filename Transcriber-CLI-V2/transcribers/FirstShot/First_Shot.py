@@ -1,18 +1,32 @@
-import boto3
-from PIL import Image
-import io
 import os
+import re
 import json
+import tempfile
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
+from helpers.bedrock_client import get_bedrock_client
 from helpers.cost_analysis import cost_tracker
-from helpers.json_output import save_json_transcription, create_batch_json_file
+from helpers.json_output import save_json_transcription, create_batch_json_file, create_json_response, \
+    create_duplicate_response, save_json_response
+from helpers.response_cache import response_cache
+from helpers.throttling import AdaptiveConcurrencyLimiter, limited_call
+from helpers.retry import RetryPolicy, RetryFailure
+from helpers.image_prep import prepare_image, estimate_image_tokens, get_image_format, ImagePrefetcher, preprocess_workers_for
+from helpers.batch_inference import (supports_batch_inference, build_model_input, parse_model_output, run_batch_jobs,
+                                     MAX_JOB_NAME_LENGTH)
+from helpers.dedup import DuplicateFinder, group_duplicates
 
 "First shot, Looks over the image imported and gives its best shot at a transcription"
 
 
 
 
+# Sampling temperature for first shot transcriptions
+TEMPERATURE = 0.0
+
 # List of available models
 AVAILABLE_MODELS = [
     "us.anthropic.claude-3-sonnet-20240229-v1:0",
@@ -34,29 +48,34 @@ AVAILABLE_MODELS = [
 
 ]
 
-def standardize_image(image_bytes):
-    img = Image.open(io.BytesIO(image_bytes))
-    
-    # Convert to RGB if necessary
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
-    
-    width, height = img.size
-    
-    # Determine if landscape or portrait and set target size
-   
-    if width > height:  # Landscape
-        target_size = (1120, 1120)
-    else:  # Portrait
-        target_size = (1120, 1120)
-    
-    # Resize to standard dimensions
-    if img.size != target_size:
-        img = img.resize(target_size, Image.Resampling.LANCZOS)
-    
-    img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format="PNG")
-    return img_byte_arr.getvalue()
+# Models that accept Converse cache points (prompt caching)
+PROMPT_CACHING_MODEL_PREFIXES = (
+    "us.anthropic.claude-3-7-sonnet",
+    "us.anthropic.claude-sonnet-4",
+    "us.anthropic.claude-opus-4",
+    "us.amazon.nova-",
+)
+
+def supports_prompt_caching(model_id):
+    return model_id.startswith(PROMPT_CACHING_MODEL_PREFIXES)
+
+# Batched requests: several images share one prompt and one Bedrock call.
+# Converse accepts at most 20 images per request; Llama 3.2 only accepts one.
+MAX_IMAGES_PER_REQUEST = 20
+SINGLE_IMAGE_MODEL_PREFIXES = ("us.meta.llama3-2",)
+BATCH_DELIMITER = re.compile(r"^\s*=== IMAGE: (.+?) ===\s*$", re.MULTILINE)
+BATCH_INSTRUCTIONS = (
+    "The {count} images above are separate herbarium sheets ({names}). "
+    "Transcribe each image on its own, following the instructions above. "
+    "Start each image's transcription with a line containing exactly "
+    "\"=== IMAGE: <filename> ===\" using the filename given before that image, "
+    "and do not write anything outside these blocks."
+)
+
+def max_images_per_request(model_id):
+    if model_id.startswith(SINGLE_IMAGE_MODEL_PREFIXES):
+        return 1
+    return MAX_IMAGES_PER_REQUEST
 
 def select_model():
     
@@ -73,85 +92,509 @@ def select_model():
         except ValueError:
             print("Please enter a valid number")
 
-def convert_to_png(image_path):
-    img = Image.open(image_path)
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
-    png_bytes = io.BytesIO()
-    img.save(png_bytes, format="PNG")
-    return png_bytes.getvalue()
+def _clean_response_text(response_text):
+    # Clean up the response text by removing common prefixes
+    prefixes_to_remove = [
+        "Here is the list of fields with the information from the herbarium label:",
+        "Here are the fields extracted from the herbarium label:",
+        "Here is the transcription of the herbarium label:",
+        "Here's the transcription of the herbarium label:"
+    ]
+    
+    for prefix in prefixes_to_remove:
+        if response_text.startswith(prefix):
+            response_text = response_text[len(prefix):].lstrip()
+            break
+    
+    # Check if the response contains the prompt itself instead of the structured data
+    if "## 🌿 Herbarium Label Transcription" in response_text or "**Herbarium Label Transcription**" in response_text:
+        
+        # Try to find the actual field list in the response
+        field_list_start = response_text.find("verbatimCollectors:")
+        if field_list_start != -1:
+            response_text = response_text[field_list_start:]
+        else:
+            print("Could not find field list in response. Please check the model output.")
+    return response_text
 
-def process_image(image_path, prompt_path, model_id=None):
+def process_image(image_path, prompt_path, model_id=None, prompt_caching=False, return_usage=False):
+    """Transcribe one image with Bedrock
     
-    # Initialize Bedrock client
-    bedrock_runtime = boto3.client("bedrock-runtime")
+    With prompt_caching, the prompt text is sent ahead of the image and marked
+    with a Converse cache point, so every image after the first reads the prompt
+    from Bedrock's prompt cache. With return_usage, returns (response_text, usage)
+    where usage holds the cache read/write token counts Bedrock reported.
+    """
+    # Shared Bedrock client (connection pool is reused across images)
+    bedrock_runtime = get_bedrock_client()
     
     # Select model if not provided
     if model_id is None:
         model_id = select_model()
     
-    # Convert image to PNG and standardize
-    image = convert_to_png(image_path)
-    image = standardize_image(image)
+    # Decode, size for the model and encode the image in one pass
+    image_format = get_image_format()
+    image, image_size = prepare_image(image_path, model_id, return_size=True, image_format=image_format)
+    image_tokens = estimate_image_tokens(model_id, *image_size)
     
     # Read prompt
     with open(prompt_path, "r", encoding="utf-8") as f:
         user_message = f.read().strip()
     
-    # Always use PNG format
     # Prepare message for model
+    layout = "prompt-first" if prompt_caching and supports_prompt_caching(model_id) else "image-first"
+    if layout == "prompt-first":
+        # The static prompt has to come first to form a cacheable prefix
+        content = [
+            {"text": user_message},
+            {"cachePoint": {"type": "default"}},
+            {"image": {"format": image_format, "source": {"bytes": image}}},
+        ]
+    else:
+        content = [
+            {"image": {"format": image_format, "source": {"bytes": image}}},
+            {"text": user_message},
+        ]
     messages = [
         {
             "role": "user",
-            "content": [
-                {"image": {"format": "png", "source": {"bytes": image}}},
-                {"text": user_message},
-            ],
+            "content": content,
         }
     ]
     
-    # Call Bedrock with temperature 0.0
-    response = bedrock_runtime.converse(
-        modelId=model_id,
-        messages=messages,
-        inferenceConfig={"temperature": 0.0}
-    )
-    
-    # Extract and return response
-    response_text = response["output"]["message"]["content"][0]["text"]
+    usage = {"cache_read_input_tokens": 0, "cache_creation_input_tokens": 0,
+             "estimated_image_tokens": image_tokens}
     
-    # Track cost
-    input_tokens = cost_tracker.estimate_tokens(user_message)
-    output_tokens = cost_tracker.estimate_tokens(response_text, is_output=True)
-    cost_tracker.track_request(model_id, input_tokens, output_tokens)
+    # Reuse an identical earlier response if one is cached
+    cache_key = response_cache.make_key(image, user_message, model_id, TEMPERATURE, layout)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        response_text = cached["text"]
+        print(f"Using cached response for {Path(image_path).name}")
+        cost_tracker.track_cache_hit(
+            model_id,
+            cost_tracker.estimate_tokens(user_message) + image_tokens,
+            cost_tracker.estimate_tokens(response_text, is_output=True)
+        )
+    else:
+        # Call Bedrock with temperature 0.0
+        response = limited_call(
+            bedrock_runtime.converse,
+            modelId=model_id,
+            messages=messages,
+            inferenceConfig={"temperature": TEMPERATURE}
+        )
+        
+        # Extract and return response
+        response_text = response["output"]["message"]["content"][0]["text"]
+        
+        # Prompt cache activity as reported by Bedrock
+        response_usage = response.get("usage", {})
+        usage["cache_read_input_tokens"] = response_usage.get("cacheReadInputTokens", 0)
+        usage["cache_creation_input_tokens"] = response_usage.get("cacheWriteInputTokens", 0)
+        
+        # Track cost
+        input_tokens = cost_tracker.estimate_tokens(user_message)
+        output_tokens = cost_tracker.estimate_tokens(response_text, is_output=True)
+        cost_tracker.track_request(
+            model_id, input_tokens, output_tokens,
+            cache_read_tokens=usage["cache_read_input_tokens"],
+            cache_write_tokens=usage["cache_creation_input_tokens"],
+            image_tokens=image_tokens
+        )
+        
+        if response_cache.enabled:
+            cost_tracker.track_cache_miss()
+            response_cache.put(cache_key, {"model_id": model_id, "text": response_text})
     
     # Clean up the response text by removing common prefixes
-    prefixes_to_remove = [
-        "Here is the list of fields with the information from the herbarium label:",
-        "Here are the fields extracted from the herbarium label:",
-        "Here is the transcription of the herbarium label:",
-        "Here's the transcription of the herbarium label:"
-    ]
+    response_text = _clean_response_text(response_text)
     
-    for prefix in prefixes_to_remove:
-        if response_text.startswith(prefix):
-            response_text = response_text[len(prefix):].lstrip()
-            break
+    print(response_text)
+    if return_usage:
+        return response_text, usage
+    return response_text
+
+def process_image_group(image_paths, prompt_path, model_id, prompt_caching=False):
+    """Transcribe several images with a single Bedrock request
     
-    # Check if the response contains the prompt itself instead of the structured data
-    if "## 🌿 Herbarium Label Transcription" in response_text or "**Herbarium Label Transcription**" in response_text:
+    Each image is tagged with its filename and the model is asked to answer in
+    delimited per-image blocks. Images already in the response cache are not
+    sent again.
+    
+    Returns:
+        List of (response_text, usage) tuples in the same order as image_paths
+    
+    Raises:
+        ValueError: if the response cannot be split back into one block per image
+    """
+    bedrock_runtime = get_bedrock_client()
+    
+    # Read prompt
+    with open(prompt_path, "r", encoding="utf-8") as f:
+        user_message = f.read().strip()
+    
+    names = [Path(image_path).name for image_path in image_paths]
+    if len(set(names)) != len(names):
+        raise ValueError("Images in a batched request must have unique filenames")
+    
+    images = []
+    image_tokens = {}
+    image_format = get_image_format()
+    for name, image_path in zip(names, image_paths):
+        image, image_size = prepare_image(image_path, model_id, return_size=True, image_format=image_format)
+        images.append(image)
+        image_tokens[name] = estimate_image_tokens(model_id, *image_size)
+    
+    # Look up every image in the response cache first (keyed by the group's size,
+    # a response from a group is not interchangeable with a single-image one)
+    layout = "prompt-first" if prompt_caching and supports_prompt_caching(model_id) else "image-first"
+    cache_keys = [response_cache.make_key(image, user_message, model_id, TEMPERATURE, layout, len(images))
+                  for image in images]
+    raw_texts = {}
+    for name, cache_key in zip(names, cache_keys):
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            raw_texts[name] = cached["text"]
+            print(f"Using cached response for {name}")
+            cost_tracker.track_cache_hit(
+                model_id,
+                cost_tracker.estimate_tokens(user_message) + image_tokens[name],
+                cost_tracker.estimate_tokens(cached["text"], is_output=True)
+            )
+    
+    usages = {
+        name: {"cache_read_input_tokens": 0, "cache_creation_input_tokens": 0,
+               "estimated_image_tokens": image_tokens[name]}
+        for name in names
+    }
+    to_send = [(name, image, cache_key) for name, image, cache_key in zip(names, images, cache_keys)
+               if name not in raw_texts]
+    
+    if to_send:
+        send_names = [name for name, _, _ in to_send]
+        batch_instructions = BATCH_INSTRUCTIONS.format(
+            count=len(to_send), names=", ".join(send_names)
+        )
+        image_blocks = []
+        for name, image, _ in to_send:
+            image_blocks.append({"text": f"Image filename: {name}"})
+            image_blocks.append({"image": {"format": image_format, "source": {"bytes": image}}})
         
-        # Try to find the actual field list in the response
-        field_list_start = response_text.find("verbatimCollectors:")
-        if field_list_start != -1:
-            response_text = response_text[field_list_start:]
+        if layout == "prompt-first":
+            # The static prompt has to come first to form a cacheable prefix
+            content = [{"text": user_message}, {"cachePoint": {"type": "default"}}] + image_blocks + [{"text": batch_instructions}]
         else:
-            print("Could not find field list in response. Please check the model output.")
+            content = image_blocks + [{"text": user_message}, {"text": batch_instructions}]
+        
+        response = limited_call(
+            bedrock_runtime.converse,
+            modelId=model_id,
+            messages=[{"role": "user", "content": content}],
+            inferenceConfig={"temperature": TEMPERATURE}
+        )
+        response_text = response["output"]["message"]["content"][0]["text"]
+        
+        # Track cost before parsing, the request has been paid for either way
+        response_usage = response.get("usage", {})
+        cache_read = response_usage.get("cacheReadInputTokens", 0)
+        cache_write = response_usage.get("cacheWriteInputTokens", 0)
+        cost_tracker.track_request(
+            model_id,
+            cost_tracker.estimate_tokens(user_message + batch_instructions),
+            cost_tracker.estimate_tokens(response_text, is_output=True),
+            image_count=len(to_send),
+            cache_read_tokens=cache_read,
+            cache_write_tokens=cache_write,
+            image_tokens=sum(image_tokens[name] for name in send_names)
+        )
+        
+        blocks = _split_batched_response(response_text, send_names)
+        
+        # Split prompt cache tokens evenly between the images (remainder goes to the first)
+        count = len(send_names)
+        for position, name in enumerate(send_names):
+            usages[name]["cache_read_input_tokens"] = cache_read // count + (cache_read % count if position == 0 else 0)
+            usages[name]["cache_creation_input_tokens"] = cache_write // count + (cache_write % count if position == 0 else 0)
+        
+        for name, _, cache_key in to_send:
+            raw_texts[name] = blocks[name]
+            if response_cache.enabled:
+                cost_tracker.track_cache_miss()
+                response_cache.put(cache_key, {"model_id": model_id, "text": blocks[name]})
     
-    print(response_text)
-    return response_text
+    results = []
+    for name in names:
+        response_text = _clean_response_text(raw_texts[name])
+        print(f"{name}:\n{response_text}")
+        results.append((response_text, usages[name]))
+    return results
+
+def _split_batched_response(response_text, names):
+    """Split a batched response into {filename: text}, or raise ValueError"""
+    matches = list(BATCH_DELIMITER.finditer(response_text))
+    blocks = {}
+    for index, match in enumerate(matches):
+        name = match.group(1).strip()
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(response_text)
+        if name in blocks:
+            raise ValueError(f"Image {name} appears more than once in the batched response")
+        blocks[name] = response_text[match.end():end].strip()
+    
+    missing = [name for name in names if not blocks.get(name)]
+    if missing:
+        raise ValueError(f"Batched response is missing output for: {', '.join(missing)}")
+    return blocks
+
+def _lookup_image_url(image_path, url_map):
+    # Get the image URL if available
+    # Handle segmented image names by removing '_segmentation' suffix when looking up URLs
+    image_name_for_url_lookup = image_path.name
+    if '_segmentation' in image_name_for_url_lookup:
+        image_name_for_url_lookup = image_name_for_url_lookup.replace('_segmentation', '')
+    
+    image_url = url_map.get(image_name_for_url_lookup)
+    if image_url:
+        print(f"Found URL for {image_path.name}: {image_url}")
+    elif url_map:
+        print(f"No URL found for {image_path.name} (looking for {image_name_for_url_lookup})")
+    return image_url
+
+def _duplicate_result(result, image_path, output_dir, url_map, image_url=None):
+    """Copy a representative image's result to a duplicate and save its JSON file"""
+    if image_url is None:
+        image_url = _lookup_image_url(image_path, url_map)
+    duplicate = create_duplicate_response(result, image_path.name, image_url)
+    if "error" not in result:
+        json_filepath = save_json_response(output_dir, image_path.name, duplicate)
+        print(f"{image_path.name} duplicates {result['image_name']}, JSON saved to: {json_filepath}")
+    return duplicate
+
+def _find_duplicates(pending, perceptual_distance=None):
+    """Return {slot: representative slot} for the duplicate images in pending"""
+    try:
+        _, duplicates = group_duplicates([image_path for _, image_path in pending], perceptual_distance)
+    except Exception as e:
+        print(f"Warning: Duplicate detection failed, transcribing every image: {e}")
+        return {}
+    if duplicates:
+        print(f"Found {len(duplicates)} duplicate image(s); each is copied from the image it duplicates, "
+              f"saving {len(duplicates)} Bedrock call(s)")
+        cost_tracker.track_duplicates(len(duplicates))
+    return duplicates
+
+def _save_transcription(image_path, response_text, usage, input_tokens, output_dir, date_folder, model_id, url_map, request_stats=None,
+                        image_url=None):
+    """Save the JSON file for one transcribed image and return its batch entry
+    
+    image_url is looked up in url_map unless it is given (streamed downloads).
+    """
+    output_tokens = cost_tracker.estimate_tokens(response_text, is_output=True)
+    
+    if image_url is None:
+        image_url = _lookup_image_url(image_path, url_map)
+    
+    # Save individual JSON file
+    json_filepath = save_json_transcription(
+        output_dir, date_folder, "first_shot", 
+        image_path.name, response_text, model_id, 
+        input_tokens, output_tokens, image_url=image_url, request_stats=request_stats, **usage
+    )
+    
+    # Add to batch collection
+    json_response = create_json_response(
+        image_path.name, response_text, model_id, 
+        input_tokens, output_tokens, image_url=image_url, request_stats=request_stats, **usage
+    )
+    
+    print(f"JSON saved to: {json_filepath}")
+    return json_response
+
+def _error_record(image_path, error):
+    print(f"Error processing {image_path.name}: {str(error)}")
+    # Create error JSON response
+    record = {
+        "error": str(error),
+        "image_name": image_path.name,
+        "timestamp": datetime.utcnow().isoformat() + "Z"
+    }
+    if isinstance(error, RetryFailure):
+        record["request"] = {"attempts": error.attempts, "total_seconds": error.total_seconds}
+    return record
+
+def _transcribe_image(image_path, prompt_path, output_dir, date_folder, model_id, url_map, progress, limiter, retry_policy,
+                      prompt_caching=False, image_url=None):
+    """Transcribe a single image and save its JSON file
+    
+    Returns the JSON response for the batch file, or an error record if the
+    transcription failed. Safe to call from worker threads; the limiter decides
+    when the Bedrock call may start and the retry policy retries transient errors.
+    """
+    print(50*"=")
+    print(f"Processing image {progress}: {image_path.name}")
+    
+    try:
+        # Process the image using the selected model
+        (response_text, usage), request_stats = retry_policy.call(
+            process_image, image_path, prompt_path, model_id,
+            prompt_caching=prompt_caching, return_usage=True, limiter=limiter
+        )
+        
+        # Get token counts for this request
+        with open(prompt_path, "r", encoding="utf-8") as f:
+            user_message = f.read().strip()
+        input_tokens = cost_tracker.estimate_tokens(user_message)
+        
+        return _save_transcription(image_path, response_text, usage, input_tokens,
+                                   output_dir, date_folder, model_id, url_map, request_stats, image_url)
+        
+    except Exception as e:
+        return _error_record(image_path, e)
+
+def _transcribe_group(group, prompt_path, output_dir, date_folder, model_id, url_map, limiter, retry_policy,
+                      prompt_caching=False, image_urls=None):
+    """Transcribe a group of images with one request, falling back to one request per image
+    
+    Args:
+        group: List of (progress, image_path) tuples
+        image_urls: URLs of the images in group, if known (otherwise looked up in url_map)
+    
+    Returns:
+        List of JSON responses (or error records) in the same order as group
+    """
+    if image_urls is None:
+        image_urls = [None] * len(group)
+    if len(group) == 1:
+        progress, image_path = group[0]
+        return [_transcribe_image(image_path, prompt_path, output_dir, date_folder, model_id,
+                                  url_map, progress, limiter, retry_policy, prompt_caching, image_urls[0])]
+    
+    print(50*"=")
+    print(f"Processing images {group[0][0]} to {group[-1][0]} in one request: "
+          f"{', '.join(image_path.name for _, image_path in group)}")
+    
+    try:
+        responses, request_stats = retry_policy.call(
+            process_image_group, [image_path for _, image_path in group], prompt_path, model_id,
+            prompt_caching=prompt_caching, limiter=limiter
+        )
+    except Exception as e:
+        print(f"Batched request failed ({e}), falling back to one image per request")
+        return [
+            _transcribe_image(image_path, prompt_path, output_dir, date_folder, model_id,
+                              url_map, progress, limiter, retry_policy, prompt_caching, image_url)
+            for (progress, image_path), image_url in zip(group, image_urls)
+        ]
+    
+    # The prompt is sent once for the whole group, so split its tokens between the images
+    with open(prompt_path, "r", encoding="utf-8") as f:
+        user_message = f.read().strip()
+    input_tokens = cost_tracker.estimate_tokens(user_message) // len(group)
+    
+    results = []
+    for (progress, image_path), image_url, (response_text, usage) in zip(group, image_urls, responses):
+        try:
+            results.append(_save_transcription(image_path, response_text, usage, input_tokens,
+                                               output_dir, date_folder, model_id, url_map, request_stats, image_url))
+        except Exception as e:
+            results.append(_error_record(image_path, e))
+    return results
+
+def _transcribe_with_batch_job(pending, image_count, prompt_path, output_dir, date_folder, model_id, url_map, batch_runner):
+    """Transcribe images with a Bedrock Batch Inference job instead of on-demand calls
+    
+    Cached images are answered from the response cache; the rest become job
+    records. Outputs go through the same cleaning and JSON saving as process_image().
+    
+    Returns:
+        List of JSON responses (or error records) in the same order as pending,
+        with None for images no job returned output for (e.g. too few uncached
+        images for a job), which are left for on-demand requests
+    """
+    with open(prompt_path, "r", encoding="utf-8") as f:
+        user_message = f.read().strip()
+    input_tokens = cost_tracker.estimate_tokens(user_message)
+    
+    raw_texts = {}
+    record_slots = {}
+    cache_keys = {}
+    image_tokens = {}
+    image_format = get_image_format()
+    
+    def records():
+        # Generated one at a time so only one encoded image is in memory
+        for slot, (i, image_path) in enumerate(pending):
+            image, image_size = prepare_image(image_path, model_id, return_size=True, image_format=image_format)
+            image_tokens[slot] = estimate_image_tokens(model_id, *image_size)
+            # Records are laid out like a single-image request without a cache point
+            cache_key = response_cache.make_key(image, user_message, model_id, TEMPERATURE)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                raw_texts[slot] = cached["text"]
+                print(f"Using cached response for {image_path.name}")
+                cost_tracker.track_cache_hit(
+                    model_id, input_tokens + image_tokens[slot], cost_tracker.estimate_tokens(cached["text"], is_output=True)
+                )
+                continue
+            # Record IDs are 11 characters, as in the Bedrock documentation examples
+            record_id = f"IMG{slot:08d}"
+            record_slots[record_id] = slot
+            cache_keys[slot] = cache_key
+            yield {"recordId": record_id, "modelInput": build_model_input(model_id, image, user_message, TEMPERATURE, image_format)}
+    
+    print(f"Preparing {len(pending)} images for a Bedrock batch inference job")
+    timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    # Leave room for the "-<part>" suffix run_batch_jobs() adds when a run needs several jobs
+    run_name = re.sub(r'[^A-Za-z0-9-]', '-', str(date_folder))[:MAX_JOB_NAME_LENGTH - len("transcriber--") - len(timestamp) - 4]
+    job_name = f"transcriber-{run_name}-{timestamp}"
+    with tempfile.TemporaryDirectory() as work_dir:
+        outputs = run_batch_jobs(batch_runner, job_name, model_id, records(), work_dir)
+    
+    errors = {}
+    for record_id, slot in record_slots.items():
+        output = outputs.get(record_id)
+        if output is None:
+            continue
+        try:
+            if "error" in output:
+                raise ValueError(output["error"].get("errorMessage", str(output["error"])))
+            response_text = parse_model_output(model_id, output["modelOutput"])
+        except Exception as e:
+            errors[slot] = e
+            continue
+        raw_texts[slot] = response_text
+        cost_tracker.track_request(
+            model_id, input_tokens, cost_tracker.estimate_tokens(response_text, is_output=True), batch=True,
+            image_tokens=image_tokens[slot]
+        )
+        if response_cache.enabled:
+            cost_tracker.track_cache_miss()
+            response_cache.put(cache_keys[slot], {"model_id": model_id, "text": response_text})
+    
+    results = []
+    for slot, (i, image_path) in enumerate(pending):
+        if slot not in raw_texts and slot not in errors:
+            results.append(None)
+            continue
+        print(50*"=")
+        print(f"Processing image {i}/{image_count}: {image_path.name}")
+        if slot in errors:
+            results.append(_error_record(image_path, errors[slot]))
+            continue
+        try:
+            response_text = _clean_response_text(raw_texts[slot])
+            print(response_text)
+            usage = {"cache_read_input_tokens": 0, "cache_creation_input_tokens": 0,
+                     "estimated_image_tokens": image_tokens[slot]}
+            results.append(_save_transcription(image_path, response_text, usage, input_tokens,
+                                               output_dir, date_folder, model_id, url_map))
+        except Exception as e:
+            results.append(_error_record(image_path, e))
+    return results
 
-def process_images(base_folder, prompt_path, output_dir, date_folder, model_id=None, skip_images=None):
+def process_images(base_folder, prompt_path, output_dir, date_folder, model_id=None, skip_images=None, max_workers=1, on_result=None,
+                   prompt_caching=False, images_per_request=1, batch_runner=None, preprocess_workers=0, prefetch_depth=None,
+                   dedup=False, perceptual_distance=None):
     """Process multiple images from a folder
     
     Args:
@@ -161,6 +604,25 @@ def process_images(base_folder, prompt_path, output_dir, date_folder, model_id=N
         date_folder: Name of the date folder for naming the output file
         model_id: Pre-selected model ID (optional)
         skip_images: Set of image names to skip (for resuming runs)
+        max_workers: Maximum number of Bedrock calls in flight at once
+        on_result: Optional callback on_result(slot, json_response), called as each
+            image finishes; slot is the image's position in the batch file
+        prompt_caching: Put the prompt in a Bedrock prompt cache prefix (supported models only)
+        images_per_request: Pack this many images into each Bedrock request; a group whose
+            response cannot be split back per image is retried one image at a time
+        batch_runner: Run the transcriptions as a Bedrock Batch Inference job with this runner
+            (see helpers.batch_inference) instead of on-demand calls. Falls back to on-demand
+            calls if the model is not supported or there are too few uncached images for a
+            job, and for any images a job returned no output for.
+        preprocess_workers: Prepare upcoming images in this many worker processes ahead of the
+            Bedrock calls (0 prepares each image inline when it is sent; runs of only a few
+            images are always prepared inline, see helpers.image_prep.MIN_PREFETCH_IMAGES)
+        prefetch_depth: Most images prepared ahead of the Bedrock calls at once; defaults to
+            two per image in flight (two per worker process for batch jobs)
+        dedup: Transcribe only one image of each set of identical files and copy its
+            result to the others (each keeps its own image_name and image_url)
+        perceptual_distance: With dedup, also treat images whose perceptual hashes differ
+            in at most this many bits as duplicates (None for identical files only)
     """
     if skip_images is None:
         skip_images = set()
@@ -227,70 +689,254 @@ def process_images(base_folder, prompt_path, output_dir, date_folder, model_id=N
     if model_id is None:
         model_id = select_model()
     
-    # Store all transcriptions for batch file
-    all_transcriptions = []
-    
-    # Process each image
-    print(f"\nFound {len(image_files)} images to process")
+    # Work out which images still need transcribing (resume support)
+    pending = []
     skipped_count = 0
+    print(f"\nFound {len(image_files)} images to process")
     for i, image_path in enumerate(image_files, 1):
         # Skip if already processed (for resume functionality)
         if image_path.name in skip_images:
             skipped_count += 1
             print(f"Skipping {i}/{len(image_files)}: {image_path.name} (already processed)")
             continue
-        
-        print(50*"=")
-        print(f"Processing image {i}/{len(image_files)}: {image_path.name}")
-        
+        pending.append((i, image_path))
+    
+    # Slots of the images actually sent; duplicates are filled in from them
+    duplicates = _find_duplicates(pending, perceptual_distance) if dedup and len(pending) > 1 else {}
+    to_send = [(slot, item) for slot, item in enumerate(pending) if slot not in duplicates]
+    copies = {}
+    for slot, original in duplicates.items():
+        copies.setdefault(original, []).append(slot)
+    
+    def fan_out(slot, result):
+        for copy_slot in copies.get(slot, []):
+            results[copy_slot] = _duplicate_result(result, pending[copy_slot][1], output_dir, url_map)
+            if on_result is not None:
+                on_result(copy_slot, results[copy_slot])
+    
+    if batch_runner is not None:
+        if not supports_batch_inference(model_id):
+            print(f"Batch inference is not supported for {model_id}, using on-demand requests")
+            batch_runner = None
+        elif len(to_send) < batch_runner.min_records:
+            print(f"Batch inference jobs need at least {batch_runner.min_records} images, "
+                  f"using on-demand requests for these {len(to_send)}")
+            batch_runner = None
+    
+    results = [None] * len(pending)
+    
+    if batch_runner is not None:
+        images = [item for _, item in to_send]
+        with _prefetcher(images, model_id, preprocess_workers, prefetch_depth or 2 * preprocess_workers):
+            sent_results = _transcribe_with_batch_job(images, len(image_files), prompt_path, output_dir,
+                                                      date_folder, model_id, url_map, batch_runner)
+        unsent = []
+        for (slot, item), result in zip(to_send, sent_results):
+            if result is None:
+                unsent.append((slot, item))
+                continue
+            results[slot] = result
+            if on_result is not None:
+                on_result(slot, result)
+            fan_out(slot, result)
+        if not unsent:
+            _finish_first_shot(results, output_dir, date_folder, skipped_count)
+            return
+        print(f"\nNo batch job output for {len(unsent)} image(s), transcribing them with on-demand requests")
+        to_send = unsent
+    
+    max_workers = max(1, int(max_workers or 1))
+    if max_workers > 1 and len(to_send) > 1:
+        print(f"Running up to {max_workers} transcriptions concurrently")
+    
+    if prompt_caching:
+        if supports_prompt_caching(model_id):
+            print("Prompt caching enabled: the prompt is cached by Bedrock after the first image")
+        else:
+            print(f"Prompt caching is not supported by {model_id}, sending the prompt uncached")
+    
+    # Adapts the number of in-flight calls when Bedrock throttles
+    limiter = AdaptiveConcurrencyLimiter(max_workers)
+    # Retries transient errors within a per-image and per-run budget
+    retry_policy = RetryPolicy.for_run(len(to_send))
+    
+    # Group consecutive images when several are packed into each request
+    images_per_request = max(1, min(int(images_per_request or 1), max_images_per_request(model_id)))
+    if images_per_request > 1:
+        print(f"Sending up to {images_per_request} images per request")
+    groups = [
+        to_send[start:start + images_per_request]
+        for start in range(0, len(to_send), images_per_request)
+    ]
+    
+    # Results are slotted by position so the batch file keeps image order
+    # no matter which call finishes first
+    depth = prefetch_depth or 2 * max_workers * images_per_request
+    with _prefetcher([item for _, item in to_send], model_id, preprocess_workers, depth), \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                _transcribe_group,
+                [(f"{i}/{len(image_files)}", image_path) for _, (i, image_path) in group],
+                prompt_path, output_dir, date_folder, model_id, url_map, limiter, retry_policy, prompt_caching
+            ): [slot for slot, _ in group]
+            for group in groups
+        }
+        for future in as_completed(futures):
+            for slot, result in zip(futures[future], future.result()):
+                results[slot] = result
+                # Let a downstream stage (e.g. Second Shot) start on it right away
+                if on_result is not None:
+                    on_result(slot, result)
+                fan_out(slot, result)
+    
+    if limiter.throttle_count:
+        print(f"\n{limiter.summary()}")
+    if retry_policy.retry_count or retry_policy.failure_count:
+        print(retry_policy.summary())
+    
+    _finish_first_shot(results, output_dir, date_folder, skipped_count)
+
+def _prefetcher(pending, model_id, preprocess_workers, depth):
+    # Prepare images in worker processes ahead of the Bedrock calls, if enabled
+    # and there are enough images to make starting the processes worthwhile
+    preprocess_workers = preprocess_workers_for(len(pending), preprocess_workers)
+    if not preprocess_workers:
+        return nullcontext()
+    print(f"Preparing images in {preprocess_workers} worker process(es), up to {depth} ahead")
+    return ImagePrefetcher([image_path for _, image_path in pending], model_id,
+                           workers=preprocess_workers, depth=depth)
+
+def process_image_stream(items, prompt_path, output_dir, date_folder, model_id=None, skip_images=None, max_workers=1,
+                         on_result=None, prompt_caching=False, total=None, dedup=False, perceptual_distance=None,
+                         images_per_request=1, preprocess_workers=0, prefetch_depth=None):
+    """Transcribe images as they arrive instead of from a finished folder
+    
+    Used for URL lists, so Bedrock calls start while images are still being
+    downloaded (and segmented). Each image's URL comes with it, so url_map.json
+    is not needed. At most twice max_workers requests are queued at once;
+    taking the next item waits until there is room, which in turn holds back
+    the downloads.
+    
+    Args:
+        items: Iterable of (index, image_path, image_url); index is the image's
+            1-based position in the URL list and sets its place in the batch file
+        total: Number of images expected, for progress messages (optional)
+        images_per_request: Pack this many consecutive arrivals into each request
+            (a group is sent once it is full, or when the stream ends)
+        preprocess_workers: Prepare each image in a worker process as soon as it
+            arrives, while it waits for its request
+        (other arguments as for process_images)
+    """
+    if skip_images is None:
+        skip_images = set()
+    if model_id is None:
+        model_id = select_model()
+    
+    max_workers = max(1, int(max_workers or 1))
+    if prompt_caching and not supports_prompt_caching(model_id):
+        print(f"Prompt caching is not supported by {model_id}, sending the prompt uncached")
+    images_per_request = max(1, min(int(images_per_request or 1), max_images_per_request(model_id)))
+    if images_per_request > 1:
+        print(f"Sending up to {images_per_request} images per request")
+    
+    limiter = AdaptiveConcurrencyLimiter(max_workers)
+    # The image count is not known upfront, so the retry budget grows as images arrive
+    retry_policy = RetryPolicy.for_run()
+    queued = threading.BoundedSemaphore(2 * max_workers)
+    results = {}
+    results_lock = threading.Lock()
+    skipped_count = 0
+    submitted_count = 0
+    # Duplicates of an image that is still being transcribed wait here for its result
+    finder = DuplicateFinder(perceptual_distance) if dedup else None
+    waiting_copies = {}
+    
+    def add_copy(index, image_path, image_url, result):
+        # Called with results_lock held
+        results[index] = _duplicate_result(result, image_path, output_dir, {}, image_url)
+        if on_result is not None:
+            on_result(index - 1, results[index])
+    
+    def transcribe(group):
+        # group: list of (index, image_path, image_url, progress)
         try:
-            # Process the image using the selected model
-            response_text = process_image(image_path, prompt_path, model_id)
-            
-            # Get token counts for this request
-            with open(prompt_path, "r", encoding="utf-8") as f:
-                user_message = f.read().strip()
-            input_tokens = cost_tracker.estimate_tokens(user_message)
-            output_tokens = cost_tracker.estimate_tokens(response_text, is_output=True)
-            
-            # Get the image URL if available
-            # Handle segmented image names by removing '_segmentation' suffix when looking up URLs
-            image_name_for_url_lookup = image_path.name
-            if '_segmentation' in image_name_for_url_lookup:
-                image_name_for_url_lookup = image_name_for_url_lookup.replace('_segmentation', '')
-            
-            image_url = url_map.get(image_name_for_url_lookup)
-            if image_url:
-                print(f"Found URL for {image_path.name}: {image_url}")
-            elif url_map:
-                print(f"No URL found for {image_path.name} (looking for {image_name_for_url_lookup})")
-            
-            # Save individual JSON file
-            json_filepath = save_json_transcription(
-                output_dir, date_folder, "first_shot", 
-                image_path.name, response_text, model_id, 
-                input_tokens, output_tokens, image_url=image_url
-            )
-            
-            # Add to batch collection
-            from helpers.json_output import create_json_response
-            json_response = create_json_response(
-                image_path.name, response_text, model_id, 
-                input_tokens, output_tokens, image_url=image_url
+            group_results = _transcribe_group(
+                [(progress, image_path) for _, image_path, _, progress in group],
+                prompt_path, output_dir, date_folder, model_id, {}, limiter, retry_policy, prompt_caching,
+                [image_url for _, _, image_url, _ in group]
             )
-            all_transcriptions.append(json_response)
-            
-            print(f"JSON saved to: {json_filepath}")
-            
-        except Exception as e:
-            print(f"Error processing {image_path.name}: {str(e)}")
-            # Create error JSON response
-            error_response = {
-                "error": str(e),
-                "image_name": image_path.name,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
-            }
-            all_transcriptions.append(error_response)
+            # Handed on from the worker thread, since the main thread may be
+            # waiting on the next download; the lock keeps on_result calls one at a time
+            with results_lock:
+                for (index, _, _, _), result in zip(group, group_results):
+                    results[index] = result
+                    if on_result is not None:
+                        on_result(index - 1, result)
+                    for copy in waiting_copies.pop(index, []):
+                        add_copy(*copy, result)
+        finally:
+            queued.release()
+    
+    depth = prefetch_depth or 2 * max_workers * images_per_request
+    prefetcher = nullcontext()
+    preprocess_workers = preprocess_workers_for(total, preprocess_workers)
+    if preprocess_workers:
+        print(f"Preparing images in {preprocess_workers} worker process(es) as they arrive, up to {depth} ahead")
+        prefetcher = ImagePrefetcher([], model_id, workers=preprocess_workers, depth=depth)
+    
+    with prefetcher, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        group = []
+        
+        def send():
+            queued.acquire()
+            executor.submit(transcribe, list(group))
+            group.clear()
+        
+        for index, image_path, image_url in items:
+            image_path = Path(image_path)
+            progress = f"{index}/{total}" if total else str(index)
+            if image_path.name in skip_images:
+                skipped_count += 1
+                print(f"Skipping {progress}: {image_path.name} (already processed)")
+                continue
+            original = None
+            if finder is not None:
+                try:
+                    original = finder.add(index, image_path)
+                except Exception as e:
+                    print(f"Warning: Could not check {image_path.name} for duplicates: {e}")
+            if original is not None:
+                with results_lock:
+                    if original in results:
+                        add_copy(index, image_path, image_url, results[original])
+                    else:
+                        waiting_copies.setdefault(original, []).append((index, image_path, image_url))
+                continue
+            submitted_count += 1
+            retry_policy.budget.resize_for(submitted_count)
+            if isinstance(prefetcher, ImagePrefetcher):
+                prefetcher.add(image_path)
+            group.append((index, image_path, image_url, progress))
+            if len(group) == images_per_request:
+                send()
+        if group:
+            send()
+    
+    if finder is not None and finder.duplicate_count:
+        print(f"\nFound {finder.duplicate_count} duplicate image(s); each was copied from the image it duplicates, "
+              f"saving {finder.duplicate_count} Bedrock call(s)")
+        cost_tracker.track_duplicates(finder.duplicate_count)
+    if limiter.throttle_count:
+        print(f"\n{limiter.summary()}")
+    if retry_policy.retry_count or retry_policy.failure_count:
+        print(retry_policy.summary())
+    
+    _finish_first_shot([results[index] for index in sorted(results)], output_dir, date_folder, skipped_count)
+
+def _finish_first_shot(results, output_dir, date_folder, skipped_count):
+    # Store all transcriptions for batch file
+    all_transcriptions = [result for result in results if result is not None]
     
     # Create batch JSON file
     if all_transcriptions:
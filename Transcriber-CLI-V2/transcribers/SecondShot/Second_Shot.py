@@ -1,15 +1,21 @@
-import boto3
-from PIL import Image
-import io
 import os
 import re
 import json
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 from datetime import datetime
+from helpers.bedrock_client import get_bedrock_client
 from helpers.cost_analysis import cost_tracker
-from helpers.json_output import save_json_transcription, create_batch_json_file, create_json_response
+from helpers.json_output import save_json_transcription, create_batch_json_file, create_json_response, \
+    create_duplicate_response, save_json_response
+from helpers.response_cache import response_cache
+from helpers.throttling import AdaptiveConcurrencyLimiter, limited_call
+from helpers.retry import RetryPolicy, RetryFailure
+from helpers.image_prep import prepare_image, estimate_image_tokens, get_image_format, prepared_image_cache
 
+# Sampling temperature for verification
+TEMPERATURE = 0.15
 
 AVAILABLE_MODELS = [
     "us.anthropic.claude-3-sonnet-20240229-v1:0",
@@ -45,23 +51,6 @@ def select_model():
         except ValueError:
             print("Please enter a valid number")
 
-def standardize_image(image_bytes):
-    img = Image.open(io.BytesIO(image_bytes))
-    target_size = (1120, 1120)
-    
-    if img.size != target_size:
-        img = img.resize(target_size, Image.Resampling.LANCZOS)
-    
-    img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format="PNG")
-    return img_byte_arr.getvalue()
-
-def convert_to_png(image_path):
-    img = Image.open(image_path)
-    png_bytes = io.BytesIO()
-    img.save(png_bytes, format="PNG")
-    return png_bytes.getvalue()
-
 def _clean_response_text(response_text):
     #Bad way of doing this but this is how it goes sometimes
     prefixes_to_remove = [
@@ -88,12 +77,18 @@ def _clean_response_text(response_text):
     
     # return response_text
 
-def process_image(image_path, prompt_path, model_id):
-    bedrock_runtime = boto3.client("bedrock-runtime")
+def process_image(image_path, prompt_path, model_id, return_usage=False):
+    """Verify one image with Bedrock
     
-    # Convert and standardize image
-    image = convert_to_png(image_path)
-    image = standardize_image(image)
+    With return_usage, returns (response_text, usage) where usage holds the
+    estimated image tokens for the size the image was sent at.
+    """
+    bedrock_runtime = get_bedrock_client()
+    
+    # Decode, size for the model and encode the image in one pass
+    image_format = get_image_format()
+    image, image_size = prepare_image(image_path, model_id, return_size=True, image_format=image_format)
+    image_tokens = estimate_image_tokens(model_id, *image_size)
     
     # Read prompt
     with open(prompt_path, "r", encoding="utf-8") as f:
@@ -103,48 +98,208 @@ def process_image(image_path, prompt_path, model_id):
     messages = [{
         "role": "user",
         "content": [
-            {"image": {"format": "png", "source": {"bytes": image}}},
+            {"image": {"format": image_format, "source": {"bytes": image}}},
             {"text": user_message},
         ],
     }]
     
-    # Call Bedrock
-    response = bedrock_runtime.converse(
-        modelId=model_id,
-        messages=messages,
-        #I like to think creatively
-        inferenceConfig={"temperature": 0.15}
-    )
-    
-    response_text = response["output"]["message"]["content"][0]["text"]
-    
-    # Track cost
-    input_tokens = cost_tracker.estimate_tokens(user_message)
-    output_tokens = cost_tracker.estimate_tokens(response_text, is_output=True)
-    cost_tracker.track_request(model_id, input_tokens, output_tokens)
+    # Reuse an identical earlier response if one is cached (only when sampled
+    # verifications are cached, see ResponseCache.cache_sampled)
+    use_cache = response_cache.used_for(TEMPERATURE)
+    cache_key = response_cache.make_key(image, user_message, model_id, TEMPERATURE)
+    cached = response_cache.get(cache_key) if use_cache else None
+    if cached is not None:
+        response_text = cached["text"]
+        print(f"Using cached response for {Path(image_path).name}")
+        cost_tracker.track_cache_hit(
+            model_id,
+            cost_tracker.estimate_tokens(user_message) + image_tokens,
+            cost_tracker.estimate_tokens(response_text, is_output=True)
+        )
+    else:
+        # Call Bedrock
+        response = limited_call(
+            bedrock_runtime.converse,
+            modelId=model_id,
+            messages=messages,
+            #I like to think creatively
+            inferenceConfig={"temperature": TEMPERATURE}
+        )
+        
+        response_text = response["output"]["message"]["content"][0]["text"]
+        
+        # Track cost
+        input_tokens = cost_tracker.estimate_tokens(user_message)
+        output_tokens = cost_tracker.estimate_tokens(response_text, is_output=True)
+        cost_tracker.track_request(model_id, input_tokens, output_tokens, image_tokens=image_tokens)
+        
+        if use_cache:
+            cost_tracker.track_cache_miss()
+            response_cache.put(cache_key, {"model_id": model_id, "text": response_text})
     
     response_text = _clean_response_text(response_text)
     print(response_text)
+    if return_usage:
+        return response_text, {"estimated_image_tokens": image_tokens}
     return response_text
 
-def verify_first_shot(base_folder, first_shot_json_path, output_dir, run_name, model_id=None, skip_images=None):
-    """Verify and correct first shot transcription results
+def _verify_transcription(transcription, base_folder, output_dir, run_name, model_id, url_map, progress, limiter, retry_policy):
+    """Verify a single first shot transcription and save its JSON file
     
-    Args:
-        base_folder: Path to the base folder containing images
-        first_shot_json_path: Path to the first shot batch JSON file
-        output_dir: Output directory for second shot results
-        run_name: Name of the run
-        model_id: Model ID to use for verification
-        skip_images: Set of image names to skip (for resuming runs)
+    Returns the JSON response for the batch file, an error record when the
+    first shot failed or verification raised, or None if the image file could
+    not be found. Safe to call from worker threads; the limiter decides when the
+    Bedrock call may start and the retry policy retries transient errors.
     """
-    if skip_images is None:
-        skip_images = set()
+    image_name = transcription['image_name']
+
+    # Prioritize URL from first shot, fall back to URL map if not available
+    # Handle segmented image names by removing '_segmentation' suffix when looking up URLs
+    image_name_for_url_lookup = image_name
+    if '_segmentation' in image_name_for_url_lookup:
+        image_name_for_url_lookup = image_name_for_url_lookup.replace('_segmentation', '')
+    
+    image_url = transcription.get('image_url') or url_map.get(image_name_for_url_lookup)
+    if image_url:
+        print(f"Found URL for {image_name}: {image_url}")
+    elif url_map:
+        print(f"No URL found for {image_name} (looking for {image_name_for_url_lookup})")
     
-    if model_id is None:
-        model_id = select_model()
+    # Check if this transcription has an error
+    if 'error' in transcription:
+        print(f"\n{'='*50}")
+        print(f"Skipping transcription {progress}: {image_name}")
+        print(f"First shot error: {transcription['error']}")
+        
+        # Add error to second shot results
+        error_response = {
+            "error": f"First shot failed: {transcription['error']}",
+            "image_name": image_name,
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        }
+        return error_response
+    
+    # Extract successful transcription text
+    if 'content' not in transcription or not transcription['content']:
+        print(f"\n{'='*50}")
+        print(f"Skipping transcription {progress}: {image_name}")
+        print("No content found in first shot transcription")
+        
+        error_response = {
+            "error": "No content found in first shot transcription",
+            "image_name": image_name,
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        }
+        return error_response
+        
+    first_shot_text = transcription['content'][0]['text']
+    
+    print(f"\n{'='*50}")
+    print(f"Verifying transcription {progress}: {image_name}")
+    
+    # Find image file
+    image_path = None
+    for ext in ['.png', '.jpg', '.jpeg']:
+        possible_paths = list(Path(base_folder).glob(f"**/*{image_name}"))
+        if possible_paths:
+            image_path = possible_paths[0]
+            break
     
-    # Load URL mapping if it exists (for downloaded images)
+    if not image_path:
+        print(f"Error: Could not find image file for {image_name}. Skipping.")
+        return None
+    
+    try:
+        # Ensure first_shot_text is properly encoded and sanitized
+        if isinstance(first_shot_text, bytes):
+            first_shot_text = first_shot_text.decode('utf-8', errors='replace')
+        
+        # Sanitize the text to remove any problematic characters
+        import unicodedata
+        first_shot_text = unicodedata.normalize('NFKD', first_shot_text)
+        
+        # Replace any remaining problematic characters
+        first_shot_text = first_shot_text.encode('utf-8', errors='replace').decode('utf-8')
+        
+        # Create verification prompt
+        verification_prompt = f"""You are an expert Botanist and Geographer with a Ph.D.-level understanding, acting as a verifier reviewing a herbarium label transcription.
+
+Please verify the following transcription against the image and correct any errors:
+
+{first_shot_text}
+
+                Return the corrected transcription in the same format. If the transcription is accurate, return it unchanged.
+                If you find information that is not entered or can be applied to new fields such as first and second political unit and Municipality. 
+                If you find that one of the fields for location is in an incorrect field please move it to the correct field. 
+                If There is a lower level location such as municipality, but no country. Please work your way up and insert all higher level locations.
+                Correct any mispelled locations of all ranges. Use georefrenced knowledge.
+                The Locality field contains a lot of clues as to detailed locations
+                Please enter the information
+                Do not Create any new Fields, The fields set are as standard and dont need to be expanded upon
+                Do not say anything else, please just return the corrected transcription"""
+        
+        # Create temporary prompt file with explicit UTF-8 encoding
+        temp_prompt_path = None
+        try:
+            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt', encoding='utf-8') as temp_prompt:
+                temp_prompt.write(verification_prompt)
+                temp_prompt_path = temp_prompt.name
+            
+            (response_text, usage), request_stats = retry_policy.call(
+                process_image, image_path, temp_prompt_path, model_id, return_usage=True, limiter=limiter
+            )
+            
+            # Calculate tokens
+            input_tokens = cost_tracker.estimate_tokens(verification_prompt)
+            output_tokens = cost_tracker.estimate_tokens(response_text, is_output=True)
+            
+            # Save individual JSON, keep original image_url if any
+            json_filepath = save_json_transcription(
+                output_dir, run_name, "second_shot_verification", 
+                image_name, response_text, model_id, 
+                input_tokens, output_tokens, image_url=image_url, request_stats=request_stats, **usage
+            )
+            
+            # Create response for batch, include image_url
+            json_response = create_json_response(
+                image_name, response_text, model_id, 
+                input_tokens, output_tokens, image_url=image_url, request_stats=request_stats, **usage
+            )
+            
+            print(f"Verification JSON saved to: {json_filepath}")
+            return json_response
+            
+        finally:
+            # Clean up temporary file
+            if temp_prompt_path and os.path.exists(temp_prompt_path):
+                try:
+                    os.unlink(temp_prompt_path)
+                except (OSError, PermissionError) as cleanup_error:
+                    print(f"Warning: Could not delete temporary file {temp_prompt_path}: {cleanup_error}")
+            
+    except UnicodeDecodeError as e:
+        print(f"Unicode decode error verifying {image_name}: {str(e)}")
+        print(f"Error details: {e.encoding} codec can't decode byte {hex(e.object[e.start])} at position {e.start}")
+        error_response = {
+            "error": f"Unicode decode error: {str(e)}",
+            "image_name": image_name,
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        }
+        return error_response
+    except Exception as e:
+        print(f"Error verifying {image_name}: {str(e)}")
+        error_response = {
+            "error": str(e),
+            "image_name": image_name,
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        }
+        if isinstance(e, RetryFailure):
+            error_response["request"] = {"attempts": e.attempts, "total_seconds": e.total_seconds}
+        return error_response
+
+
+def _load_url_map(base_folder):
+    """Load the URL mapping written by the downloader, if there is one"""
     url_map = {}
     # Try multiple locations for url_map.json
     url_map_locations = [
@@ -169,178 +324,175 @@ def verify_first_shot(base_folder, first_shot_json_path, output_dir, run_name, m
             url_map = {}
     else:
         print("No URL mapping file found (images may be local)")
+    return url_map
+
+class VerificationPipeline:
+    """Verify first shot transcriptions as they are submitted
     
-    # Load first shot data
-    with open(first_shot_json_path, 'r', encoding='utf-8') as f:
-        first_shot_data = json.load(f)
+    Each submitted transcription is handed straight to a worker, so verification
+    can overlap with a first shot that is still running. finish() waits for the
+    outstanding work and writes the batch file in slot order, which matches the
+    order of the first shot batch file.
     
-    transcriptions = first_shot_data['transcriptions']
-    print(f"\nVerifying {len(transcriptions)} first shot transcriptions")
+    First shot results copied from a duplicate image (duplicate_of) are not
+    verified again; they get a copy of that image's verification in finish().
+    """
     
-    all_transcriptions = []
-    skipped_count = 0
-    for i, transcription in enumerate(transcriptions, 1):
-        image_name = transcription['image_name']
+    def __init__(self, base_folder, output_dir, run_name, model_id=None, skip_images=None, max_workers=1):
+        """
+        Args:
+            base_folder: Path to the base folder containing images
+            output_dir: Output directory for second shot results
+            run_name: Name of the run
+            model_id: Model ID to use for verification
+            skip_images: Set of image names to skip (for resuming runs)
+            max_workers: Maximum number of Bedrock calls in flight at once
+        """
+        if model_id is None:
+            model_id = select_model()
         
-        # Skip if already processed (for resume functionality)
-        if image_name in skip_images:
-            skipped_count += 1
-            print(f"\nSkipping {i}/{len(transcriptions)}: {image_name} (already processed)")
-            continue
-        # Prioritize URL from first shot, fall back to URL map if not available
-        # Handle segmented image names by removing '_segmentation' suffix when looking up URLs
-        image_name_for_url_lookup = image_name
-        if '_segmentation' in image_name_for_url_lookup:
-            image_name_for_url_lookup = image_name_for_url_lookup.replace('_segmentation', '')
+        self.base_folder = base_folder
+        self.output_dir = output_dir
+        self.run_name = run_name
+        self.model_id = model_id
+        self.skip_images = skip_images if skip_images is not None else set()
+        self.max_workers = max(1, int(max_workers or 1))
+        self.skipped_count = 0
         
-        image_url = transcription.get('image_url') or url_map.get(image_name_for_url_lookup)
-        if image_url:
-            print(f"Found URL for {image_name}: {image_url}")
-        elif url_map:
-            print(f"No URL found for {image_name} (looking for {image_name_for_url_lookup})")
+        # Load URL mapping if it exists (for downloaded images)
+        self.url_map = _load_url_map(base_folder)
         
-        # Check if this transcription has an error
-        if 'error' in transcription:
-            print(f"\n{'='*50}")
-            print(f"Skipping transcription {i}/{len(transcriptions)}: {image_name}")
-            print(f"First shot error: {transcription['error']}")
-            
-            # Add error to second shot results
-            error_response = {
-                "error": f"First shot failed: {transcription['error']}",
-                "image_name": image_name,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
-            }
-            all_transcriptions.append(error_response)
-            continue
+        if response_cache.used_for(TEMPERATURE):
+            print(f"Reusing cached verification responses: images verified before get the same "
+                  f"temperature {TEMPERATURE} sample again")
         
-        # Extract successful transcription text
-        if 'content' not in transcription or not transcription['content']:
-            print(f"\n{'='*50}")
-            print(f"Skipping transcription {i}/{len(transcriptions)}: {image_name}")
-            print("No content found in first shot transcription")
-            
-            error_response = {
-                "error": "No content found in first shot transcription",
-                "image_name": image_name,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
-            }
-            all_transcriptions.append(error_response)
-            continue
-            
-        first_shot_text = transcription['content'][0]['text']
+        # Adapts the number of in-flight calls when Bedrock throttles
+        self.limiter = AdaptiveConcurrencyLimiter(self.max_workers)
+        # Retries transient errors; the run budget grows as images are submitted
+        self.retry_policy = RetryPolicy.for_run()
+        self._submitted_count = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._futures = {}
+        self._copies = {}
+        self._copied = {}
+    
+    def submit(self, slot, transcription, progress=None):
+        """Queue one first shot transcription for verification
         
-        print(f"\n{'='*50}")
-        print(f"Verifying transcription {i}/{len(transcriptions)}: {image_name}")
+        Args:
+            slot: Position of the transcription in the first shot batch
+            transcription: First shot JSON response (or error record)
+            progress: Optional progress label such as "3/120"
+        """
+        image_name = transcription['image_name']
+        progress = progress or str(slot + 1)
         
-        # Find image file
-        image_path = None
-        for ext in ['.png', '.jpg', '.jpeg']:
-            possible_paths = list(Path(base_folder).glob(f"**/*{image_name}"))
-            if possible_paths:
-                image_path = possible_paths[0]
-                break
+        # Skip if already processed (for resume functionality)
+        if image_name in self.skip_images:
+            self.skipped_count += 1
+            print(f"\nSkipping {progress}: {image_name} (already processed)")
+            return
         
-        if not image_path:
-            print(f"Error: Could not find image file for {image_name}. Skipping.")
-            continue
+        if transcription.get('duplicate_of'):
+            self._copies[slot] = (transcription, progress)
+            return
         
-        try:
-            # Ensure first_shot_text is properly encoded and sanitized
-            if isinstance(first_shot_text, bytes):
-                first_shot_text = first_shot_text.decode('utf-8', errors='replace')
-            
-            # Sanitize the text to remove any problematic characters
-            import unicodedata
-            first_shot_text = unicodedata.normalize('NFKD', first_shot_text)
-            
-            # Replace any remaining problematic characters
-            first_shot_text = first_shot_text.encode('utf-8', errors='replace').decode('utf-8')
-            
-            # Create verification prompt
-            verification_prompt = f"""You are an expert Botanist and Geographer with a Ph.D.-level understanding, acting as a verifier reviewing a herbarium label transcription.
-
-Please verify the following transcription against the image and correct any errors:
-
-{first_shot_text}
+        self._submit(slot, transcription, progress)
+    
+    def _submit(self, slot, transcription, progress):
+        self._submitted_count += 1
+        self.retry_policy.budget.resize_for(self._submitted_count)
+        self._futures[slot] = self._executor.submit(
+            _verify_transcription, transcription, self.base_folder, self.output_dir,
+            self.run_name, self.model_id, self.url_map, progress, self.limiter, self.retry_policy
+        )
+    
+    def _add_copies(self):
+        # Copy each duplicate's verification from the image it duplicates. If that
+        # image was not verified in this run (e.g. a resumed run), verify the copy itself.
+        wait(list(self._futures.values()))
+        verified = {}
+        for future in self._futures.values():
+            result = future.result()
+            if result is not None:
+                verified[result['image_name']] = result
+        copied = 0
+        for slot, (transcription, progress) in sorted(self._copies.items()):
+            original = verified.get(transcription['duplicate_of'])
+            if original is None:
+                self._submit(slot, transcription, progress)
+                continue
+            image_name = transcription['image_name']
+            duplicate = create_duplicate_response(original, image_name, transcription.get('image_url'))
+            if 'error' not in duplicate:
+                json_filepath = save_json_response(self.output_dir, image_name, duplicate)
+                print(f"{image_name} duplicates {original['image_name']}, verification JSON saved to: {json_filepath}")
+            self._copied[slot] = duplicate
+            copied += 1
+        if copied:
+            cost_tracker.track_duplicates(copied)
+    
+    def finish(self):
+        """Wait for all verifications and write the batch file
+        
+        Returns:
+            List of second shot JSON responses in first shot order
+        """
+        self._add_copies()
+        self._executor.shutdown(wait=True)
+        # Results are slotted by position so the batch file keeps first shot order
+        results_by_slot = dict(self._copied)
+        results_by_slot.update((slot, future.result()) for slot, future in self._futures.items())
+        results = [results_by_slot[slot] for slot in sorted(results_by_slot)]
+        all_transcriptions = [result for result in results if result is not None]
+        
+        if self.limiter.throttle_count:
+            print(f"\n{self.limiter.summary()}")
+        if self.retry_policy.retry_count or self.retry_policy.failure_count:
+            print(self.retry_policy.summary())
+        if prepared_image_cache.hits:
+            print(prepared_image_cache.summary())
 
-                Return the corrected transcription in the same format. If the transcription is accurate, return it unchanged.
-                If you find information that is not entered or can be applied to new fields such as first and second political unit and Municipality. 
-                If you find that one of the fields for location is in an incorrect field please move it to the correct field. 
-                If There is a lower level location such as municipality, but no country. Please work your way up and insert all higher level locations.
-                Correct any mispelled locations of all ranges. Use georefrenced knowledge.
-                The Locality field contains a lot of clues as to detailed locations
-                Please enter the information
-                Do not Create any new Fields, The fields set are as standard and dont need to be expanded upon
-                Do not say anything else, please just return the corrected transcription"""
-            
-            # Create temporary prompt file with explicit UTF-8 encoding
-            temp_prompt_path = None
-            try:
-                with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt', encoding='utf-8') as temp_prompt:
-                    temp_prompt.write(verification_prompt)
-                    temp_prompt_path = temp_prompt.name
-                
-                response_text = process_image(image_path, temp_prompt_path, model_id)
-                
-                # Calculate tokens
-                input_tokens = cost_tracker.estimate_tokens(verification_prompt)
-                output_tokens = cost_tracker.estimate_tokens(response_text, is_output=True)
-                
-                # Save individual JSON, keep original image_url if any
-                json_filepath = save_json_transcription(
-                    output_dir, run_name, "second_shot_verification", 
-                    image_name, response_text, model_id, 
-                    input_tokens, output_tokens, image_url=image_url
-                )
-                
-                # Create response for batch, include image_url
-                json_response = create_json_response(
-                    image_name, response_text, model_id, 
-                    input_tokens, output_tokens, image_url=image_url
-                )
-                
-                print(f"Verification JSON saved to: {json_filepath}")
-                all_transcriptions.append(json_response)
-                
-            finally:
-                # Clean up temporary file
-                if temp_prompt_path and os.path.exists(temp_prompt_path):
-                    try:
-                        os.unlink(temp_prompt_path)
-                    except (OSError, PermissionError) as cleanup_error:
-                        print(f"Warning: Could not delete temporary file {temp_prompt_path}: {cleanup_error}")
-                
-        except UnicodeDecodeError as e:
-            print(f"Unicode decode error verifying {image_name}: {str(e)}")
-            print(f"Error details: {e.encoding} codec can't decode byte {hex(e.object[e.start])} at position {e.start}")
-            error_response = {
-                "error": f"Unicode decode error: {str(e)}",
-                "image_name": image_name,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
-            }
-            all_transcriptions.append(error_response)
-        except Exception as e:
-            print(f"Error verifying {image_name}: {str(e)}")
-            error_response = {
-                "error": str(e),
-                "image_name": image_name,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
-            }
-            all_transcriptions.append(error_response)
+        # Create batch file
+        if all_transcriptions:
+            batch_filepath = create_batch_json_file(self.output_dir, self.run_name, "second_shot_verification", all_transcriptions)
+            print(f"\nBatch verification JSON file created: {batch_filepath}")
+        
+        if self.skipped_count > 0:
+            print(f"\nSkipped {self.skipped_count} already processed images")
+        print(f"Second Shot verification completed! JSON files saved to {self.output_dir}")
+        return all_transcriptions
 
-    # Create batch file
-    if all_transcriptions:
-        batch_filepath = create_batch_json_file(output_dir, run_name, "second_shot_verification", all_transcriptions)
-        print(f"\nBatch verification JSON file created: {batch_filepath}")
+def verify_first_shot(base_folder, first_shot_json_path, output_dir, run_name, model_id=None, skip_images=None, max_workers=1):
+    """Verify and correct first shot transcription results
+    
+    Args:
+        base_folder: Path to the base folder containing images
+        first_shot_json_path: Path to the first shot batch JSON file
+        output_dir: Output directory for second shot results
+        run_name: Name of the run
+        model_id: Model ID to use for verification
+        skip_images: Set of image names to skip (for resuming runs)
+        max_workers: Maximum number of Bedrock calls in flight at once
+    """
+    pipeline = VerificationPipeline(base_folder, output_dir, run_name, model_id,
+                                    skip_images=skip_images, max_workers=max_workers)
     
-    if skipped_count > 0:
-        print(f"\nSkipped {skipped_count} already processed images")
-    print(f"Second Shot verification completed! JSON files saved to {output_dir}")
-    return all_transcriptions
+    # Load first shot data
+    with open(first_shot_json_path, 'r', encoding='utf-8') as f:
+        first_shot_data = json.load(f)
+    
+    transcriptions = first_shot_data['transcriptions']
+    print(f"\nVerifying {len(transcriptions)} first shot transcriptions")
+    if pipeline.max_workers > 1 and len(transcriptions) > 1:
+        print(f"Running up to {pipeline.max_workers} verifications concurrently")
+    
+    for i, transcription in enumerate(transcriptions, 1):
+        pipeline.submit(i - 1, transcription, f"{i}/{len(transcriptions)}")
+    return pipeline.finish()
 
 # Backward compatibility alias
-def process_with_first_shot(base_folder, prompt_path, first_shot_json_path, output_dir, run_name, model_id=None):
+def process_with_first_shot(base_folder, prompt_path, first_shot_json_path, output_dir, run_name, model_id=None, skip_images=None, max_workers=1):
     """Backward compatibility wrapper for verify_first_shot
     
     Args:
@@ -350,8 +502,11 @@ def process_with_first_shot(base_folder, prompt_path, first_shot_json_path, outp
         output_dir: Output directory for second shot results
         run_name: Name of the run
         model_id: Model ID to use for verification
+        skip_images: Set of image names to skip (for resuming runs)
+        max_workers: Maximum number of Bedrock calls in flight at once
     """
-    return verify_first_shot(base_folder, first_shot_json_path, output_dir, run_name, model_id)
+    return verify_first_shot(base_folder, first_shot_json_path, output_dir, run_name, model_id,
+                             skip_images=skip_images, max_workers=max_workers)
 
 if __name__ == "__main__":
     print("Taking Another Look...")
\ No newline at end of file